@@ -0,0 +1,204 @@
+import asyncio
+import json
+import time
+from google.genai import errors, types
+
+MODEL_NAME = "gemini-2.0-flash-001"
+
+# Rough characters-per-token ratio used where no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+class GeminiBackend:
+    """
+    Sends model calls to the Gemini API through a (shared) genai client.
+    """
+    def __init__(self, client=None, api_key=None, model=MODEL_NAME):
+        if client is None:
+            from google import genai
+            client = genai.Client(api_key=api_key)
+        self.client = client
+        self.model = model
+
+    async def generate(self, contents, config=None):
+        return await self.client.aio.models.generate_content(
+            model=self.model, contents=contents, config=config
+        )
+
+    async def stream(self, contents, config=None):
+        return await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        )
+
+    async def count_tokens(self, contents):
+        response = await self.client.aio.models.count_tokens(model=self.model, contents=contents)
+        return response.total_tokens
+
+    async def create_cache(self, contents, config, ttl_seconds):
+        """
+        Stores contents plus config's system instruction and tools as cached
+        content and returns its name, for use as config.cached_content.
+        """
+        cached_content = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                contents=contents or None,
+                system_instruction=config.system_instruction,
+                tools=config.tools,
+                tool_config=config.tool_config,
+                ttl=f"{int(ttl_seconds)}s",
+            ),
+        )
+        return cached_content.name
+
+    async def refresh_cache(self, name, ttl_seconds):
+        await self.client.aio.caches.update(
+            name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_seconds)}s")
+        )
+
+    async def delete_cache(self, name):
+        await self.client.aio.caches.delete(name=name)
+
+
+def estimate_tokens(contents):
+    return max(1, len(json.dumps([content.model_dump(mode="json", exclude_none=True) for content in contents])) // CHARS_PER_TOKEN)
+
+def estimate_config_tokens(config):
+    """
+    Estimates the tokens taken by a request's system instruction and tools.
+    """
+    if config is None:
+        return 0
+    dumped = [
+        item.model_dump(mode="json", exclude_none=True) if hasattr(item, "model_dump") else item
+        for item in [config.system_instruction, *(config.tools or [])] if item is not None
+    ]
+    return len(json.dumps(dumped)) // CHARS_PER_TOKEN
+
+
+class ScriptedBackend:
+    """
+    Offline stand-in for a model that answers from a script of canned turns,
+    for load testing the agent loop without network access or API quota.
+
+    Each turn is a dict with optional "text" and "function_calls" (a list of
+    {"name": ..., "args": {...}}). The turn to play is picked from the number
+    of model turns already in the conversation, so one backend can serve
+    many concurrent sessions. `latency` is waited before the first chunk and
+    `chunk_latency` between chunks.
+
+    It also stands in for the context-caching API: caches it creates hold
+    their contents and prefix token count until their TTL runs out, requests
+    naming an unknown or expired cache fail with a 404 like the real API,
+    and usage metadata reports cached tokens separately.
+    """
+    def __init__(self, script, latency=0.0, chunk_latency=0.0, chunk_size=16, model="scripted"):
+        self.script = script
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = chunk_size
+        self.model = model
+        self.calls = 0
+        # cache name -> {"contents", "tokens", "expires"}
+        self.caches = {}
+
+    @classmethod
+    def from_file(cls, script_path, **kwargs):
+        with open(script_path, "r") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _turn(self, contents):
+        index = sum(1 for content in contents if content.role == "model")
+        if index >= len(self.script):
+            raise LookupError(f"Scripted backend has no turn {index + 1} (script has {len(self.script)})")
+        return self.script[index]
+
+    def _cached(self, config):
+        """
+        Returns (cached contents, cached token count) for config's cache.
+        """
+        if config is None or not config.cached_content:
+            return [], 0
+        cache = self.caches.get(config.cached_content)
+        if cache is None or cache["expires"] <= time.time():
+            raise errors.ClientError(404, {"error": {
+                "code": 404,
+                "message": f"CachedContent not found: {config.cached_content}",
+                "status": "NOT_FOUND",
+            }})
+        return cache["contents"], cache["tokens"]
+
+    async def create_cache(self, contents, config, ttl_seconds):
+        name = f"cachedContents/scripted-{len(self.caches) + 1}"
+        self.caches[name] = {
+            "contents": list(contents),
+            "tokens": (estimate_tokens(contents) if contents else 0) + estimate_config_tokens(config),
+            "expires": time.time() + ttl_seconds,
+        }
+        return name
+
+    async def refresh_cache(self, name, ttl_seconds):
+        self._cached(types.GenerateContentConfig(cached_content=name))
+        self.caches[name]["expires"] = time.time() + ttl_seconds
+
+    async def delete_cache(self, name):
+        self.caches.pop(name, None)
+
+    def _chunks(self, turn, contents, config=None):
+        text = turn.get("text") or ""
+        chunks = [
+            [types.Part(text=text[start:start + self.chunk_size])]
+            for start in range(0, len(text), self.chunk_size)
+        ]
+        for function_call in turn.get("function_calls") or []:
+            chunks.append([types.Part.from_function_call(
+                name=function_call["name"], args=function_call.get("args") or {},
+            )])
+
+        _, cached_tokens = self._cached(config)
+        if config is not None and config.cached_content:
+            prompt_tokens = estimate_tokens(contents) + cached_tokens
+        else:
+            prompt_tokens = estimate_tokens(contents) + estimate_config_tokens(config)
+        response_tokens = max(1, (len(text) + len(json.dumps(turn.get("function_calls") or []))) // CHARS_PER_TOKEN)
+        responses = []
+        for parts in chunks or [[types.Part(text="")]]:
+            responses.append(types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            ))
+        responses[-1].usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens,
+        )
+        return responses
+
+    async def generate(self, contents, config=None):
+        self.calls += 1
+        responses = self._chunks(self._turn(contents), contents, config)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parts = [part for response in responses for part in response.candidates[0].content.parts]
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            usage_metadata=responses[-1].usage_metadata,
+        )
+
+    async def stream(self, contents, config=None):
+        self.calls += 1
+
+        # Like the SDK's stream, errors (e.g. an expired cache) surface when
+        # the first chunk is awaited, not when the stream is opened
+        async def iterate():
+            responses = self._chunks(self._turn(contents), contents, config)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            for index, response in enumerate(responses):
+                if index and self.chunk_latency:
+                    await asyncio.sleep(self.chunk_latency)
+                yield response
+        return iterate()
+
+    async def count_tokens(self, contents):
+        return estimate_tokens(contents)
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from engine import run_session
+from scheduler import RequestScheduler
+from config import WORKING_DIRECTORY
+
+
+def load_prompts(batch_path):
+    """
+    Reads a JSONL file where each line is either a JSON string or an object
+    with a "prompt" key and an optional "id".
+    """
+    prompts = []
+    with open(batch_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if "prompt" not in entry:
+                raise ValueError(f'line {line_number} of "{batch_path}" has no "prompt"')
+            prompts.append({"id": str(entry.get("id", line_number)), "prompt": entry["prompt"]})
+    return prompts
+
+def prepare_working_directory(workdir_root, session_id):
+    """
+    Copies the sandbox into a fresh directory for one session so concurrent
+    sessions cannot see or clobber each other's writes. The directory is
+    named after the session id, reduced to safe characters, plus a unique
+    suffix, so duplicate ids, reruns into the same root and ids like
+    "../x" all get their own directory inside workdir_root.
+    """
+    safe_id = re.sub(r"[^A-Za-z0-9_-]+", "_", session_id)[:64] or "session"
+    session_directory = tempfile.mkdtemp(prefix=f"{safe_id}-", dir=workdir_root)
+    shutil.copytree(
+        WORKING_DIRECTORY,
+        session_directory,
+        ignore=shutil.ignore_patterns("__pycache__"),
+        dirs_exist_ok=True,
+    )
+    return session_directory
+
+async def run_batch(
+    backend,
+    batch_path,
+    output_path,
+    concurrency=4,
+    scheduler=None,
+    workdir_root=None,
+    verbose=False,
+    tracer=None,
+):
+    """
+    Runs every prompt in batch_path on the shared backend and appends one JSON
+    result line to output_path as each session finishes. All sessions share
+    scheduler, so its rate limits apply to the batch as a whole.
+    Returns the number of sessions that produced a final response.
+    """
+    prompts = load_prompts(batch_path)
+    if workdir_root is None:
+        workdir_root = tempfile.mkdtemp(prefix="ai-agent-batch-")
+    os.makedirs(workdir_root, exist_ok=True)
+
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    slots = asyncio.Semaphore(concurrency)
+    succeeded = 0
+
+    with open(output_path, "w") as output:
+        async def run(entry):
+            nonlocal succeeded
+            async with slots:
+                log = io.StringIO()
+                started = time.perf_counter()
+                working_directory = None
+                error = None
+                try:
+                    # Copying the tree blocks; keep it off the loop the other sessions run on
+                    working_directory = await asyncio.to_thread(prepare_working_directory, workdir_root, entry["id"])
+                    response = await run_session(
+                        backend,
+                        entry["prompt"],
+                        verbose=verbose,
+                        out=log,
+                        working_directory=working_directory,
+                        scheduler=scheduler,
+                        tracer=tracer,
+                    )
+                except Exception as e:
+                    # One session failing to set up or run must not abort the batch
+                    response = None
+                    error = f"{type(e).__name__}: {e}"
+                result = {
+                    "id": entry["id"],
+                    "prompt": entry["prompt"],
+                    "response": response,
+                    "output": log.getvalue(),
+                    "working_directory": working_directory,
+                    "elapsed_seconds": round(time.perf_counter() - started, 3),
+                }
+                if error is not None:
+                    result["error"] = error
+            if response is not None:
+                succeeded += 1
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+
+        await asyncio.gather(*(run(entry) for entry in prompts))
+
+    return succeeded
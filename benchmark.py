@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from config import (
+    BENCHMARK_BASELINE,
+    BENCHMARK_REGRESSION_THRESHOLD,
+    BENCHMARK_REPEAT,
+    BENCHMARK_TIME_BUDGET,
+)
+from functions.get_files_info import get_files_info
+from functions.get_file_content import get_file_content, _line_indexes
+from functions.search_files import search_files, TrigramIndex, _indexes, _indexes_lock
+from functions.write_file import write_file
+from functions.apply_patch import apply_patch
+from functions.run_python_file import run_python_file, _run_subprocess
+from functions.tree_index import tree_index
+from functions.tool_cache import tool_cache
+from backends import ScriptedBackend
+from engine import run_session
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+# Tree sizes (number of files) and single-file sizes each preset covers
+PRESETS = {
+    "quick": {"tree_files": [10, 1000], "file_bytes": [KB, MB]},
+    "full": {"tree_files": [10, 1000, 10000, 100000], "file_bytes": [KB, MB, 100 * MB, GB]},
+}
+
+FILES_PER_DIRECTORY = 100
+
+SOURCE_TEMPLATE = (
+    "def function_{index}(value):\n"
+    "    total = value * {index}\n"
+    "    return total + len('row {index}')\n\n"
+)
+
+
+def _label(n_bytes):
+    for unit, size in (("GB", GB), ("MB", MB), ("KB", KB)):
+        if n_bytes >= size:
+            return f"{n_bytes // size}{unit}"
+    return f"{n_bytes}B"
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def make_tree(root, n_files):
+    """
+    Creates n_files small Python files under root, FILES_PER_DIRECTORY to a
+    directory, nested so no level holds more than FILES_PER_DIRECTORY
+    entries. One file contains the search needle.
+    """
+    for index in range(n_files):
+        directory_index = index // FILES_PER_DIRECTORY
+        parts = []
+        while True:
+            parts.append(f"d{directory_index % FILES_PER_DIRECTORY}")
+            directory_index //= FILES_PER_DIRECTORY
+            if directory_index == 0:
+                break
+        directory = os.path.join(root, *reversed(parts))
+        os.makedirs(directory, exist_ok=True)
+        body = SOURCE_TEMPLATE.format(index=index)
+        if index == n_files // 2:
+            body += "NEEDLE_MARKER = True\n"
+        with open(os.path.join(directory, f"module_{index}.py"), "w") as f:
+            f.write(body)
+    return root
+
+def make_file(path, n_bytes):
+    """
+    Writes a file of n_bytes made of numbered lines, in 1 MB blocks so large
+    files do not need to fit in memory.
+    """
+    block = "".join(f"line {index:09d} of the synthetic benchmark file\n" for index in range(MB // 48))
+    block = block.encode("utf-8")
+    with open(path, "wb") as f:
+        remaining = n_bytes
+        while remaining > 0:
+            chunk = block[:remaining]
+            f.write(chunk)
+            remaining -= len(chunk)
+    return path
+
+def _count_lines(path):
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(MB), b""):
+            count += block.count(b"\n")
+    return count
+
+def _search_index_directory(root):
+    # Beside the tree rather than in it, so the index does not index itself
+    return os.path.abspath(root) + ".search_index"
+
+def _reset_search_index(root):
+    """
+    Registers an empty index for root that saves under the temporary
+    directory, not the default SEARCH_INDEX_DIRECTORY under the CWD.
+    """
+    index_directory = _search_index_directory(root)
+    shutil.rmtree(index_directory, ignore_errors=True)
+    with _indexes_lock:
+        _indexes[os.path.abspath(root)] = TrigramIndex(root, index_directory)
+
+
+class Case:
+    """
+    One benchmark: fn is timed, setup (if any) runs untimed before each call.
+    """
+    def __init__(self, name, fn, setup=None):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+
+
+def measure(case, repeat=BENCHMARK_REPEAT, time_budget=BENCHMARK_TIME_BUDGET):
+    """
+    Runs a case once to warm up, then up to repeat timed runs (at least
+    three, and no more once time_budget seconds have passed), then once more
+    under tracemalloc for the peak Python allocation.
+    """
+    if case.setup:
+        case.setup()
+    case.fn()
+
+    durations = []
+    deadline = time.perf_counter() + time_budget
+    while len(durations) < repeat and (len(durations) < 3 or time.perf_counter() < deadline):
+        if case.setup:
+            case.setup()
+        started = time.perf_counter()
+        case.fn()
+        durations.append((time.perf_counter() - started) * 1000)
+
+    if case.setup:
+        case.setup()
+    tracemalloc.start()
+    try:
+        case.fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": len(durations),
+        "p50_ms": round(_percentile(durations, 0.5), 3),
+        "p95_ms": round(_percentile(durations, 0.95), 3),
+        "mean_ms": round(sum(durations) / len(durations), 3),
+        "peak_kb": round(peak / KB, 1),
+    }
+
+def tree_cases(root, n_files):
+    label = f"{n_files}_files"
+    _reset_search_index(root)
+
+    def cold_listing():
+        tree_index.invalidate(root)
+
+    yield Case(f"get_files_info/{label}/top", lambda: get_files_info(root))
+    yield Case(
+        f"get_files_info/{label}/recursive_cold",
+        lambda: get_files_info(root, recursive=True),
+        setup=cold_listing,
+    )
+    yield Case(f"get_files_info/{label}/recursive_warm", lambda: get_files_info(root, recursive=True))
+    yield Case(
+        f"search_files/{label}/cold",
+        lambda: search_files(root, "NEEDLE_MARKER"),
+        setup=lambda: _reset_search_index(root),
+    )
+    yield Case(f"search_files/{label}/warm", lambda: search_files(root, "NEEDLE_MARKER"))
+    yield Case(f"search_files/{label}/regex", lambda: search_files(root, r"def function_1\d+", is_regex=True))
+
+def file_cases(root, n_bytes):
+    label = _label(n_bytes)
+    file_name = f"data_{label}.txt"
+    path = make_file(os.path.join(root, file_name), n_bytes)
+    middle_line = max(1, _count_lines(path) // 2)
+
+    yield Case(f"get_file_content/{label}/head", lambda: get_file_content(root, file_name))
+    yield Case(
+        f"get_file_content/{label}/lines_cold",
+        lambda: get_file_content(root, file_name, start_line=middle_line, end_line=middle_line + 50),
+        setup=_line_indexes.clear,
+    )
+    yield Case(
+        f"get_file_content/{label}/lines_warm",
+        lambda: get_file_content(root, file_name, start_line=middle_line, end_line=middle_line + 50),
+    )
+    yield Case(
+        f"get_file_content/{label}/offset",
+        lambda: get_file_content(root, file_name, offset=n_bytes // 2, length=4 * KB),
+    )
+
+def edit_cases(root):
+    source = "".join(SOURCE_TEMPLATE.format(index=index) for index in range(40))
+
+    def reset():
+        with open(os.path.join(root, "edit.py"), "w") as f:
+            f.write(source)
+
+    yield Case("write_file/4KB", lambda: write_file(root, "written.py", source))
+    yield Case(
+        "apply_patch/edits",
+        lambda: apply_patch(root, "edit.py", edits=[
+            {"search": "def function_20(value):", "replace": "def function_20(value, scale=1):"},
+            {"search": "row 39", "replace": "row thirty-nine"},
+        ]),
+        setup=reset,
+    )
+
+def run_cases(root):
+    with open(os.path.join(root, "hello.py"), "w") as f:
+        f.write("print('hello')\n")
+    script = os.path.join(root, "hello.py")
+
+    yield Case("run_python_file/pool", lambda: run_python_file(root, "hello.py"))
+    yield Case(
+        "run_python_file/subprocess",
+        lambda: _run_subprocess([sys.executable, script], root, 30, None),
+    )
+
+def session_cases(root):
+    _reset_search_index(root)
+    script = [
+        {"text": "Looking. ", "function_calls": [
+            {"name": "get_files_info", "args": {"directory": ".", "recursive": True, "limit": 50}},
+            {"name": "search_files", "args": {"query": "NEEDLE_MARKER"}},
+        ]},
+        {"function_calls": [{"name": "get_file_content", "args": {"file_path": "hello.py"}}]},
+        {"function_calls": [{"name": "run_python_file", "args": {"file_path": "hello.py"}}]},
+        {"text": "The tree has a marker and hello.py prints hello."},
+    ]
+
+    def session():
+        backend = ScriptedBackend(script)
+        return asyncio.run(run_session(backend, "explore", out=None, working_directory=root))
+
+    def cold_caches():
+        tool_cache.clear()
+        tree_index.invalidate(root)
+        _reset_search_index(root)
+
+    yield Case("session/scripted_4_turns", session)
+    yield Case("session/scripted_4_turns_cold", session, setup=cold_caches)
+
+def run_benchmarks(preset="quick", repeat=BENCHMARK_REPEAT, time_budget=BENCHMARK_TIME_BUDGET, only=None, report=print):
+    """
+    Builds the synthetic trees for a preset in a temporary directory, runs
+    every case whose name contains `only` (all if None) and returns
+    {case name: measurement}.
+    """
+    settings = PRESETS[preset]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ai-agent-bench-") as tmp:
+        groups = []
+        for n_files in settings["tree_files"]:
+            groups.append(lambda n_files=n_files: tree_cases(make_tree(os.path.join(tmp, f"tree_{n_files}"), n_files), n_files))
+        files_root = os.path.join(tmp, "files")
+        os.makedirs(files_root)
+        for n_bytes in settings["file_bytes"]:
+            groups.append(lambda n_bytes=n_bytes: file_cases(files_root, n_bytes))
+        work_root = make_tree(os.path.join(tmp, "work"), 10)
+        groups.append(lambda: edit_cases(work_root))
+        groups.append(lambda: run_cases(work_root))
+        groups.append(lambda: session_cases(work_root))
+
+        for group in groups:
+            for case in group():
+                if only and only not in case.name:
+                    continue
+                results[case.name] = measure(case, repeat, time_budget)
+                if report:
+                    report(format_row(case.name, results[case.name]))
+    return results
+
+def memory_high_water():
+    """
+    Peak resident set size of this process and of its waited-for children,
+    in KB (Linux reports ru_maxrss in KB, macOS in bytes).
+    """
+    scale = KB if sys.platform == "darwin" else 1
+    return {
+        "self_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        "children_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    }
+
+def compare(results, baseline, threshold=BENCHMARK_REGRESSION_THRESHOLD):
+    """
+    Returns {case name: p50 / baseline p50} for cases present in both, and
+    the names whose ratio exceeds threshold.
+    """
+    ratios = {}
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and previous["p50_ms"] > 0:
+            ratios[name] = result["p50_ms"] / previous["p50_ms"]
+    regressions = sorted(name for name, ratio in ratios.items() if ratio > threshold)
+    return ratios, regressions
+
+def format_row(name, result, ratio=None):
+    row = (
+        f"{name:<45}{result['runs']:>6}{result['p50_ms']:>11.2f}{result['p95_ms']:>11.2f}"
+        f"{result['peak_kb']:>12.1f}"
+    )
+    if ratio is not None:
+        row += f"{ratio:>9.2f}x"
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the agent tools and sessions.')
+    parser.add_argument(
+        '--preset',
+        choices=sorted(PRESETS),
+        default='quick',
+        help='quick: trees of up to 1000 files and files up to 1 MB; full: up to 100k files and 1 GB.'
+    )
+    parser.add_argument('--only', help='Only run cases whose name contains this string.')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help='Timed runs per case.')
+    parser.add_argument('--time-budget', type=float, default=BENCHMARK_TIME_BUDGET, help='Seconds after which a case stops repeating.')
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE, help=f'Baseline results to compare against (default: {BENCHMARK_BASELINE}).')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--output', help='Also write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    print(f"{'Case':<45}{'Runs':>6}{'P50 ms':>11}{'P95 ms':>11}{'Peak KB':>12}")
+    results = run_benchmarks(args.preset, args.repeat, args.time_budget, args.only)
+    report = {
+        "preset": args.preset,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "memory_high_water": memory_high_water(),
+        "results": results,
+    }
+    print(f"Memory high-water mark: {report['memory_high_water']['self_kb']} KB "
+          f"(children {report['memory_high_water']['children_kb']} KB)")
+
+    exit_code = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        ratios, regressions = compare(results, baseline)
+        print(f"\nCompared with {args.baseline} (p50 now / p50 baseline):")
+        for name in sorted(ratios):
+            print(format_row(name, results[name], ratios[name]) + ("  REGRESSED" if name in regressions else ""))
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than {BENCHMARK_REGRESSION_THRESHOLD}x the baseline")
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,87 @@
+import os
 import sys
 from pkg.calculator import Calculator
 from pkg.render import format_json_output
+from pkg.stream import STREAM_BATCH_SIZE, evaluate_stream
+
+
+def stream(calculator, args):
+    path = None
+    batch_size = STREAM_BATCH_SIZE
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--batch-size" and args:
+            try:
+                batch_size = int(args.pop(0))
+            except ValueError:
+                print("Error: --batch-size must be an integer.")
+                return
+        elif path is None:
+            path = arg
+        else:
+            print(f"Error: unexpected argument: {arg}")
+            return
+
+    if path is None or path == "-":
+        evaluate_stream(calculator, sys.stdin, sys.stdout, batch_size)
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            evaluate_stream(calculator, f, sys.stdout, batch_size)
+    except OSError as e:
+        print(f"Error: {e}")
+
+
+def serve(args):
+    from pkg.server import serve as serve_forever
+
+    if not args:
+        print("Error: --serve needs a socket path or host:port.")
+        return
+    workers = 1
+    if len(args) == 3 and args[1] == "--workers" and args[2].isdigit():
+        workers = int(args[2])
+    elif len(args) != 1:
+        print(f"Error: unexpected argument: {args[1]}")
+        return
+    serve_forever(args[0], workers)
+
+
+def make_calculator():
+    """
+    A client of the server named by CALCULATOR_SERVER, if one is running,
+    otherwise a local Calculator.
+    """
+    address = os.environ.get("CALCULATOR_SERVER")
+    if address:
+        from pkg.client import CalculatorClient
+
+        try:
+            return CalculatorClient(address)
+        except OSError:
+            pass
+    return Calculator()
 
 
 def main():
-    calculator = Calculator()
     if len(sys.argv) <= 1:
         print("Calculator App")
         print('Usage: python main.py "<expression>"')
+        print("       python main.py --stream [file] [--batch-size N]")
+        print("       python main.py --serve <socket path | host:port> [--workers N]")
         print('Example: python main.py "3 + 5"')
         return
 
+    if sys.argv[1] == "--serve":
+        serve(sys.argv[2:])
+        return
+
+    calculator = make_calculator()
+    if sys.argv[1] == "--stream":
+        stream(calculator, sys.argv[2:])
+        return
+
     expression = " ".join(sys.argv[1:])
     try:
         result = calculator.evaluate(expression)
@@ -1,5 +1,96 @@
+import keyword
+from collections import OrderedDict
+
+# Compiled programs kept per Calculator, least recently used dropped first
+PROGRAM_CACHE_SIZE = 1024
+
+# Operators compiled to the Python operator itself, with Python's precedence
+# for them; any other entry in Calculator.operators is compiled to a call
+PYTHON_OPERATORS = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+# Precedence of a literal or call in generated source: never parenthesized
+ATOM = float("inf")
+
+# NumPy is optional and imported by the first batch evaluation, so single
+# expressions do not pay for loading it
+_numpy = False
+
+
+def load_numpy():
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy as _numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+class Program:
+    """
+    A compiled expression: the infix tokens turned into a Python function of
+    its variables once, so evaluating it again needs no tokenizing or
+    parsing. Expressions too deeply nested for Python's compiler run from
+    the postfix form instead (literals, variable names and operator
+    functions in evaluation order).
+    """
+    __slots__ = ("expression", "source", "names", "code", "function", "postfix")
+
+    def __init__(self, expression, source, constants, names, postfix):
+        self.expression = expression
+        self.source = source
+        self.names = names
+        self.postfix = postfix
+        self.function = None
+        try:
+            self.code = compile(f"lambda {', '.join(names)}: {source}", "<expression>", "eval")
+        except (RecursionError, SyntaxError, MemoryError):
+            self.code = None
+        if self.code is not None:
+            namespace = {"__builtins__": {}}
+            namespace.update(constants)
+            self.function = eval(self.code, namespace)
+
+    def __call__(self, variables=None):
+        """
+        Evaluates the expression with variables mapping each name to a
+        number (or anything supporting the operators, e.g. an array).
+        """
+        if self.function is None:
+            return self._run_postfix(variables)
+        if not self.names:
+            return self.function()
+        return self.function(*self._values(variables))
+
+    def _values(self, variables):
+        values = []
+        for name in self.names:
+            try:
+                values.append(variables[name])
+            except (KeyError, TypeError):
+                raise ValueError(f"missing value for variable: {name}")
+        return values
+
+    def _run_postfix(self, variables):
+        values = dict(zip(self.names, self._values(variables)))
+        stack = []
+        for item in self.postfix:
+            if callable(item):
+                b = stack.pop()
+                a = stack.pop()
+                stack.append(item(a, b))
+            elif isinstance(item, str):
+                stack.append(values[item])
+            else:
+                stack.append(item)
+        return stack[0]
+
+    def __repr__(self):
+        return f"Program({self.expression!r})"
+
+
 class Calculator:
-    def __init__(self):
+    def __init__(self, cache_size=PROGRAM_CACHE_SIZE):
         self.operators = {
             "+": lambda a, b: a + b,
             "-": lambda a, b: a - b,
@@ -12,16 +103,97 @@ class Calculator:
             "*": 2,
             "/": 2,
         }
+        self.cache_size = cache_size
+        self.programs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-    def evaluate(self, expression):
+    def evaluate(self, expression, variables=None):
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
+        return self.compile(expression)(variables)
+
+    def evaluate_batch(self, expression, columns):
+        """
+        Evaluates expression once per row of columns, a mapping of variable
+        name to a sequence (or NumPy array) of values. With NumPy installed
+        the compiled program runs once over whole arrays and a float array
+        is returned; without it the rows are evaluated one by one into a
+        list. Division by zero raises ZeroDivisionError either way.
+        """
+        program = self.compile(expression)
+        missing = [name for name in program.names if name not in columns]
+        if missing:
+            raise ValueError(f"missing column for variable: {missing[0]}")
+        lengths = {len(columns[name]) for name in program.names or columns}
+        if len(lengths) > 1:
+            raise ValueError("columns have different lengths")
+        rows = lengths.pop() if lengths else 1
+
+        numpy = load_numpy()
+        if numpy is not None:
+            arrays = {name: numpy.asarray(columns[name], dtype=float) for name in program.names}
+            with numpy.errstate(divide="raise", invalid="ignore"):
+                try:
+                    result = program(arrays)
+                except FloatingPointError:
+                    raise ZeroDivisionError("float division by zero")
+            result = numpy.broadcast_to(numpy.asarray(result, dtype=float), (rows,)).copy()
+            # NaN may come from 0 / 0, which evaluate() raises for; redo
+            # those rows with plain floats so only a zero divisor raises
+            for row in numpy.flatnonzero(numpy.isnan(result)):
+                result[row] = program({name: float(arrays[name][row]) for name in program.names})
+            return result
+
+        if not program.names:
+            return [program()] * rows
+        if program.function is not None:
+            function = program.function
+            return [function(*row) for row in zip(*(columns[name] for name in program.names))]
+        return [
+            program(dict(zip(program.names, row)))
+            for row in zip(*(columns[name] for name in program.names))
+        ]
+
+    def compile(self, expression):
+        """
+        Returns the compiled Program for expression, from the cache if the
+        same tokens were compiled before. Raises ValueError for an empty or
+        malformed expression.
+        """
+        tokens = expression.split()
+        key = " ".join(tokens)
+        program = self.programs.get(key)
+        if program is not None:
+            self.programs.move_to_end(key)
+            self.hits += 1
+            return program
+
+        self.misses += 1
+        if not tokens:
+            raise ValueError("empty expression")
+        program = self._compile_infix(key, tokens)
+        self.programs[key] = program
+        if len(self.programs) > self.cache_size:
+            self.programs.popitem(last=False)
+        return program
 
-    def _evaluate_infix(self, tokens):
+    def _compile_infix(self, expression, tokens):
+        """
+        Shunting-yard over the tokens, building Python source instead of
+        values. Literals become named constants, identifiers become
+        parameters of the compiled function, and operands are
+        parenthesized wherever Python's precedence or left associativity
+        would group them differently (whatever self.precedence says), so
+        the generated code applies the operators in the same order as
+        evaluating the tokens directly.
+        """
         values = []
         operators = []
+        constants = {}
+        names = []
+        postfix = []
+        identifiers = {token for token in tokens if token.isidentifier()}
 
         for token in tokens:
             if token in self.operators:
@@ -30,30 +202,57 @@ class Calculator:
                     and operators[-1] in self.operators
                     and self.precedence[operators[-1]] >= self.precedence[token]
                 ):
-                    self._apply_operator(operators, values)
+                    self._emit_operator(operators, values, constants, identifiers, postfix)
                 operators.append(token)
             else:
                 try:
-                    values.append(float(token))
+                    value = float(token)
                 except ValueError:
-                    raise ValueError(f"invalid token: {token}")
+                    if not token.isidentifier() or keyword.iskeyword(token):
+                        raise ValueError(f"invalid token: {token}")
+                    if token not in names:
+                        names.append(token)
+                    values.append((token, ATOM))
+                    postfix.append(token)
+                    continue
+                name = self._constant_name(constants, identifiers)
+                constants[name] = value
+                values.append((name, ATOM))
+                postfix.append(value)
 
         while operators:
-            self._apply_operator(operators, values)
+            self._emit_operator(operators, values, constants, identifiers, postfix)
 
         if len(values) != 1:
             raise ValueError("invalid expression")
 
-        return values[0]
+        return Program(expression, values[0][0], constants, tuple(names), postfix)
 
-    def _apply_operator(self, operators, values):
-        if not operators:
-            return
+    @staticmethod
+    def _constant_name(constants, identifiers):
+        # Constants are globals of the compiled function; keep them from
+        # being shadowed by a variable of the same name
+        name = f"_{len(constants)}"
+        while name in identifiers:
+            name = "_" + name
+        return name
 
+    def _emit_operator(self, operators, values, constants, identifiers, postfix):
         operator = operators.pop()
         if len(values) < 2:
             raise ValueError(f"not enough operands for operator {operator}")
 
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
\ No newline at end of file
+        postfix.append(self.operators[operator])
+        b, b_precedence = values.pop()
+        a, a_precedence = values.pop()
+        if operator in PYTHON_OPERATORS:
+            precedence = PYTHON_OPERATORS[operator]
+            if a_precedence < precedence:
+                a = f"({a})"
+            if b_precedence <= precedence:
+                b = f"({b})"
+            values.append((f"{a} {operator} {b}", precedence))
+        else:
+            name = self._constant_name(constants, identifiers)
+            constants[name] = self.operators[operator]
+            values.append((f"{name}({a}, {b})", ATOM))
@@ -0,0 +1,89 @@
+import json
+import socket
+from pkg.server import parse_address
+
+# Requests sent ahead of reading their responses; bounded so neither side
+# blocks on a full socket buffer while the other is still writing
+PIPELINE_DEPTH = 256
+
+ERRORS = {error.__name__: error for error in (ValueError, ZeroDivisionError, OverflowError, TypeError)}
+
+
+class CalculatorClient:
+    """
+    Talks to a running calculator server (see pkg.server) with the same
+    evaluate() as Calculator, raising the same exception types, so code
+    using a Calculator can switch to the server by swapping the object.
+    """
+    def __init__(self, address, timeout=None):
+        address = parse_address(address) if isinstance(address, str) else address
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address, timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 0
+
+    def _send(self, request):
+        self.next_id += 1
+        request["id"] = self.next_id
+        self.file.write(json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def _receive(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("calculator server closed the connection")
+        return json.loads(line)
+
+    @staticmethod
+    def _result(response):
+        if "error" in response:
+            return ERRORS.get(response.get("type"), RuntimeError)(response["error"])
+        return response["result"]
+
+    def evaluate(self, expression, variables=None):
+        request = {"expression": expression}
+        if variables is not None:
+            request["variables"] = variables
+        self._send(request)
+        self.file.flush()
+        result = self._result(self._receive())
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def evaluate_many(self, expressions, variables=None):
+        """
+        Evaluates the expressions with pipelined requests, so one round trip
+        is shared by up to PIPELINE_DEPTH of them. Returns the results in
+        order, with the exception in place of each one that failed.
+        """
+        expressions = list(expressions)
+        results = []
+        for start in range(0, len(expressions), PIPELINE_DEPTH):
+            chunk = expressions[start:start + PIPELINE_DEPTH]
+            for expression in chunk:
+                request = {"expression": expression}
+                if variables is not None:
+                    request["variables"] = variables
+                self._send(request)
+            self.file.flush()
+            results.extend(self._result(self._receive()) for _ in chunk)
+        return results
+
+    def stats(self):
+        self._send({"stats": True})
+        self.file.flush()
+        return self._receive()["stats"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,14 +1,27 @@
 import json
 
 
-def format_json_output(expression: str, result: float, indent: int = 2) -> str:
+def _result_to_dump(result: float):
     if isinstance(result, float) and result.is_integer():
-        result_to_dump = int(result)
-    else:
-        result_to_dump = result
+        return int(result)
+    return result
 
+
+def format_json_output(expression: str, result: float, indent: int = 2) -> str:
     output_data = {
         "expression": expression,
-        "result": result_to_dump,
+        "result": _result_to_dump(result),
     }
-    return json.dumps(output_data, indent=indent)
\ No newline at end of file
+    return json.dumps(output_data, indent=indent)
+
+
+def format_json_line(expression: str, result: float = None, line: int = None, error: str = None) -> str:
+    output_data = {}
+    if line is not None:
+        output_data["line"] = line
+    output_data["expression"] = expression
+    if error is not None:
+        output_data["error"] = error
+    else:
+        output_data["result"] = _result_to_dump(result)
+    return json.dumps(output_data, separators=(",", ":"))
\ No newline at end of file
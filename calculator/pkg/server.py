@@ -0,0 +1,242 @@
+"""
+Resident calculator server. Clients connect over a Unix socket or TCP and
+send one JSON request per line; requests may be pipelined and are answered
+in order on the same connection, one JSON line each.
+
+Request:  {"id": ..., "expression": ..., "variables": {...}}
+          {"id": ..., "stats": true}
+Response: {"id": ..., "result": ...}
+          {"id": ..., "error": ..., "type": "ValueError"}
+          {"id": ..., "stats": {...}}
+
+Every worker process keeps one Calculator, so compiled expressions stay warm
+across requests and connections. With more than one worker the listening
+socket is shared by forked processes and the kernel spreads connections
+across them; stats are per worker.
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+import time
+from collections import deque
+from pkg.calculator import Calculator
+
+# Request latencies kept per worker for the percentiles in stats
+LATENCY_SAMPLES = 10000
+
+# Longest request line accepted, e.g. an expression with many variables
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Pending connections the listening socket queues before refusing more
+BACKLOG = 128
+
+STOP_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+
+def parse_address(address):
+    """
+    "host:port" is a TCP address, anything else a Unix socket path.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+def listen(address, backlog=BACKLOG):
+    """
+    Returns a listening socket for address, replacing a stale Unix socket
+    file left behind by a server that did not shut down cleanly.
+    """
+    if isinstance(address, tuple):
+        sock = socket.create_server(address, backlog=backlog)
+    else:
+        try:
+            if stat.S_ISSOCK(os.stat(address).st_mode):
+                os.unlink(address)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(address)
+        sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class CalculatorServer:
+    def __init__(self, calculator=None, latency_samples=LATENCY_SAMPLES):
+        self.calculator = calculator or Calculator()
+        self.latencies = deque(maxlen=latency_samples)
+        self.requests = 0
+        self.errors = 0
+        self.connections = 0
+        self.loop = None
+        self._stopping = None
+
+    def respond(self, line):
+        """
+        Answers one request line with one response line.
+        """
+        start = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            if request.get("stats"):
+                response = {"id": request_id, "stats": self.stats()}
+            else:
+                result = self.calculator.evaluate(request["expression"], request.get("variables"))
+                response = {"id": request_id, "result": result}
+        except Exception as e:
+            response = self._error(request_id, e)
+        self.requests += 1
+        data = json.dumps(response, separators=(",", ":")).encode("utf-8") + b"\n"
+        self.latencies.append(time.perf_counter() - start)
+        return data
+
+    def _error(self, request_id, error):
+        self.errors += 1
+        if isinstance(error, KeyError):
+            error = ValueError(f"missing field: {error.args[0]}")
+        return {"id": request_id, "error": str(error), "type": type(error).__name__}
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    response = self._error(None, ValueError(f"request longer than {MAX_REQUEST_BYTES} bytes"))
+                    writer.write(json.dumps(response, separators=(",", ":")).encode("utf-8") + b"\n")
+                    break
+                if not line:
+                    break
+                writer.write(self.respond(line))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, sock, on_ready=None):
+        """
+        Serves on an already listening socket until stop() is called or the
+        process gets SIGINT or SIGTERM; on_ready() is called once both are
+        handled. SIGINT and SIGTERM may arrive blocked (see serve() below)
+        and are unblocked only then, so an early one stops the server
+        cleanly instead of killing it.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if sock.family == socket.AF_UNIX:
+            server = await asyncio.start_unix_server(self.handle, sock=sock, limit=MAX_REQUEST_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle, sock=sock, limit=MAX_REQUEST_BYTES)
+        try:
+            for signal_number in STOP_SIGNALS:
+                self.loop.add_signal_handler(signal_number, self._stopping.set)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        except (RuntimeError, ValueError):
+            # Not the main thread, e.g. a server started by tests
+            pass
+        if on_ready is not None:
+            on_ready()
+        async with server:
+            await self._stopping.wait()
+
+    def stop(self):
+        """
+        Stops serve(); safe to call from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections": self.connections,
+            "cache_hits": self.calculator.hits,
+            "cache_misses": self.calculator.misses,
+            "latency_us": {
+                "p50": round(percentile(latencies, 0.50) * 1e6, 1),
+                "p95": round(percentile(latencies, 0.95) * 1e6, 1),
+                "p99": round(percentile(latencies, 0.99) * 1e6, 1),
+                "max": round(latencies[-1] * 1e6, 1) if latencies else 0.0,
+            },
+        }
+
+
+def _run_worker(sock):
+    server = CalculatorServer()
+
+    def report(message):
+        # One write per line, so lines from different workers do not interleave
+        sys.stderr.write(f"worker {os.getpid()}: {message}\n")
+        sys.stderr.flush()
+
+    asyncio.run(server.serve(sock, lambda: report("ready")))
+    report(json.dumps(server.stats()))
+
+def serve(address, workers=1):
+    """
+    Listens on address and serves until interrupted, in this process or in
+    workers forked processes sharing the socket. workers=0 uses every core.
+    Each worker prints "worker <pid>: ready" to stderr once it is serving.
+    """
+    address = parse_address(address) if isinstance(address, str) else address
+    workers = workers or os.cpu_count() or 1
+    # Held until every process has its handlers installed: the parent's
+    # below, each worker's in CalculatorServer.serve
+    signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+    children = []
+
+    def forward(signal_number, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    sock = listen(address)
+    try:
+        if workers == 1:
+            _run_worker(sock)
+            return
+
+        signal.signal(signal.SIGINT, forward)
+        signal.signal(signal.SIGTERM, forward)
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    _run_worker(sock)
+                    code = 0
+                finally:
+                    os._exit(code)
+            children.append(pid)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        sock.close()
+        if not isinstance(address, tuple):
+            try:
+                os.unlink(address)
+            except FileNotFoundError:
+                pass
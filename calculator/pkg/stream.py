@@ -0,0 +1,37 @@
+from pkg.render import format_json_line
+
+# Result lines buffered before each write and flush; 1 answers every line
+# as soon as it is read, e.g. when driving the stream interactively
+STREAM_BATCH_SIZE = 100
+
+
+def evaluate_stream(calculator, lines, out, batch_size=STREAM_BATCH_SIZE):
+    """
+    Evaluates one expression per input line with a single calculator, so
+    repeated expressions are compiled once, and writes one compact JSON
+    object per expression: its line number and result, or an error message
+    if it failed. Blank lines are skipped. Returns (evaluated, failed).
+    """
+    batch_size = max(1, batch_size)
+    buffer = []
+    evaluated = failed = 0
+    for line_number, line in enumerate(lines, start=1):
+        expression = line.strip()
+        if not expression:
+            continue
+        try:
+            result = calculator.evaluate(expression)
+        except Exception as e:
+            buffer.append(format_json_line(expression, line=line_number, error=str(e)))
+            failed += 1
+        else:
+            buffer.append(format_json_line(expression, result, line=line_number))
+        evaluated += 1
+        if len(buffer) >= batch_size:
+            out.write("\n".join(buffer) + "\n")
+            out.flush()
+            buffer.clear()
+    if buffer:
+        out.write("\n".join(buffer) + "\n")
+    out.flush()
+    return evaluated, failed
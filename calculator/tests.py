@@ -1,5 +1,20 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from pkg import calculator as calculator_module
 from pkg.calculator import Calculator
+from pkg.client import CalculatorClient
+from pkg.server import CalculatorServer, listen, parse_address
+from pkg.stream import evaluate_stream
 
 
 class TestCalculator(unittest.TestCase):
@@ -42,6 +57,191 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.calculator.evaluate("+ 3")
 
+    def test_compile_reuses_cached_program(self):
+        program = self.calculator.compile("3 * 4 + 5")
+        self.assertEqual(program(), 17)
+        self.assertIs(self.calculator.compile("  3 *  4 + 5 "), program)
+        self.assertEqual((self.calculator.hits, self.calculator.misses), (1, 1))
+
+    def test_compiled_order_matches_left_associativity(self):
+        self.assertEqual(self.calculator.evaluate("10 - 4 - 3"), 3)
+        self.assertEqual(self.calculator.evaluate("8 / 2 / 2"), 2)
+        self.assertEqual(self.calculator.evaluate("10 - 4 * 2 - 1"), 1)
+
+    def test_program_cache_is_bounded(self):
+        calculator = Calculator(cache_size=2)
+        first = calculator.compile("1 + 1")
+        calculator.compile("2 + 2")
+        calculator.compile("1 + 1")
+        calculator.compile("3 + 3")
+        self.assertEqual(list(calculator.programs), ["1 + 1", "3 + 3"])
+        self.assertIs(calculator.compile("1 + 1"), first)
+
+    def test_custom_operator_is_compiled_to_a_call(self):
+        self.calculator.operators["^"] = pow
+        self.calculator.precedence["^"] = 3
+        self.assertEqual(self.calculator.evaluate("2 ^ 3 * 2"), 16)
+
+    def test_compiled_order_follows_changed_precedence(self):
+        self.calculator.precedence["+"] = 3
+        self.assertEqual(self.calculator.evaluate("1 + 2 * 3"), 9)
+        self.assertEqual(self.calculator.evaluate("2 * 3 + 1 * 4"), 32)
+        self.assertEqual(self.calculator.compile("2 * 3 + 1 * 4")._run_postfix(None), 32)
+
+    def test_long_expression_falls_back_to_postfix(self):
+        expression = " + ".join(["1"] * 5000)
+        program = self.calculator.compile(expression)
+        self.assertIsNone(program.code)
+        self.assertEqual(program(), 5000)
+
+    def test_compile_empty_expression(self):
+        with self.assertRaises(ValueError):
+            self.calculator.compile("   ")
+
+    def test_variables(self):
+        program = self.calculator.compile("price * qty - discount")
+        self.assertEqual(program.names, ("price", "qty", "discount"))
+        self.assertEqual(program({"price": 2.5, "qty": 4, "discount": 1}), 9)
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("price * qty")
+
+    def test_variable_named_like_a_constant(self):
+        self.assertEqual(self.calculator.evaluate("_0 + 2 * _0", {"_0": 5}), 15)
+
+    def test_evaluate_batch_without_numpy(self):
+        with mock.patch.object(calculator_module, "load_numpy", lambda: None):
+            result = self.calculator.evaluate_batch("a * b + 1", {"a": [1, 2, 3], "b": [4, 5, 6]})
+            self.assertEqual(result, [5, 11, 19])
+            self.assertEqual(self.calculator.evaluate_batch("2 * 3", {"a": [1, 2]}), [6, 6])
+            with self.assertRaises(ValueError):
+                self.calculator.evaluate_batch("a + b", {"a": [1, 2], "b": [1]})
+            with self.assertRaises(ValueError):
+                self.calculator.evaluate_batch("a + b", {"a": [1, 2]})
+
+    @unittest.skipIf(calculator_module.load_numpy() is None, "NumPy is not installed")
+    def test_evaluate_batch_with_numpy(self):
+        numpy = calculator_module.load_numpy()
+        columns = {"a": numpy.array([1.0, 2.0, 3.0]), "b": [4, 5, 6]}
+        result = self.calculator.evaluate_batch("a * b + 1", columns)
+        self.assertIsInstance(result, numpy.ndarray)
+        self.assertEqual(result.tolist(), [5, 11, 19])
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate_batch("a / b", {"a": [1, 2], "b": [1, 0]})
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate_batch("a / b", {"a": [1, 0], "b": [1, 0]})
+        inf = float("inf")
+        result = self.calculator.evaluate_batch("a - a", {"a": [inf, 2]})
+        self.assertTrue(numpy.isnan(result[0]) and numpy.isnan(self.calculator.evaluate("a - a", {"a": inf})))
+        self.assertEqual(result[1], 0)
+
+    def test_evaluate_batch_long_expression(self):
+        expression = " + ".join(["x"] * 5000)
+        self.assertEqual(list(self.calculator.evaluate_batch(expression, {"x": [1, 2]})), [5000, 10000])
+
+    def test_evaluate_stream(self):
+        out = io.StringIO()
+        lines = ["3 + 5\n", "\n", "1 +\n", "10 / 4\n", "3 + 5\n"]
+        self.assertEqual(evaluate_stream(self.calculator, lines, out), (4, 1))
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], [
+            {"line": 1, "expression": "3 + 5", "result": 8},
+            {"line": 3, "expression": "1 +", "error": "not enough operands for operator +"},
+            {"line": 4, "expression": "10 / 4", "result": 2.5},
+            {"line": 5, "expression": "3 + 5", "result": 8},
+        ])
+        self.assertNotIn(" 8", out.getvalue())
+        self.assertEqual(self.calculator.hits, 1)
+
+    def test_evaluate_stream_flushes_in_batches(self):
+        out = mock.Mock()
+        evaluate_stream(self.calculator, ["1 + 1\n"] * 5, out, batch_size=2)
+        self.assertEqual([call.args[0].count("\n") for call in out.write.call_args_list], [2, 2, 1])
+        self.assertEqual(out.flush.call_count, 3)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.address = os.path.join(self.tmp.name, "calculator.sock")
+        self.server = CalculatorServer()
+        sock = listen(self.address)
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.server.serve(sock)))
+        self.thread.start()
+
+    def tearDown(self):
+        while self.server.loop is None:
+            time.sleep(0.01)
+        self.server.stop()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address("127.0.0.1:7000"), ("127.0.0.1", 7000))
+        self.assertEqual(parse_address("/tmp/calculator.sock"), "/tmp/calculator.sock")
+
+    def test_client_matches_calculator(self):
+        with CalculatorClient(self.address) as client:
+            self.assertEqual(client.evaluate("3 + 5"), 8)
+            self.assertEqual(client.evaluate("a * b", {"a": 2, "b": 4}), 8)
+            self.assertIsNone(client.evaluate("  "))
+            with self.assertRaises(ValueError):
+                client.evaluate("1 +")
+            with self.assertRaises(ZeroDivisionError):
+                client.evaluate("1 / 0")
+
+    def test_pipelined_requests_keep_compiled_state(self):
+        with CalculatorClient(self.address) as client:
+            results = client.evaluate_many(["2 * 3", "1 +", "2 * 3"] * 200)
+            self.assertEqual(results[0], 6)
+            self.assertIsInstance(results[1], ValueError)
+            self.assertEqual(len(results), 600)
+            stats = client.stats()
+        self.assertEqual(stats["requests"], 600)
+        self.assertEqual(stats["errors"], 200)
+        self.assertEqual(stats["cache_hits"], 399)
+        self.assertGreater(stats["latency_us"]["p99"], 0)
+
+    def test_malformed_request(self):
+        with CalculatorClient(self.address) as client:
+            client.file.write(b"[1, 2]\n{\"id\": 3}\n")
+            client.file.flush()
+            self.assertEqual(client._receive()["error"], "request must be a JSON object")
+            self.assertEqual(client._receive(), {"id": 3, "error": "missing field: expression", "type": "ValueError"})
+
+    def test_workers(self):
+        address = os.path.join(self.tmp.name, "workers.sock")
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        process = subprocess.Popen(
+            [sys.executable, main, "--serve", address, "--workers", "2"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        try:
+            ready = [process.stderr.readline() for _ in range(2)]
+            self.assertTrue(all(line.endswith(": ready\n") for line in ready), ready)
+            with CalculatorClient(address, timeout=10) as client:
+                self.assertEqual(client.evaluate("6 * 7"), 42)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            _, stderr = process.communicate(timeout=10)
+        self.assertEqual(stderr.count('"requests"'), 2)
+        self.assertEqual(process.returncode, 0)
+        self.assertFalse(os.path.exists(address))
+
+    def test_early_signal_stops_workers_cleanly(self):
+        address = os.path.join(self.tmp.name, "early.sock")
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        process = subprocess.Popen(
+            [sys.executable, main, "--serve", address, "--workers", "2"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        # As soon as the socket exists: workers may not have their handlers yet
+        deadline = time.monotonic() + 10
+        while not os.path.exists(address) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        process.send_signal(signal.SIGTERM)
+        _, stderr = process.communicate(timeout=10)
+        self.assertEqual(stderr.count('"requests"'), 2, stderr)
+        self.assertFalse(os.path.exists(address))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import time
+from google.genai import types
+from conversation import Conversation
+from functions.write_file import atomic_write
+
+
+def new_session_id():
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + os.urandom(3).hex()
+
+
+class SessionLog:
+    """
+    Append-only checkpoint of one agent session in
+    <directory>/<session_id>/: log.jsonl holds a header line, one line per
+    finished iteration and an end line per run; tool responses are kept out
+    of the log in results/<sha256>.json, so a result repeated across turns
+    is stored once. Replaying the iterations through a fresh Conversation
+    rebuilds the exact messages the session had, elisions and compactions
+    included.
+    """
+    def __init__(self, directory, session_id):
+        self.session_id = session_id
+        self.path = os.path.join(directory, session_id)
+        self.log_path = os.path.join(self.path, "log.jsonl")
+        self.results_path = os.path.join(self.path, "results")
+        self.header = None
+        self.turns = []
+        self.outcome = None
+        self.response = None
+
+    @classmethod
+    def create(cls, directory, user_prompt, working_directory, session_id=None):
+        log = cls(directory, session_id or new_session_id())
+        os.makedirs(log.results_path)
+        log.header = {
+            "type": "session",
+            "session_id": log.session_id,
+            "prompt": user_prompt,
+            "working_directory": os.path.abspath(working_directory),
+            "created": time.time(),
+        }
+        log._append(log.header)
+        return log
+
+    @classmethod
+    def open(cls, directory, session_id):
+        """
+        Loads an existing session. Raises FileNotFoundError if there is none.
+        A torn last line (from a crash while writing it) is cut off so the
+        log can be appended to again.
+        """
+        log = cls(directory, session_id)
+        with open(log.log_path, "r+") as f:
+            data = f.read()
+            if data and not data.endswith("\n"):
+                data = data[:data.rfind("\n") + 1]
+                f.seek(0)
+                f.truncate(len(data.encode("utf-8")))
+        for line_number, line in enumerate(data.splitlines(), start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f'line {line_number} of "{log.log_path}" is corrupt')
+            if record["type"] == "session":
+                log.header = record
+            elif record["type"] == "turn":
+                log.turns.append(record)
+            elif record["type"] == "end":
+                log.outcome = record["outcome"]
+                log.response = record.get("response")
+        return log
+
+    @property
+    def prompt(self):
+        return self.header["prompt"]
+
+    @property
+    def working_directory(self):
+        return self.header["working_directory"]
+
+    @property
+    def completed(self):
+        return self.outcome == "completed"
+
+    def _append(self, record):
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _store_result(self, response):
+        data = json.dumps(response, sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        path = os.path.join(self.results_path, digest + ".json")
+        if not os.path.exists(path):
+            atomic_write(path, data)
+        return digest
+
+    def _load_result(self, digest):
+        with open(os.path.join(self.results_path, digest + ".json"), "r") as f:
+            return json.load(f)
+
+    def _dump_tool_content(self, content):
+        parts = []
+        for part in content.parts or []:
+            response = part.function_response
+            parts.append({
+                "id": response.id,
+                "name": response.name,
+                "response_sha256": self._store_result(response.response or {}),
+            })
+        return parts
+
+    def _load_tool_content(self, parts):
+        return types.Content(role="tool", parts=[
+            types.Part(function_response=types.FunctionResponse(
+                id=part.get("id"), name=part["name"], response=self._load_result(part["response_sha256"]),
+            ))
+            for part in parts
+        ])
+
+    def append_turn(self, model_content, usage_metadata=None, tool_content=None, compacted=False):
+        """
+        Records one finished iteration: whether the conversation was
+        compacted before it, the model turn with its token usage, and the
+        tool responses it led to (None for the final turn).
+        """
+        usage = None
+        if usage_metadata is not None:
+            usage = {
+                "prompt_token_count": usage_metadata.prompt_token_count,
+                "candidates_token_count": usage_metadata.candidates_token_count,
+            }
+        record = {
+            "type": "turn",
+            "compacted": compacted,
+            "model": model_content.model_dump(mode="json", exclude_none=True),
+            "usage": usage,
+            "tool": self._dump_tool_content(tool_content) if tool_content is not None else None,
+        }
+        self._append(record)
+        self.turns.append(record)
+
+    def finish(self, outcome, response=None):
+        self.outcome = outcome
+        self.response = response
+        self._append({"type": "end", "outcome": outcome, "response": response, "finished": time.time()})
+
+    def restore(self, **conversation_kwargs):
+        """
+        Rebuilds the session's Conversation by replaying every iteration.
+        """
+        conversation = Conversation(self.prompt, **conversation_kwargs)
+        for turn in self.turns:
+            if turn["compacted"]:
+                conversation.compact()
+            if turn["usage"] is not None:
+                conversation.record_usage(types.GenerateContentResponseUsageMetadata(**turn["usage"]))
+            model_content = types.Content.model_validate(turn["model"])
+            conversation.add_model_turn(model_content)
+            if turn["tool"] is not None:
+                function_call_parts = [part.function_call for part in model_content.parts or [] if part.function_call]
+                conversation.add_tool_results(function_call_parts, self._load_tool_content(turn["tool"]))
+        return conversation
+
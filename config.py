@@ -1 +1,106 @@
-MAX_CHARS = 10000
\ No newline at end of file
+MAX_CHARS = 10000
+
+# Files whose line offsets are kept for ranged get_file_content reads
+MAX_LINE_INDEXES = 32
+
+# fsync files written by write_file and apply_patch (and their directory)
+# before reporting success
+WRITE_FSYNC = False
+
+# Entries returned per get_files_info call, and directory listings kept in
+# the in-memory tree index
+MAX_LISTING_ENTRIES = 500
+MAX_INDEXED_DIRECTORIES = 10000
+
+# Sandbox every tool call is confined to
+WORKING_DIRECTORY = "./calculator"
+
+# Model calls a session may make before it is stopped (per run, so a
+# resumed session gets this many more)
+MAX_ITERATIONS = 20
+
+# Upper bound on tool calls dispatched concurrently within one model turn
+MAX_TOOL_WORKERS = 4
+
+# Prompt size (as reported by the model) above which old turns are summarized
+CONTEXT_TOKEN_BUDGET = 100000
+
+# Number of most recent messages kept verbatim when compacting a conversation
+KEEP_RECENT_MESSAGES = 6
+
+# Total size of read-only tool results kept in the shared tool cache
+TOOL_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Default location, modes, lifetime and size bound of the on-disk model
+# response cache
+RESPONSE_CACHE_DIRECTORY = ".response_cache"
+RESPONSE_CACHE_MODES = ("cache", "record", "replay")
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Warm interpreters kept for run_python_file, how many scripts each runs
+# before it is replaced, and modules they import up front (0 disables the pool)
+PYTHON_WORKER_POOL_SIZE = 2
+PYTHON_WORKER_MAX_RUNS = 50
+PYTHON_WORKER_PRELOAD = ["json", "math", "re", "unittest", "collections", "itertools"]
+
+# Output of run_python_file kept per stream (first and last half, rest
+# truncated), and total output after which the script is killed
+RUN_OUTPUT_MAX_BYTES = 16 * 1024
+RUN_OUTPUT_KILL_BYTES = 4 * 1024 * 1024
+
+# Resource limits set in every run_python_file child (None leaves a limit as
+# inherited): CPU seconds and address space bytes per run, open files, and
+# processes, which the kernel counts across all of the user's processes (and
+# does not enforce for root)
+RUN_CPU_SECONDS = 30
+RUN_MAX_ADDRESS_SPACE = 2 * 1024 * 1024 * 1024
+RUN_MAX_OPEN_FILES = 256
+RUN_MAX_PROCESSES = 1024
+
+# Append the wall time, CPU time and peak memory of each run to the
+# run_python_file result. Always off while the response cache is in use,
+# since the numbers differ from run to run
+RUN_REPORT_USAGE = True
+
+# Where search_files keeps its trigram indexes, the largest file it indexes,
+# and the default number of matches and lines of context it returns
+SEARCH_INDEX_DIRECTORY = ".search_index"
+SEARCH_MAX_FILE_BYTES = 1024 * 1024
+SEARCH_MAX_RESULTS = 50
+SEARCH_CONTEXT_LINES = 1
+
+# Benchmarks (benchmark.py): where results are compared against, how much
+# slower than the baseline p50 counts as a regression, and how many timed
+# runs each case gets (cases stop early after BENCHMARK_TIME_BUDGET seconds)
+BENCHMARK_BASELINE = "benchmark_baseline.json"
+BENCHMARK_REGRESSION_THRESHOLD = 1.25
+BENCHMARK_REPEAT = 20
+BENCHMARK_TIME_BUDGET = 10
+
+# Retries of failed model calls (throttling, server errors, dropped
+# connections): how many, and the first and largest backoff in seconds
+MODEL_MAX_RETRIES = 5
+MODEL_RETRY_BASE_DELAY = 1.0
+MODEL_RETRY_MAX_DELAY = 60.0
+
+# Where sessions are checkpointed so they can be resumed with --resume
+SESSION_DIRECTORY = ".sessions"
+
+# Explicit prompt caching (--prompt-cache): lifetime of a cache, how close to
+# expiry it gets extended, how long to wait before retrying after creating
+# one failed, the smallest prefix worth caching (the API rejects smaller
+# ones), and the budget of file contents inlined by --pin-snapshot
+PROMPT_CACHE_TTL_SECONDS = 600
+PROMPT_CACHE_REFRESH_SECONDS = 60
+PROMPT_CACHE_RETRY_SECONDS = 300
+PROMPT_CACHE_MIN_TOKENS = 4096
+PROMPT_CACHE_SNAPSHOT_MAX_BYTES = 64 * 1024
+
+# Speculative prefetch (--prefetch): cap on prefetched file contents not yet
+# asked for, the largest file worth prefetching, files queued per tool call,
+# and the kinds of files prefetched after a directory listing
+PREFETCH_MAX_BYTES = 4 * 1024 * 1024
+PREFETCH_MAX_FILE_BYTES = 64 * 1024
+PREFETCH_MAX_FILES = 8
+PREFETCH_EXTENSIONS = (".py", ".md", ".txt", ".json", ".toml", ".cfg", ".ini", ".yaml", ".yml")
\ No newline at end of file
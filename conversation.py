@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+from google.genai import types
+from config import CONTEXT_TOKEN_BUDGET, KEEP_RECENT_MESSAGES
+
+SUMMARY_PREVIEW_CHARS = 200
+
+# Tools whose successful result means a file's earlier contents are stale
+WRITING_FUNCTIONS = ("write_file", "apply_patch")
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+def _call_args(function_call_part):
+    args = dict(function_call_part.args or {})
+    args.pop("working_directory", None)
+    return args
+
+def _preview(text, limit=SUMMARY_PREVIEW_CHARS):
+    text = " ".join(str(text).split())
+    if len(text) > limit:
+        return text[:limit] + "..."
+    return text
+
+
+class Conversation:
+    """
+    Holds the messages of one agent session and keeps them from growing
+    without bound: repeated tool results and file contents made stale by a
+    later write are elided, and once the prompt crosses the token budget the
+    oldest turns are folded into a short summary.
+    """
+    def __init__(self, user_prompt, token_budget=CONTEXT_TOKEN_BUDGET, keep_recent=KEEP_RECENT_MESSAGES):
+        self.messages = [
+            types.Content(role="user", parts=[types.Part(text=user_prompt)]),
+        ]
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.prompt_tokens = None
+        self.total_prompt_tokens = 0
+        self.total_response_tokens = 0
+        self.elided_results = 0
+        self.compactions = 0
+        # One record per tool response part: where it lives and what produced it
+        self._tool_results = []
+
+    def record_usage(self, usage_metadata):
+        if usage_metadata is None:
+            return
+        self.prompt_tokens = usage_metadata.prompt_token_count
+        self.total_prompt_tokens += usage_metadata.prompt_token_count or 0
+        self.total_response_tokens += usage_metadata.candidates_token_count or 0
+
+    def add_model_turn(self, content):
+        self.messages.append(content)
+
+    def add_tool_results(self, function_call_parts, tool_content):
+        """
+        Appends the tool responses for a turn, then elides earlier results
+        they make redundant.
+        """
+        message_index = len(self.messages)
+        self.messages.append(tool_content)
+
+        for part_index, (call, part) in enumerate(zip(function_call_parts, tool_content.parts)):
+            args = _call_args(call)
+            response = part.function_response.response or {}
+            record = {
+                "message_index": message_index,
+                "part_index": part_index,
+                "name": call.name,
+                "file_path": os.path.normpath(args["file_path"]) if "file_path" in args else None,
+                "key": _digest([call.name, args, response]),
+            }
+            wrote = (
+                call.name in WRITING_FUNCTIONS
+                and str(response.get("result", "")).startswith("Successfully")
+            )
+
+            for earlier in self._tool_results:
+                if earlier.get("elided"):
+                    continue
+                if earlier["key"] == record["key"]:
+                    self._elide(earlier, f"[Identical to a later {call.name} result; see below]")
+                elif (
+                    wrote
+                    and earlier["file_path"] == record["file_path"]
+                    and earlier["name"] == "get_file_content"
+                ):
+                    self._elide(
+                        earlier,
+                        f'[Content of "{args["file_path"]}" elided; it was changed by a later {call.name} call]',
+                    )
+
+            if wrote:
+                self._elide_stale_writes(args["file_path"], message_index)
+
+            self._tool_results.append(record)
+
+    def _elide(self, record, note):
+        content = self.messages[record["message_index"]]
+        old = content.parts[record["part_index"]].function_response
+        content.parts[record["part_index"]] = types.Part(
+            function_response=types.FunctionResponse(id=old.id, name=old.name, response={"result": note})
+        )
+        record["elided"] = True
+        self.elided_results += 1
+
+    def _elide_stale_writes(self, file_path, before_index):
+        """
+        Drops the content argument of earlier write_file calls on the same
+        path, which only repeat text a later write or patch has replaced.
+        """
+        target = os.path.normpath(file_path)
+        for content in self.messages[:before_index - 1]:
+            if content.role != "model":
+                continue
+            for index, part in enumerate(content.parts or []):
+                call = part.function_call
+                if not call or call.name != "write_file" or not call.args:
+                    continue
+                if os.path.normpath(call.args.get("file_path", "")) != target:
+                    continue
+                if not isinstance(call.args.get("content"), str) or call.args["content"].startswith("[elided"):
+                    continue
+                args = dict(call.args)
+                args["content"] = f'[elided {len(call.args["content"])} characters; superseded by a later write]'
+                content.parts[index] = types.Part(
+                    function_call=types.FunctionCall(id=call.id, name=call.name, args=args)
+                )
+                self.elided_results += 1
+
+    def over_budget(self):
+        return self.prompt_tokens is not None and self.prompt_tokens > self.token_budget
+
+    def compact(self):
+        """
+        Folds every turn except the original prompt and the most recent ones
+        into a summary appended to the prompt. Returns True if anything was
+        compacted.
+        """
+        cut = len(self.messages) - self.keep_recent
+        # The kept tail must start on a model turn so every tool response
+        # still follows the call that produced it.
+        while cut > 1 and self.messages[cut].role != "model":
+            cut -= 1
+        if cut <= 1:
+            return False
+
+        prompt = self.messages[0]
+        if len(prompt.parts) > 1:
+            # Already compacted once: extend the existing summary
+            lines = [prompt.parts[1].text]
+        else:
+            lines = ["Summary of earlier steps in this session (older turns were compacted):"]
+        for content in self.messages[1:cut]:
+            for part in content.parts or []:
+                if part.function_call:
+                    args = _call_args(part.function_call)
+                    lines.append(f"- called {part.function_call.name}({_preview(json.dumps(args), 120)})")
+                elif part.function_response:
+                    response = part.function_response.response or {}
+                    outcome = response.get("result", response.get("error", ""))
+                    lines.append(f"  -> {_preview(outcome)}")
+                elif part.text and content.role == "model":
+                    lines.append(f"- said: {_preview(part.text)}")
+
+        first = types.Content(role="user", parts=[prompt.parts[0], types.Part(text="\n".join(lines))])
+        self.messages = [first] + self.messages[cut:]
+
+        shift = cut - 1
+        kept = []
+        for record in self._tool_results:
+            if record["message_index"] >= cut:
+                record["message_index"] -= shift
+                kept.append(record)
+        self._tool_results = kept
+        self.prompt_tokens = None
+        self.compactions += 1
+        return True
@@ -0,0 +1,280 @@
+import asyncio
+import sys
+import time
+from google.genai import types
+from functions.registry import get_tool_config
+from functions.call_function import dispatch_function
+from functions.tool_cache import tool_cache
+from conversation import Conversation
+from backends import estimate_tokens
+from scheduler import RequestScheduler
+from tracing import Tracer
+from config import MAX_ITERATIONS, MAX_TOOL_WORKERS, WORKING_DIRECTORY
+
+SYSTEM_PROMPT = """
+    You are a helpful AI coding agent.
+
+    When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
+
+    - List files and directories
+    - Read file contents
+    - Execute Python files with optional arguments
+    - Write or overwrite files
+    - Edit part of a file with a unified diff or search/replace edits
+    - Search file contents for text or a regular expression
+
+    All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
+"""
+
+
+def _merge_text_parts(parts):
+    """
+    Joins the text fragments of a streamed turn back into whole parts so the
+    conversation history does not carry one Part per streamed chunk.
+    """
+    merged = []
+    for part in parts:
+        if part.text is not None and not part.thought and merged and merged[-1].text is not None:
+            merged[-1] = types.Part(text=merged[-1].text + part.text)
+        else:
+            merged.append(part)
+    return merged
+
+def _traced_dispatch(function_call_part, verbose, working_directory, out):
+    """
+    Runs one tool call on a worker thread and returns its result together
+    with whether it was served from the tool cache, which is only known on
+    the thread that made the lookup.
+    """
+    tool_cache.pop_last_hit()
+    result = dispatch_function(function_call_part, verbose, working_directory, out)
+    return result, tool_cache.pop_last_hit()
+
+def _output_bytes(result):
+    size = 0
+    for part in result.parts or []:
+        if part.function_response and part.function_response.response:
+            response = part.function_response.response
+            value = response.get("result", response.get("error", ""))
+            size += len(str(value).encode("utf-8", errors="replace"))
+    return size
+
+async def run_session(
+    backend,
+    user_prompt,
+    verbose=False,
+    out=sys.stdout,
+    working_directory=WORKING_DIRECTORY,
+    scheduler=None,
+    tracer=None,
+    session_log=None,
+    max_iterations=MAX_ITERATIONS,
+):
+    """
+    Runs one agent session, streaming model text to `out` as it arrives and
+    dispatching each function call as soon as its part has been received.
+    Returns the model's final text response, or None if the session failed.
+    Pass out=None to run silently, e.g. when running sessions concurrently.
+    Model calls go through scheduler (a RequestScheduler, shared between
+    sessions to share its rate limits), which retries transient failures;
+    a failed turn is retried from the messages so far, so earlier
+    iterations are not lost. Model calls and tool calls are recorded as spans on tracer;
+    by default they are only kept in memory.
+    If a session_log (checkpoint.SessionLog) is given, every finished
+    iteration is appended to it, and the turns it already holds are replayed
+    first so a stopped session picks up where it left off; each run gets
+    max_iterations more iterations.
+    """
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    if tracer is None:
+        tracer = Tracer()
+    if session_log is not None and session_log.completed:
+        if out is not None:
+            out.write(session_log.response + "\n")
+        return session_log.response
+
+    session_span = tracer.start_session(prompt=user_prompt, working_directory=working_directory)
+    response = None
+    try:
+        response = await _run_session(
+            backend, user_prompt, verbose, out, working_directory, scheduler, session_span,
+            session_log, max_iterations,
+        )
+        return response
+    finally:
+        session_span.end()
+        if session_log is not None:
+            session_log.finish(session_span.attributes.get("outcome", "interrupted"), response)
+
+async def _run_session(
+    backend, user_prompt, verbose, out, working_directory, scheduler, session_span, session_log, max_iterations
+):
+    if session_log is not None:
+        conversation = session_log.restore()
+        session_span.set(resumed_turns=len(session_log.turns))
+    else:
+        conversation = Conversation(user_prompt)
+    config = types.GenerateContentConfig(
+        tools=[get_tool_config()],
+        system_instruction=SYSTEM_PROMPT,
+    )
+    tool_slots = asyncio.Semaphore(MAX_TOOL_WORKERS)
+
+    async def dispatch(function_call_part, iteration_span):
+        async with tool_slots:
+            with iteration_span.child(f"tool:{function_call_part.name}") as span:
+                result, cache_hit = await asyncio.to_thread(
+                    _traced_dispatch, function_call_part, verbose, working_directory, out
+                )
+                span.set(output_bytes=_output_bytes(result), cache_hit=cache_hit)
+            return result
+
+    for iteration in range(max_iterations):
+        iteration_span = session_span.child("iteration", index=iteration)
+        session_span.set(iterations=iteration + 1)
+        try:
+            compacted = conversation.over_budget() and conversation.compact()
+            if compacted:
+                iteration_span.set(compacted=True)
+                if verbose and out is not None:
+                    print(f"Compacted conversation to {len(conversation.messages)} messages", file=out)
+
+            parts = []
+            function_call_parts = []
+            tasks = []
+            # Text of this turn already written to out, kept across retries
+            # so a retried stream only writes what was not shown yet
+            shown = [""]
+
+            def show(text):
+                if text.startswith(shown[0]):
+                    out.write(text[len(shown[0]):])
+                elif shown[0].startswith(text):
+                    return
+                else:
+                    # The retry said something else; it follows the retry notice
+                    out.write(text)
+                out.flush()
+                shown[0] = text
+
+            async def stream_turn():
+                parts.clear()
+                function_call_parts.clear()
+                usage_metadata = None
+                text = ""
+                with iteration_span.child("model_call") as model_span:
+                    started = time.perf_counter()
+                    try:
+                        stream = await backend.stream(conversation.messages, config)
+                        async for chunk in stream:
+                            if chunk.usage_metadata:
+                                usage_metadata = chunk.usage_metadata
+                            if not chunk.candidates or not chunk.candidates[0].content:
+                                continue
+                            for part in chunk.candidates[0].content.parts or []:
+                                if not parts:
+                                    model_span.set(time_to_first_token_ms=(time.perf_counter() - started) * 1000)
+                                parts.append(part)
+                                if part.text and not part.thought and out is not None:
+                                    text += part.text
+                                    show(text)
+                                if part.function_call:
+                                    function_call_parts.append(part.function_call)
+                                    tasks.append(asyncio.create_task(dispatch(part.function_call, iteration_span)))
+                    except Exception as e:
+                        # Tools already started cannot be taken back, so the
+                        # turn cannot simply be asked for again; let them
+                        # finish so none is still running once the session ends
+                        if tasks:
+                            await asyncio.gather(*tasks, return_exceptions=True)
+                            raise RuntimeError(f"Model stream failed after tool calls were dispatched: {e}") from e
+                        raise
+                    if usage_metadata:
+                        model_span.set(
+                            prompt_tokens=usage_metadata.prompt_token_count,
+                            cached_tokens=usage_metadata.cached_content_token_count,
+                            response_tokens=usage_metadata.candidates_token_count,
+                        )
+                    model_span.set(function_calls=len(function_call_parts))
+                return usage_metadata
+
+            def on_retry(error, delay):
+                iteration_span.set(retries=iteration_span.attributes.get("retries", 0) + 1)
+                if out is not None:
+                    print(f"\n[Model call failed ({error}); retrying in {delay:.1f}s]", file=out)
+
+            estimated_tokens = conversation.prompt_tokens or estimate_tokens(conversation.messages)
+            usage_metadata = await scheduler.call(stream_turn, estimated_tokens, on_retry=on_retry)
+            if usage_metadata:
+                scheduler.record_tokens(
+                    estimated_tokens,
+                    (usage_metadata.prompt_token_count or 0) + (usage_metadata.candidates_token_count or 0),
+                )
+
+            conversation.record_usage(usage_metadata)
+            if verbose and usage_metadata and out is not None:
+                print(f"User prompt: {user_prompt}", file=out)
+                print(f"Prompt tokens: {usage_metadata.prompt_token_count}", file=out)
+                if usage_metadata.cached_content_token_count:
+                    print(f"Cached prompt tokens: {usage_metadata.cached_content_token_count}", file=out)
+                print(f"Response tokens: {usage_metadata.candidates_token_count}", file=out)
+
+            parts = _merge_text_parts(parts)
+            model_content = types.Content(role="model", parts=parts)
+            conversation.add_model_turn(model_content)
+
+            # No function calls means the model is done and has a final text response
+            if not tasks:
+                text = "".join(part.text for part in parts if part.text and not part.thought)
+                iteration_span.end()
+                if not text:
+                    session_span.set(outcome="empty_response")
+                    if out is not None:
+                        print("Model returned an empty response. Something is wrong.", file=out)
+                    return None
+                if session_log is not None:
+                    session_log.append_turn(model_content, usage_metadata, None, compacted)
+                session_span.set(outcome="completed")
+                if out is not None:
+                    out.write("\n")
+                return text
+
+            results = await asyncio.gather(*tasks)
+            tool_parts = []
+            for result in results:
+                tool_parts.extend(result.parts)
+            tool_content = types.Content(role="tool", parts=tool_parts)
+            conversation.add_tool_results(function_call_parts, tool_content)
+            if session_log is not None:
+                session_log.append_turn(model_content, usage_metadata, tool_content, compacted)
+            iteration_span.end()
+
+        except Exception as e:
+            iteration_span.set(error=str(e))
+            iteration_span.end()
+            session_span.set(outcome="error")
+            if out is not None:
+                print(f"An error occurred: {e}", file=out)
+            return None
+
+    session_span.set(outcome="max_iterations")
+    if out is not None:
+        print("Maximum iterations reached. The agent might be stuck or the task is complex.", file=out)
+    return None
+
+async def run_sessions(backend, user_prompts, verbose=False, max_concurrency=8, tracer=None, scheduler=None):
+    """
+    Runs independent sessions concurrently on one backend and returns their
+    final responses in the same order as the prompts. The sessions share one
+    scheduler and so one set of rate limits.
+    """
+    slots = asyncio.Semaphore(max_concurrency)
+    if scheduler is None:
+        scheduler = RequestScheduler()
+
+    async def run(user_prompt):
+        async with slots:
+            return await run_session(backend, user_prompt, verbose=verbose, out=None, tracer=tracer, scheduler=scheduler)
+
+    return await asyncio.gather(*(run(user_prompt) for user_prompt in user_prompts))
@@ -0,0 +1,194 @@
+import os
+import re
+from functions.write_file import atomic_write
+from functions.registry import tool
+from functions.schemas import schema_apply_patch
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(Exception):
+    pass
+
+
+def _split_lines(text):
+    """
+    Splits text on "\n" only (str.splitlines also splits on form feeds and
+    other separators that can appear inside a line). Returns the lines
+    without their endings and the ending of each: "\r\n", "\n", or "" for
+    a last line without one.
+    """
+    pieces = text.split("\n")
+    last = pieces.pop()
+    lines = []
+    endings = []
+    for piece in pieces:
+        if piece.endswith("\r"):
+            lines.append(piece[:-1])
+            endings.append("\r\n")
+        else:
+            lines.append(piece)
+            endings.append("\n")
+    if last:
+        lines.append(last)
+        endings.append("")
+    return lines, endings
+
+def _parse_unified_diff(patch):
+    """
+    Returns a list of [old_start, index, old_lines, new_lines, no_newline]
+    hunks, index being where old_lines are expected in the file counting
+    from 0, and no_newline whether the new text ends without a newline
+    according to the "\\ No newline at end of file" markers (None if the
+    hunk has none). File headers and anything before the first hunk are
+    ignored.
+    """
+    hunks = []
+    hunk = None
+    side = None
+    lines = _split_lines(patch.rstrip("\n"))[0]
+    for index, line in enumerate(lines):
+        header = HUNK_HEADER.match(line)
+        if header:
+            old_start = int(header.group(1))
+            # A hunk that removes nothing inserts after its start line
+            position = old_start if header.group(2) == "0" else old_start - 1
+            hunk = [old_start, position, [], [], None]
+            hunks.append(hunk)
+            side = None
+        elif line.startswith("--- ") and index + 1 < len(lines) and lines[index + 1].startswith("+++ "):
+            # File header of a following diff
+            hunk = None
+        elif hunk is None:
+            continue
+        elif line.startswith("\\"):
+            # The marker applies to the line before it: a removed line
+            # says so of the old text only, so the new text has a newline
+            if side == "-":
+                hunk[4] = bool(hunk[4])
+            elif side is not None:
+                hunk[4] = True
+        elif line.startswith("-"):
+            hunk[2].append(line[1:])
+            side = "-"
+        elif line.startswith("+"):
+            hunk[3].append(line[1:])
+            side = "+"
+        elif line.startswith(" ") or not line:
+            # Context line; editors often strip the space off empty ones
+            hunk[2].append(line[1:])
+            hunk[3].append(line[1:])
+            side = " "
+        else:
+            hunk = None
+    if not hunks:
+        raise PatchError("no hunks found; expected a unified diff with @@ headers")
+    return hunks
+
+def _find_hunk(lines, old_lines, expected):
+    """
+    Finds where old_lines occur in lines, preferring the occurrence closest
+    to the expected position. Falls back to ignoring trailing whitespace.
+    """
+    if not old_lines:
+        return min(max(expected, 0), len(lines))
+    for normalize in (lambda line: line, lambda line: line.rstrip()):
+        target = [normalize(line) for line in old_lines]
+        normalized = [normalize(line) for line in lines]
+        positions = [
+            index for index in range(len(lines) - len(target) + 1)
+            if normalized[index:index + len(target)] == target
+        ]
+        if positions:
+            return min(positions, key=lambda index: abs(index - expected))
+    return None
+
+def _apply_unified_diff(content, patch):
+    """
+    Applies the hunks keeping each line's ending: lines a hunk adds get the
+    ending of the first line it replaces, or the file's first ending.
+    """
+    lines, endings = _split_lines(content)
+    default = next((ending for ending in endings if ending), "\n")
+    offset = 0
+    for number, (old_start, expected, old_lines, new_lines, no_newline) in enumerate(_parse_unified_diff(patch), start=1):
+        position = _find_hunk(lines, old_lines, expected + offset)
+        if position is None:
+            raise PatchError(f"hunk {number} (at line {old_start}) does not match the file")
+        end = position + len(old_lines)
+        replaced = endings[position:end]
+        new_endings = [replaced[0] if replaced and replaced[0] else default] * len(new_lines)
+        if new_lines and end == len(lines):
+            if no_newline is None:
+                # No marker: the file keeps ending the way it did
+                no_newline = bool(endings) and endings[-1] == ""
+            if no_newline:
+                new_endings[-1] = ""
+            if not replaced and endings and endings[-1] == "":
+                endings[-1] = default
+        lines[position:end] = new_lines
+        endings[position:end] = new_endings
+        offset = position - expected + len(new_lines) - len(old_lines)
+    return "".join(line + ending for line, ending in zip(lines, endings))
+
+def _apply_edits(content, edits):
+    crlf = "\r\n" in content
+    for number, edit in enumerate(edits, start=1):
+        search = edit.get("search", "")
+        replace = edit.get("replace", "")
+        if crlf and "\r\n" not in search:
+            # Edits written with "\n" still match, and keep, CRLF lines
+            search = search.replace("\n", "\r\n")
+            replace = replace.replace("\n", "\r\n")
+        if not search:
+            raise PatchError(f"edit {number} has an empty search string")
+        count = content.count(search)
+        if count == 0:
+            raise PatchError(f"edit {number}: search text not found")
+        if count > 1:
+            raise PatchError(f"edit {number}: search text found {count} times; include more context to make it unique")
+        content = content.replace(search, replace, 1)
+    return content
+
+@tool(schema_apply_patch, serialized=True, invalidates="path")
+def apply_patch(working_directory, file_path, patch=None, edits=None):
+    full_path = os.path.join(working_directory, file_path)
+    abs_working_directory = os.path.abspath(working_directory)
+    abs_full_path = os.path.abspath(full_path)
+
+    if not abs_full_path.startswith(abs_working_directory):
+        return f'Error: Cannot patch "{file_path}" as it is outside the permitted working directory'
+
+    if not patch and not edits:
+        return 'Error: Provide either a unified diff in "patch" or a list of search/replace "edits".'
+
+    try:
+        if os.path.isfile(abs_full_path):
+            # newline="" keeps CRLF line endings as they are
+            with open(abs_full_path, "r", newline="") as f:
+                content = f.read()
+        elif edits or os.path.exists(abs_full_path):
+            return f'Error: File not found or is not a regular file: "{file_path}"'
+        else:
+            # A diff against an empty file creates it
+            content = ""
+            os.makedirs(os.path.dirname(abs_full_path), exist_ok=True)
+
+        if patch:
+            patched = _apply_unified_diff(content, patch)
+            changes = f"{len(_parse_unified_diff(patch))} hunks applied"
+        else:
+            patched = _apply_edits(content, edits)
+            changes = f"{len(edits)} edits applied"
+
+        atomic_write(abs_full_path, patched)
+        return f'Successfully patched "{file_path}" ({changes}, {len(patched)} characters written)'
+
+    except PatchError as e:
+        return f'Error: Could not patch "{file_path}": {e}. The file was not changed.'
+    except UnicodeDecodeError:
+        return f'Error: Could not patch "{file_path}" as it is not a text file.'
+    except PermissionError:
+        return f'Error: Permission denied to write "{file_path}".'
+    except Exception as e:
+        return f'Error: An unexpected error occurred: {e}'
@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+from google.genai import types
+from functions.registry import get_tool
+from functions.tool_cache import tool_cache
+from functions.tree_index import tree_index
+from config import WORKING_DIRECTORY
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+# The Prefetcher once enable_prefetch() was called; prefetch is only
+# imported then, as it imports get_file_content
+_prefetcher = None
+
+
+def _get_path_lock(working_directory, file_path):
+    key = os.path.abspath(os.path.join(working_directory, file_path))
+    with _path_locks_guard:
+        if key not in _path_locks:
+            _path_locks[key] = threading.Lock()
+        return _path_locks[key]
+
+def enable_prefetch():
+    """
+    Turns on speculative reads after tool calls (see functions.prefetch)
+    and returns the prefetcher.
+    """
+    global _prefetcher
+    from functions.prefetch import prefetcher
+
+    prefetcher.enabled = True
+    _prefetcher = prefetcher
+    return prefetcher
+
+def call_function(function_call_part, verbose=False, working_directory=WORKING_DIRECTORY, out=sys.stdout):
+    """
+    Calls a function based on the model's function call part, announcing
+    the call on `out` (None for silence).
+    """
+    function_name = function_call_part.name
+    # Copy so the injected working directory does not leak into the
+    # conversation history sent back to the model
+    function_args = dict(function_call_part.args or {})
+
+    if out is not None:
+        # One write, so announcements from parallel calls stay on their own lines
+        if verbose:
+            out.write(f"Calling function: {function_name}({function_args})\n")
+        else:
+            out.write(f" - Calling function: {function_name}\n")
+
+    tool = get_tool(function_name)
+    if tool is None:
+        return types.Content(
+            role="tool",
+            parts=[
+                types.Part.from_function_response(
+                    name=function_name,
+                    response={"error": f"Unknown function: {function_name}"},
+                )
+            ],
+        )
+
+    # Inject the working directory for security
+    function_args["working_directory"] = working_directory
+
+    try:
+        if tool.cache_arg:
+            function_result = tool_cache.get_or_call(
+                function_name, function_args, tool.function, tool.cache_arg
+            )
+        else:
+            function_result = tool.function(**function_args)
+
+        if tool.invalidates == "path":
+            tool_cache.invalidate(working_directory, function_args.get("file_path", "."))
+            tree_index.invalidate(os.path.join(working_directory, function_args.get("file_path", ".")))
+        elif tool.invalidates == "all":
+            tool_cache.invalidate(working_directory)
+            tree_index.invalidate(working_directory)
+        if _prefetcher is not None:
+            if tool.invalidates:
+                # What is queued was chosen from the tree before this change
+                _prefetcher.cancel()
+            else:
+                _prefetcher.after_call(function_name, function_args, function_result)
+        return types.Content(
+            role="tool",
+            parts=[
+                types.Part.from_function_response(
+                    name=function_name,
+                    response={"result": function_result},
+                )
+            ],
+        )
+    except Exception as e:
+        return types.Content(
+            role="tool",
+            parts=[
+                types.Part.from_function_response(
+                    name=function_name,
+                    response={"error": f"Error calling function: {e}"},
+                )
+            ],
+        )
+
+def dispatch_function(function_call_part, verbose=False, working_directory=WORKING_DIRECTORY, out=sys.stdout):
+    """
+    Calls a function, holding the per-path lock for tools that must not
+    run concurrently against the same file.
+    """
+    tool = get_tool(function_call_part.name)
+    if tool is not None and tool.serialized:
+        file_path = (function_call_part.args or {}).get("file_path", "")
+        with _get_path_lock(working_directory, file_path):
+            return call_function(function_call_part, verbose, working_directory, out)
+    return call_function(function_call_part, verbose, working_directory, out)
@@ -1,8 +1,110 @@
+import codecs
+import mmap
 import os
-from config import MAX_CHARS
-from google.genai import types
+import threading
+from array import array
+from collections import OrderedDict
+from config import MAX_CHARS, MAX_LINE_INDEXES
+from functions.registry import tool
+from functions.schemas import schema_get_file_content
 
-def get_file_content(working_directory, file_path):
+# Line start offsets of recently read files, keyed on path and stat so an
+# edited file is re-indexed
+_line_indexes = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def _stat_key(abs_full_path):
+    stat = os.stat(abs_full_path)
+    return (abs_full_path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _line_offsets(mapped, key):
+    """
+    Returns the byte offset at which every line of the mapped file starts,
+    building the index on the first request for this version of the file.
+    """
+    with _line_indexes_lock:
+        if key in _line_indexes:
+            _line_indexes.move_to_end(key)
+            return _line_indexes[key]
+
+    offsets = array("q", [0])
+    size = len(mapped)
+    position = mapped.find(b"\n")
+    while position != -1 and position + 1 < size:
+        offsets.append(position + 1)
+        position = mapped.find(b"\n", position + 1)
+
+    with _line_indexes_lock:
+        _line_indexes[key] = offsets
+        while len(_line_indexes) > MAX_LINE_INDEXES:
+            _line_indexes.popitem(last=False)
+    return offsets
+
+def _decode(data):
+    """
+    Decodes UTF-8, tolerating a character cut off at the end of the range.
+    Raises UnicodeDecodeError for anything else that is not valid UTF-8.
+    """
+    return codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+
+def _summary(file_path, abs_full_path):
+    """
+    One-line description of a file that does not fit in a single read.
+    """
+    key = _stat_key(abs_full_path)
+    with open(abs_full_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        line_count = len(_line_offsets(mapped, key))
+        head = mapped[:4096]
+    try:
+        _decode(head)
+        encoding = "utf-8-sig" if head.startswith(codecs.BOM_UTF8) else "utf-8"
+    except UnicodeDecodeError:
+        encoding = "unknown"
+    return (
+        f'[File "{file_path}": {key[2]} bytes, {line_count} lines, encoding {encoding}. '
+        f'Use start_line/end_line or offset/length to read other parts.]'
+    )
+
+def _read_range(file_path, abs_full_path, offset=None, length=None, start_line=None, end_line=None):
+    key = _stat_key(abs_full_path)
+    size = key[2]
+    if size == 0:
+        return f'[File "{file_path}" is empty]'
+
+    with open(abs_full_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if start_line is not None or end_line is not None:
+            offsets = _line_offsets(mapped, key)
+            line_count = len(offsets)
+            first = max(1, int(start_line or 1))
+            if first > line_count:
+                return f'Error: "{file_path}" has only {line_count} lines.'
+            last = min(line_count, int(end_line or line_count))
+            if last < first:
+                return f'Error: end_line {last} is before start_line {first}.'
+            start = offsets[first - 1]
+            end = offsets[last] if last < line_count else size
+            header = f'[Lines {first}-{last} of {line_count} in "{file_path}"]'
+        else:
+            start = min(max(0, int(offset or 0)), size)
+            # Do not start in the middle of a multi-byte character
+            while start < size and mapped[start] & 0xC0 == 0x80:
+                start += 1
+            end = min(size, start + int(length or MAX_CHARS))
+            header = f'[Bytes {start}-{end} of {size} in "{file_path}"]'
+
+        # The range is cut to MAX_CHARS characters below, and no character
+        # takes more than 4 bytes, so never copy or decode more than that
+        limit = start + MAX_CHARS * 4
+        truncated = end > limit
+        content = _decode(mapped[start:min(end, limit)])
+
+    if len(content) > MAX_CHARS or truncated:
+        content = content[:MAX_CHARS] + f'[...Range truncated at {MAX_CHARS} characters]'
+    return header + "\n" + content
+
+@tool(schema_get_file_content, cache_arg="file_path")
+def get_file_content(working_directory, file_path, offset=None, length=None, start_line=None, end_line=None):
     full_path = os.path.join(working_directory, file_path)
 
     abs_working_directory = os.path.abspath(working_directory)
@@ -15,12 +117,19 @@ def get_file_content(working_directory, file_path):
         if not os.path.isfile(abs_full_path):
             return f'Error: File not found or is not a regular file: "{file_path}"'
 
+        if any(value is not None for value in (offset, length, start_line, end_line)):
+            return _read_range(file_path, abs_full_path, offset, length, start_line, end_line)
+
         with open(abs_full_path, "r") as f:
             content = f.read(MAX_CHARS + 1)
 
         if len(content) > MAX_CHARS:
             content = content[:MAX_CHARS]
-            return content + f'[...File "{file_path}" truncated at {MAX_CHARS} characters]'
+            return (
+                content
+                + f'[...File "{file_path}" truncated at {MAX_CHARS} characters]\n'
+                + _summary(file_path, abs_full_path)
+            )
         else:
             return content
 
@@ -30,18 +139,3 @@ def get_file_content(working_directory, file_path):
         return f'Error: Permission denied to read "{file_path}".'
     except Exception as e:
         return f'Error: An unexpected error occurred: {e}'
-    
-schema_get_file_content = types.FunctionDeclaration(
-    name="get_file_content",
-    description="Reads the content of a file up to a maximum number of characters.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The path of the file to read.",
-            ),
-        },
-        required=["file_path"],
-    ),
-)
\ No newline at end of file
@@ -1,7 +1,23 @@
 import os
-from google.genai import types
+from functions.tree_index import walk
+from config import MAX_LISTING_ENTRIES
+from functions.registry import tool
+from functions.schemas import schema_get_files_info
 
-def get_files_info(working_directory, directory="."):
+def _format_entry(name, entry):
+    return f'- {name}: file_size={entry.size} bytes, is_dir={entry.is_dir}'
+
+@tool(schema_get_files_info)
+def get_files_info(
+    working_directory,
+    directory=".",
+    recursive=False,
+    max_depth=None,
+    pattern=None,
+    respect_gitignore=True,
+    offset=0,
+    limit=None,
+):
     full_path = os.path.join(working_directory, directory)
 
     abs_working_directory = os.path.abspath(working_directory)
@@ -17,22 +33,27 @@ def get_files_info(working_directory, directory="."):
         if not os.path.isdir(abs_full_path):
             return f'Error: "{directory}" is not a directory'
 
-        items = os.listdir(abs_full_path)
-        output_lines = []
-
-        for item in items:
-            item_path = os.path.join(abs_full_path, item)
-            is_dir = os.path.isdir(item_path)
+        if not recursive and max_depth is None:
+            max_depth = 1
+            # A plain listing shows everything, as it always has
+            respect_gitignore = respect_gitignore and pattern is not None
+        if max_depth is not None:
+            max_depth = max(1, int(max_depth))
 
-            try:
-                file_size = os.path.getsize(item_path)
-            except Exception:
-                file_size = -1
+        entries = walk(abs_working_directory, abs_full_path, max_depth, pattern, respect_gitignore)
+        output_lines = [_format_entry(name, entry) for name, entry in entries]
 
-            line = f'- {item}: file_size={file_size} bytes, is_dir={is_dir}'
-            output_lines.append(line)
+        offset = max(0, int(offset or 0))
+        limit = int(limit) if limit else MAX_LISTING_ENTRIES
+        total = len(output_lines)
+        page = output_lines[offset:offset + limit]
+        if offset + limit < total:
+            page.append(
+                f'[Showing entries {offset + 1}-{offset + len(page)} of {total}; '
+                f'use offset={offset + limit} to see more]'
+            )
 
-        return "\n".join(output_lines)
+        return "\n".join(page)
 
 
     except FileNotFoundError:
@@ -41,17 +62,3 @@ def get_files_info(working_directory, directory="."):
         return f'Error: Permission denied to access "{directory}".'
     except Exception as e:
         return f'Error: An unexpected error occurred: {e}'
-    
-schema_get_files_info = types.FunctionDeclaration(
-    name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-            ),
-        },
-    ),
-)
@@ -0,0 +1,114 @@
+"""
+Incremental, bounded capture of a child process's stdout and stderr, shared
+by run_python_file's subprocess path and the fork-server in python_worker.py
+(which imports it as a top-level module, so it must not import the rest of
+the package).
+"""
+import os
+import selectors
+import time
+
+
+class OutputLimitExceeded(Exception):
+    """
+    Raised when a process was killed for producing too much output. Carries
+    the (already truncated) output captured up to that point.
+    """
+    def __init__(self, limit, stdout, stderr):
+        super().__init__(f"output exceeded {limit} bytes")
+        self.limit = limit
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class BoundedBuffer:
+    """
+    Keeps the first and last max_bytes / 2 bytes written to it and counts
+    what was dropped in between.
+    """
+    def __init__(self, max_bytes):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data):
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head.extend(data[:room])
+            data = data[room:]
+        if data:
+            self.tail.extend(data)
+            # Trim lazily so large streams are not re-copied on every read
+            if len(self.tail) > 2 * self.tail_limit:
+                del self.tail[:-self.tail_limit]
+
+    def getvalue(self):
+        tail = self.tail[-self.tail_limit:] if self.tail_limit else b""
+        dropped = self.total - len(self.head) - len(tail)
+        if dropped <= 0:
+            return (bytes(self.head) + bytes(tail)).decode("utf-8", errors="replace")
+        return (
+            bytes(self.head).decode("utf-8", errors="replace")
+            + f"\n[... {dropped} bytes truncated ...]\n"
+            + bytes(tail).decode("utf-8", errors="replace")
+        )
+
+
+def capture_output(stdout_fd, stderr_fd, timeout, kill, max_bytes, kill_bytes, on_line=None):
+    """
+    Reads both pipes until they close, keeping at most max_bytes of each.
+    Calls kill() if the timeout passes or the combined output goes over
+    kill_bytes. If on_line is given it is called with ("stdout" or "stderr",
+    line) for every complete line as it arrives.
+
+    Returns (stdout, stderr, timed_out, limit_exceeded). Closes both fds.
+    """
+    names = {stdout_fd: "stdout", stderr_fd: "stderr"}
+    buffers = {fd: BoundedBuffer(max_bytes) for fd in names}
+    partial = {fd: b"" for fd in names}
+    selector = selectors.DefaultSelector()
+    for fd in names:
+        selector.register(fd, selectors.EVENT_READ)
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    limit_exceeded = False
+    total = 0
+    while selector.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fd)
+                continue
+            buffers[key.fd].write(data)
+            total += len(data)
+            if on_line is not None:
+                lines = (partial[key.fd] + data).split(b"\n")
+                partial[key.fd] = lines.pop()
+                for line in lines:
+                    on_line(names[key.fd], line.decode("utf-8", errors="replace"))
+        if total > kill_bytes:
+            limit_exceeded = True
+            break
+
+    if timed_out or limit_exceeded:
+        kill()
+    selector.close()
+    for fd in names:
+        os.close(fd)
+        if on_line is not None and partial[fd]:
+            on_line(names[fd], partial[fd].decode("utf-8", errors="replace"))
+
+    return (
+        buffers[stdout_fd].getvalue(),
+        buffers[stderr_fd].getvalue(),
+        timed_out,
+        limit_exceeded,
+    )
@@ -0,0 +1,205 @@
+import ast
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functions.get_file_content import get_file_content
+from functions.tool_cache import tool_cache
+from functions.tree_index import tree_index
+from config import PREFETCH_MAX_BYTES, PREFETCH_MAX_FILE_BYTES, PREFETCH_MAX_FILES, PREFETCH_EXTENSIONS
+
+
+def _module_files(abs_base, module):
+    """
+    Candidate files for a dotted module name under abs_base.
+    """
+    path = os.path.join(abs_base, *module.split("."))
+    return [path + ".py", os.path.join(path, "__init__.py")]
+
+def imported_files(abs_working_directory, abs_file_path, source):
+    """
+    Returns the files inside the working directory that the Python source
+    imports, resolved against the working directory and the file's own
+    directory (and, for relative imports, its package).
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    file_directory = os.path.dirname(abs_file_path)
+    bases = [abs_working_directory, file_directory]
+    candidates = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                for base in bases:
+                    candidates.extend(_module_files(base, alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                package = file_directory
+                for _ in range(node.level - 1):
+                    package = os.path.dirname(package)
+                search = [package]
+            else:
+                search = bases
+            for base in search:
+                if node.module:
+                    candidates.extend(_module_files(base, node.module))
+                    base = os.path.join(base, *node.module.split("."))
+                # "from pkg import module" imports a submodule
+                for alias in node.names:
+                    candidates.append(os.path.join(base, alias.name + ".py"))
+
+    found = []
+    for candidate in candidates:
+        candidate = os.path.abspath(candidate)
+        if (
+            candidate.startswith(abs_working_directory + os.sep)
+            and candidate != abs_file_path
+            and candidate not in found
+            and os.path.isfile(candidate)
+        ):
+            found.append(candidate)
+    return found
+
+
+class Prefetcher:
+    """
+    Speculatively reads the files a model is likely to ask for next into the
+    tool cache on a background thread: after a listing, the small source
+    files of the listed directory; after reading a Python file, the modules
+    it imports. Unused prefetched results are capped at max_bytes, and
+    cancel() stops pending work, e.g. once a tool changes the tree.
+    Disabled until enabled is set.
+    """
+    def __init__(
+        self,
+        cache=tool_cache,
+        max_bytes=PREFETCH_MAX_BYTES,
+        max_file_bytes=PREFETCH_MAX_FILE_BYTES,
+        max_files=PREFETCH_MAX_FILES,
+    ):
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.enabled = False
+        self.generation = 0
+        self.scheduled = 0
+        self.cancelled = 0
+        self.lock = threading.Lock()
+        self.pending = set()
+        self._executor = None
+
+    def candidates(self, function_name, function_args, function_result):
+        """
+        Returns the paths (relative to the working directory) worth reading
+        after this tool call.
+        """
+        abs_working_directory = os.path.abspath(function_args["working_directory"])
+        if function_name == "get_files_info":
+            abs_directory = os.path.abspath(os.path.join(abs_working_directory, function_args.get("directory") or "."))
+            try:
+                entries = tree_index.list_dir(abs_directory)
+            except OSError:
+                return []
+            paths = [
+                os.path.join(abs_directory, entry.name) for entry in entries
+                if not entry.is_dir
+                and entry.name.endswith(PREFETCH_EXTENSIONS)
+                and entry.size <= self.max_file_bytes
+            ]
+        elif function_name == "get_file_content" and str(function_args.get("file_path", "")).endswith(".py"):
+            abs_file_path = os.path.abspath(os.path.join(abs_working_directory, function_args["file_path"]))
+            try:
+                with open(abs_file_path, "r", encoding="utf-8") as f:
+                    source = f.read(self.max_file_bytes * 4)
+            except (OSError, UnicodeDecodeError):
+                return []
+            paths = [
+                path for path in imported_files(abs_working_directory, abs_file_path, source)
+                if os.path.getsize(path) <= self.max_file_bytes
+            ]
+        else:
+            return []
+
+        return [
+            os.path.relpath(path, abs_working_directory)
+            for path in paths[:self.max_files]
+            if path.startswith(abs_working_directory + os.sep)
+        ]
+
+    def after_call(self, function_name, function_args, function_result):
+        """
+        Queues the likely next reads after a successful tool call. Returns
+        immediately; the reads happen on the prefetch thread.
+        """
+        if not self.enabled or not isinstance(function_result, str) or function_result.startswith("Error"):
+            return
+        paths = self.candidates(function_name, function_args, function_result)
+        if not paths:
+            return
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+            self.scheduled += len(paths)
+            future = self._executor.submit(self._warm, self.generation, function_args["working_directory"], paths)
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def _warm(self, generation, working_directory, paths):
+        for index, path in enumerate(paths):
+            if generation != self.generation or self.cache.prefetched_bytes >= self.max_bytes:
+                with self.lock:
+                    self.cancelled += len(paths) - index
+                return
+            self.cache.prefetch(
+                "get_file_content",
+                {"working_directory": working_directory, "file_path": path},
+                get_file_content,
+                "file_path",
+            )
+
+    def cancel(self):
+        """
+        Stops queued and running prefetches at the next file boundary.
+        """
+        with self.lock:
+            self.generation += 1
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the prefetches queued so far have finished.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        for future in pending:
+            future.result(timeout)
+
+    def close(self):
+        self.cancel()
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        prefetched = self.cache.prefetched
+        hits = self.cache.prefetch_hits
+        return {
+            "scheduled": self.scheduled,
+            "prefetched": prefetched,
+            "hits": hits,
+            "hit_rate": round(hits / prefetched, 3) if prefetched else 0.0,
+            "cancelled": self.cancelled,
+            "unused_bytes": self.cache.prefetched_bytes,
+        }
+
+
+prefetcher = Prefetcher()
+atexit.register(prefetcher.close)
@@ -0,0 +1,138 @@
+"""
+Fork-server for run_python_file. Started by PythonWorkerPool, it imports the
+configured modules once and then, for every request read from stdin, forks a
+child that runs the requested script as __main__ in a fresh namespace. The
+result of each run is written back as one JSON line on stdout.
+
+Request:  {"path": ..., "args": [...], "cwd": ..., "timeout": ...,
+           "max_bytes": ..., "kill_bytes": ..., "stream": ..., "limits": {...}}
+Response: {"returncode": ..., "stdout": ..., "stderr": ..., "timed_out": ...,
+           "limit_exceeded": ..., "usage": {...}}
+
+"limits" are the rlimits applied in the child (see run_limits), and "usage"
+is the wall time, CPU time and peak RSS of the child.
+
+If "stream" is set, every output line is also sent as it is printed, as
+{"stream": "stdout" or "stderr", "line": ...}, ahead of the response.
+"""
+import importlib
+import json
+import os
+import runpy
+import signal
+import sys
+import time
+import traceback
+from output_capture import capture_output
+from run_limits import apply_limits, usage_from, wait_for_exit
+
+
+def run_child(request, stdout_fd, stderr_fd, protocol_fd):
+    """
+    Runs in the forked child: never returns.
+    """
+    code = 1
+    try:
+        os.close(protocol_fd)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.close(devnull)
+        os.close(stdout_fd)
+        os.close(stderr_fd)
+        sys.stdin = open(0, "r", closefd=False)
+        # Streamed output has to leave the child as it is printed
+        buffering = 1 if request.get("stream") else -1
+        sys.stdout = open(1, "w", buffering=buffering, closefd=False)
+        sys.stderr = open(2, "w", buffering=buffering, closefd=False)
+
+        os.chdir(request["cwd"])
+        apply_limits(request.get("limits"))
+        path = request["path"]
+        sys.argv = [path] + list(request.get("args") or [])
+        sys.path[0] = os.path.dirname(path)
+        try:
+            runpy.run_path(path, run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def run(request, protocol):
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        run_child(request, stdout_write, stderr_write, protocol.fileno())
+    os.close(stdout_write)
+    os.close(stderr_write)
+
+    def kill():
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def send_line(stream, line):
+        protocol.write(json.dumps({"stream": stream, "line": line}) + "\n")
+        protocol.flush()
+
+    stdout, stderr, timed_out, limit_exceeded = capture_output(
+        stdout_read,
+        stderr_read,
+        request["timeout"],
+        kill,
+        request["max_bytes"],
+        request["kill_bytes"],
+        on_line=send_line if request.get("stream") else None,
+    )
+
+    status, rusage, killed = wait_for_exit(pid, started + request["timeout"], kill)
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout": stdout,
+        "stderr": stderr,
+        "timed_out": timed_out or killed,
+        "limit_exceeded": limit_exceeded,
+        "usage": usage_from(rusage, time.monotonic() - started),
+    }
+
+def main():
+    # Keep the protocol channel private so nothing printed while preloading
+    # (or by a misbehaving module) can corrupt it.
+    protocol = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    for module in sys.argv[1:]:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+
+    for line in sys.stdin:
+        response = run(json.loads(line), protocol)
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    main()
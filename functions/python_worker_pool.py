@@ -0,0 +1,193 @@
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+from functions.output_capture import OutputLimitExceeded
+from config import (
+    PYTHON_WORKER_POOL_SIZE,
+    PYTHON_WORKER_MAX_RUNS,
+    PYTHON_WORKER_PRELOAD,
+    RUN_OUTPUT_MAX_BYTES,
+    RUN_OUTPUT_KILL_BYTES,
+)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_worker.py")
+
+
+class WorkerCrashed(Exception):
+    """
+    The worker died or its pipe broke. delivered says whether the request
+    had already been sent, in which case the script may have run (partly).
+    """
+    def __init__(self, message, delivered=False):
+        super().__init__(message)
+        self.delivered = delivered
+
+
+class _Worker:
+    """
+    One warm fork-server process (see python_worker.py).
+    """
+    def __init__(self, preload):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", WORKER_SCRIPT] + list(preload),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.runs = 0
+
+    def run(self, request, on_line=None):
+        request = dict(request, stream=on_line is not None)
+        if self.process.poll() is not None:
+            raise WorkerCrashed(f"worker exited with code {self.process.returncode}")
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise WorkerCrashed(str(e))
+        try:
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise WorkerCrashed(f"worker exited with code {self.process.poll()}", delivered=True)
+                message = json.loads(line)
+                if "stream" not in message:
+                    break
+                on_line(message["stream"], message["line"])
+        except OSError as e:
+            raise WorkerCrashed(str(e), delivered=True)
+        self.runs += 1
+        return message
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+
+class PythonWorkerPool:
+    """
+    Pool of pre-started Python interpreters that run scripts without paying
+    interpreter startup and common imports on every call. Each run happens in
+    a forked child with a fresh __main__ namespace, so runs cannot see each
+    other's state. A worker is replaced after max_runs runs or if it dies.
+    """
+    def __init__(self, size=PYTHON_WORKER_POOL_SIZE, max_runs=PYTHON_WORKER_MAX_RUNS, preload=PYTHON_WORKER_PRELOAD):
+        self.size = size
+        self.max_runs = max_runs
+        self.preload = preload
+        self.idle = []
+        self.started = 0
+        # Guards idle and started; notified whenever a worker is returned or
+        # retired, so callers waiting for one can take it or start a new one
+        self.condition = threading.Condition()
+        self.recycled = 0
+        self.crashed = 0
+
+    @property
+    def available(self):
+        return self.size > 0 and hasattr(os, "fork")
+
+    def _checkout(self):
+        with self.condition:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.started < self.size:
+                    self.started += 1
+                    break
+                self.condition.wait()
+        try:
+            return _Worker(self.preload)
+        except BaseException:
+            with self.condition:
+                self.started -= 1
+                self.condition.notify()
+            raise
+
+    def _checkin(self, worker):
+        with self.condition:
+            self.idle.append(worker)
+            self.condition.notify()
+
+    def _retire(self, worker):
+        worker.close()
+        with self.condition:
+            self.started -= 1
+            self.condition.notify()
+
+    def run(
+        self,
+        command,
+        cwd,
+        timeout,
+        max_bytes=RUN_OUTPUT_MAX_BYTES,
+        kill_bytes=RUN_OUTPUT_KILL_BYTES,
+        on_line=None,
+        limits=None,
+    ):
+        """
+        Runs `python <script> <args...>` under the given rlimits (see
+        run_limits) and returns a CompletedProcess with the run's resource
+        usage as its usage attribute, or raises subprocess.TimeoutExpired
+        like subprocess.run would. Output is captured as in
+        output_capture.capture_output, raising OutputLimitExceeded if the
+        run had to be killed for it.
+        """
+        request = {
+            "path": command[0],
+            "args": command[1:],
+            "cwd": os.path.abspath(cwd),
+            "timeout": timeout,
+            "max_bytes": max_bytes,
+            "kill_bytes": kill_bytes,
+            "limits": limits,
+        }
+        worker = self._checkout()
+        try:
+            result = worker.run(request, on_line)
+        except WorkerCrashed:
+            self.crashed += 1
+            self._retire(worker)
+            raise
+        except BaseException:
+            # Out of step with its protocol, e.g. on_line raised
+            self._retire(worker)
+            raise
+
+        if worker.runs >= self.max_runs:
+            self.recycled += 1
+            self._retire(worker)
+        else:
+            self._checkin(worker)
+
+        if result["limit_exceeded"]:
+            raise OutputLimitExceeded(kill_bytes, result["stdout"], result["stderr"])
+        if result["timed_out"]:
+            raise subprocess.TimeoutExpired(
+                [sys.executable] + command, timeout, output=result["stdout"], stderr=result["stderr"]
+            )
+        completed = subprocess.CompletedProcess(
+            [sys.executable] + command, result["returncode"], result["stdout"], result["stderr"]
+        )
+        completed.usage = result.get("usage")
+        return completed
+
+    def close(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            self._retire(worker)
+
+
+python_worker_pool = PythonWorkerPool()
+atexit.register(python_worker_pool.close)
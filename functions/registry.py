@@ -0,0 +1,79 @@
+import importlib
+import threading
+
+# Every tool the model can call, mapped to the module that implements it.
+# Modules are imported the first time one of their tools is needed, so the
+# CLI does not pay for them (or for the SDK) at startup.
+TOOL_MODULES = {
+    "get_files_info": "functions.get_files_info",
+    "get_file_content": "functions.get_file_content",
+    "run_python_file": "functions.run_python_file",
+    "write_file": "functions.write_file",
+    "search_files": "functions.search_files",
+    "apply_patch": "functions.apply_patch",
+}
+
+_tools = {}
+_tool_config = None
+_lock = threading.RLock()
+
+
+class Tool:
+    """
+    A registered tool: the function to call, its schema as a plain dict (in
+    the shape of a FunctionDeclaration) and how call_function must treat it.
+
+    - serialized: never runs concurrently with another call on the same path
+    - cache_arg: results are cached, keyed on the path in this argument
+    - invalidates: "path" if it changes the file in file_path, "all" if it
+      may change anything under the working directory
+    """
+    def __init__(self, function, schema, serialized=False, cache_arg=None, invalidates=None):
+        self.function = function
+        self.schema = schema
+        self.serialized = serialized
+        self.cache_arg = cache_arg
+        self.invalidates = invalidates
+
+    @property
+    def name(self):
+        return self.schema["name"]
+
+
+def tool(schema, serialized=False, cache_arg=None, invalidates=None):
+    """
+    Decorator registering a function as a tool the model can call.
+    """
+    def decorator(function):
+        _tools[schema["name"]] = Tool(function, schema, serialized, cache_arg, invalidates)
+        return function
+    return decorator
+
+def get_tool(name):
+    """
+    Returns the registered Tool, importing its module on first use, or None
+    if there is no such tool.
+    """
+    if name not in TOOL_MODULES:
+        return None
+    if name not in _tools:
+        with _lock:
+            importlib.import_module(TOOL_MODULES[name])
+    return _tools.get(name)
+
+def get_tool_config():
+    """
+    Returns the types.Tool declaring every tool to the model. The
+    declarations are compiled once and reused by every session, from the
+    schemas alone, so no tool module is imported until it is called.
+    """
+    global _tool_config
+    with _lock:
+        if _tool_config is None:
+            from google.genai import types
+            from functions import schemas
+            _tool_config = types.Tool(function_declarations=[
+                types.FunctionDeclaration.model_validate(getattr(schemas, f"schema_{name}"))
+                for name in TOOL_MODULES
+            ])
+    return _tool_config
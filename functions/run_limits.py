@@ -0,0 +1,73 @@
+"""
+Resource limits and usage accounting for run_python_file children, shared by
+the subprocess path and the fork-server (which imports it as run_limits).
+
+Limits are a dict of name -> value, None leaving that limit as inherited.
+"""
+import os
+import resource
+import sys
+import time
+
+RLIMITS = {
+    "cpu_seconds": resource.RLIMIT_CPU,
+    "address_space": resource.RLIMIT_AS,
+    "open_files": resource.RLIMIT_NOFILE,
+    "processes": resource.RLIMIT_NPROC,
+}
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAX_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def apply_limits(limits):
+    """
+    Runs in the child before the script starts. Limits can only be lowered:
+    each one is capped at the hard limit already in place. The CPU limit
+    sends SIGXCPU when reached and SIGKILL a second later.
+    """
+    for name, value in (limits or {}).items():
+        if value is None:
+            continue
+        rlimit = RLIMITS[name]
+        _, hard = resource.getrlimit(rlimit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        new_hard = value + 1 if name == "cpu_seconds" else value
+        if hard != resource.RLIM_INFINITY:
+            new_hard = min(new_hard, hard)
+        try:
+            resource.setrlimit(rlimit, (value, new_hard))
+        except (ValueError, OSError):
+            pass
+
+def wait_for_exit(pid, deadline, kill):
+    """
+    Reaps pid, calling kill() if it is still running at deadline (a
+    time.monotonic() value); a child can close its output and keep running,
+    so the end of its output is not the end of the timeout. Returns
+    (status, rusage, timed_out).
+    """
+    delay = 0.001
+    while True:
+        waited, status, rusage = os.wait4(pid, os.WNOHANG)
+        if waited:
+            return status, rusage, False
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            kill()
+            _, status, rusage = os.wait4(pid, 0)
+            return status, rusage, True
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+def usage_from(rusage, wall_seconds):
+    """
+    The resources a finished child used, from the rusage os.wait4 returned.
+    """
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "user_seconds": round(rusage.ru_utime, 3),
+        "system_seconds": round(rusage.ru_stime, 3),
+        "max_rss_bytes": rusage.ru_maxrss * MAX_RSS_UNIT,
+    }
@@ -1,7 +1,159 @@
+import json
 import subprocess
 import os
-from google.genai import types
+import signal
+import sys
+import time
+from functions.python_worker_pool import python_worker_pool, WorkerCrashed
+from functions.output_capture import capture_output, OutputLimitExceeded
+from functions.run_limits import usage_from, wait_for_exit
+from config import (
+    RUN_OUTPUT_MAX_BYTES,
+    RUN_OUTPUT_KILL_BYTES,
+    RUN_CPU_SECONDS,
+    RUN_MAX_ADDRESS_SPACE,
+    RUN_MAX_OPEN_FILES,
+    RUN_MAX_PROCESSES,
+    RUN_REPORT_USAGE,
+)
+from functions.registry import tool
+from functions.schemas import schema_run_python_file
 
+# Called with ("stdout" or "stderr", line) for every line a script prints
+# while it is still running; see set_output_listener
+_output_listener = None
+
+# Whether results end with the run's resource usage; see set_usage_report
+_report_usage = RUN_REPORT_USAGE
+
+# Applies the rlimits given as JSON in argv[1], then execs the command in the
+# rest of argv. Runs as its own interpreter because preexec_fn is unsafe
+# while other threads are running, and tools always run on worker threads.
+LIMITS_WRAPPER = (
+    "import json, os, sys\n"
+    f"sys.path[0] = {os.path.dirname(os.path.abspath(__file__))!r}\n"
+    "from run_limits import apply_limits\n"
+    "apply_limits(json.loads(sys.argv[1]))\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def set_output_listener(listener):
+    """
+    Streams the output of every run_python_file call to listener as it is
+    produced, or stops streaming if listener is None.
+    """
+    global _output_listener
+    _output_listener = listener
+
+def set_usage_report(enabled):
+    """
+    Turns the resource usage line at the end of every result on or off,
+    e.g. off while responses are recorded or replayed, since the numbers
+    change from run to run and would make every later request a miss.
+    """
+    global _report_usage
+    _report_usage = enabled
+
+def _limits():
+    return {
+        "cpu_seconds": RUN_CPU_SECONDS,
+        "address_space": RUN_MAX_ADDRESS_SPACE,
+        "open_files": RUN_MAX_OPEN_FILES,
+        "processes": RUN_MAX_PROCESSES,
+    }
+
+def _run_subprocess(command, cwd, timeout, on_line, limits=None):
+    started = time.monotonic()
+    argv = command
+    if limits:
+        argv = [sys.executable, "-S", "-c", LIMITS_WRAPPER, json.dumps(limits)] + list(command)
+    process = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        # So output can be streamed as the script prints it
+        env=dict(os.environ, PYTHONUNBUFFERED="1"),
+    )
+
+    def kill():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    stdout, stderr, timed_out, limit_exceeded = capture_output(
+        os.dup(process.stdout.fileno()),
+        os.dup(process.stderr.fileno()),
+        timeout,
+        kill,
+        RUN_OUTPUT_MAX_BYTES,
+        RUN_OUTPUT_KILL_BYTES,
+        on_line=on_line,
+    )
+    process.stdout.close()
+    process.stderr.close()
+    # Reap the child here rather than in Popen.wait to get its rusage
+    status, rusage, killed = wait_for_exit(process.pid, started + timeout, kill)
+    timed_out = timed_out or killed
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if limit_exceeded:
+        raise OutputLimitExceeded(RUN_OUTPUT_KILL_BYTES, stdout, stderr)
+    if timed_out:
+        raise subprocess.TimeoutExpired(command, timeout, output=stdout, stderr=stderr)
+    completed = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+    completed.usage = usage_from(rusage, time.monotonic() - started)
+    return completed
+
+def _format_usage(usage):
+    cpu_seconds = usage["user_seconds"] + usage["system_seconds"]
+    return (
+        f"Resources: {usage['wall_seconds']:.2f}s wall, {cpu_seconds:.2f}s CPU "
+        f"({usage['user_seconds']:.2f}s user, {usage['system_seconds']:.2f}s system), "
+        f"peak memory {usage['max_rss_bytes'] / (1024 * 1024):.1f} MB"
+    )
+
+def _limit_notes(returncode, stderr, usage):
+    """
+    Explains a run that failed because it hit one of the rlimits.
+    """
+    notes = []
+    cpu_seconds = usage["user_seconds"] + usage["system_seconds"] if usage else 0
+    if RUN_CPU_SECONDS and (
+        returncode == -signal.SIGXCPU
+        or (returncode == -signal.SIGKILL and cpu_seconds >= RUN_CPU_SECONDS)
+    ):
+        notes.append(f"Process killed after using its CPU time limit of {RUN_CPU_SECONDS}s")
+    if RUN_MAX_ADDRESS_SPACE and returncode != 0 and "MemoryError" in stderr:
+        notes.append(f"Process ran out of memory under its limit of {RUN_MAX_ADDRESS_SPACE // (1024 * 1024)} MB")
+    return notes
+
+def _format_output(stdout, stderr, returncode=0, notes=(), usage=None):
+    stdout_output = stdout.strip()
+    stderr_output = stderr.strip()
+
+    output_parts = []
+    if stdout_output:
+        output_parts.append(f"STDOUT:\n{stdout_output}")
+    if stderr_output:
+        output_parts.append(f"STDERR:\n{stderr_output}")
+
+    if returncode != 0:
+        output_parts.append(f"Process exited with code {returncode}")
+    output_parts.extend(notes)
+
+    if not output_parts:
+        output_parts.append("No output produced.")
+    if usage is not None:
+        output_parts.append(_format_usage(usage))
+
+    return "\n\n".join(output_parts)
+
+@tool(schema_run_python_file, serialized=True, invalidates="all")
 def run_python_file(working_directory, file_path, args=None):
     if args is None:
         args = []
@@ -20,32 +172,33 @@ def run_python_file(working_directory, file_path, args=None):
         if not os.path.isfile(abs_full_path):
             return f'Error: File "{file_path}" not found.'
 
-        command = ['python', abs_full_path] + args
+        limits = _limits()
+        result = None
+        if python_worker_pool.available:
+            try:
+                result = python_worker_pool.run(
+                    [abs_full_path] + args, working_directory, 30, on_line=_output_listener, limits=limits
+                )
+            except WorkerCrashed as e:
+                if e.delivered:
+                    # The script may already have run; running it again
+                    # could repeat its side effects
+                    return f"Error: executing Python file: {e}"
+                # Never started: fall back to a fresh interpreter below
+                result = None
 
-        result = subprocess.run(
-            command,
-            cwd=working_directory,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        stdout_output = result.stdout.strip()
-        stderr_output = result.stderr.strip()
-        
-        output_parts = []
-        if stdout_output:
-            output_parts.append(f"STDOUT:\n{stdout_output}")
-        if stderr_output:
-            output_parts.append(f"STDERR:\n{stderr_output}")
-
-        if result.returncode != 0:
-            output_parts.append(f"Process exited with code {result.returncode}")
-        
-        if not output_parts:
-            return "No output produced."
+        if result is None:
+            command = ['python', abs_full_path] + args
+            result = _run_subprocess(command, working_directory, 30, _output_listener, limits)
 
-        return "\n\n".join(output_parts)
+        usage = getattr(result, "usage", None)
+        return _format_output(
+            result.stdout,
+            result.stderr,
+            result.returncode,
+            notes=_limit_notes(result.returncode, result.stderr, usage),
+            usage=usage if _report_usage else None,
+        )
 
     except FileNotFoundError:
         return f'Error: File "{file_path}" not found.'
@@ -53,25 +206,9 @@ def run_python_file(working_directory, file_path, args=None):
         return f'Error: Permission denied to execute "{file_path}".'
     except subprocess.TimeoutExpired:
         return f"Error: The script timed out after 30 seconds."
+    except OutputLimitExceeded as e:
+        return _format_output(e.stdout, e.stderr, notes=[
+            f"Process killed after producing more than {e.limit} bytes of output"
+        ])
     except Exception as e:
         return f"Error: executing Python file: {e}"
-
-schema_run_python_file = types.FunctionDeclaration(
-    name="run_python_file",
-    description="Executes a Python file and returns the output.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The path of the Python file to execute.",
-            ),
-            "args": types.Schema(
-                type=types.Type.ARRAY,
-                description="A list of string arguments to pass to the Python file.",
-                items=types.Schema(type=types.Type.STRING),
-            ),
-        },
-        required=["file_path"],
-    ),
-)
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+The schemas of the tools the model can call, kept apart from their
+implementations so the declarations sent with the first model call can be
+built without importing any tool module (see registry.get_tool_config).
+"""
+
+schema_get_files_info = {
+    "name": "get_files_info",
+    "description": "Lists files in the specified directory along with their sizes, constrained to the working directory. Can list a whole tree recursively in one call.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "directory": {
+                "type": "STRING",
+                "description": "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
+            },
+            "recursive": {
+                "type": "BOOLEAN",
+                "description": "List subdirectories recursively. Entries are shown with their path relative to the directory, and files ignored by .gitignore are skipped.",
+            },
+            "max_depth": {
+                "type": "INTEGER",
+                "description": "How many directory levels to list when recursive (1 lists only the directory itself).",
+            },
+            "pattern": {
+                "type": "STRING",
+                "description": "Only list files matching this glob, e.g. \"*.py\". Matched against the file name, or against the relative path if it contains \"/\".",
+            },
+            "respect_gitignore": {
+                "type": "BOOLEAN",
+                "description": "Skip files ignored by .gitignore in recursive or filtered listings. Defaults to true.",
+            },
+            "offset": {
+                "type": "INTEGER",
+                "description": "Number of entries to skip, for paging through large listings.",
+            },
+            "limit": {
+                "type": "INTEGER",
+                "description": "Maximum number of entries to return.",
+            },
+        },
+    },
+}
+
+schema_get_file_content = {
+    "name": "get_file_content",
+    "description": "Reads the content of a file up to a maximum number of characters. Large files can be read in parts by line range or byte range.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The path of the file to read.",
+            },
+            "start_line": {
+                "type": "INTEGER",
+                "description": "First line to read, starting at 1. Reads to end_line, or to the end of the file if end_line is not given.",
+            },
+            "end_line": {
+                "type": "INTEGER",
+                "description": "Last line to read (inclusive).",
+            },
+            "offset": {
+                "type": "INTEGER",
+                "description": "Byte offset to start reading at, when not reading by line.",
+            },
+            "length": {
+                "type": "INTEGER",
+                "description": "Number of bytes to read from offset.",
+            },
+        },
+        "required": ["file_path"],
+    },
+}
+
+schema_run_python_file = {
+    "name": "run_python_file",
+    "description": "Executes a Python file and returns the output.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The path of the Python file to execute.",
+            },
+            "args": {
+                "type": "ARRAY",
+                "description": "A list of string arguments to pass to the Python file.",
+                "items": {
+                    "type": "STRING",
+                },
+            },
+        },
+        "required": ["file_path"],
+    },
+}
+
+schema_write_file = {
+    "name": "write_file",
+    "description": "Writes content to a specified file. The file is created if it does not exist. Any existing content will be overwritten. To change part of an existing file, prefer apply_patch.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The path of the file to write to. This path is relative to the working directory.",
+            },
+            "content": {
+                "type": "STRING",
+                "description": "The content to write to the file.",
+            },
+        },
+        "required": ["file_path", "content"],
+    },
+}
+
+schema_search_files = {
+    "name": "search_files",
+    "description": "Searches the contents of all files in the working directory for a literal string or regular expression and returns matching lines as path:line:text, with a few lines of context.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "query": {
+                "type": "STRING",
+                "description": "The text or regular expression to search for.",
+            },
+            "is_regex": {
+                "type": "BOOLEAN",
+                "description": "Treat the query as a Python regular expression. Defaults to false.",
+            },
+            "case_sensitive": {
+                "type": "BOOLEAN",
+                "description": "Match case exactly. Defaults to false.",
+            },
+            "context_lines": {
+                "type": "INTEGER",
+                "description": "Lines of context to show before and after each match.",
+            },
+            "max_results": {
+                "type": "INTEGER",
+                "description": "Maximum number of matching lines to return.",
+            },
+        },
+        "required": ["query"],
+    },
+}
+
+schema_apply_patch = {
+    "name": "apply_patch",
+    "description": "Edits an existing file without rewriting all of it, either by applying a unified diff or by replacing exact snippets of text. All changes are applied or none are.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The path of the file to edit, relative to the working directory.",
+            },
+            "patch": {
+                "type": "STRING",
+                "description": "A unified diff for this file (hunks starting with @@ -start,count +start,count @@).",
+            },
+            "edits": {
+                "type": "ARRAY",
+                "description": "Search/replace edits applied in order. Each search text must occur exactly once in the file.",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "search": {
+                            "type": "STRING",
+                            "description": "Exact text to find, including enough context to be unique.",
+                        },
+                        "replace": {
+                            "type": "STRING",
+                            "description": "Text to put in its place.",
+                        },
+                    },
+                    "required": ["search", "replace"],
+                },
+            },
+        },
+        "required": ["file_path"],
+    },
+}
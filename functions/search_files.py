@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from functions.tree_index import walk
+from config import (
+    SEARCH_INDEX_DIRECTORY,
+    SEARCH_MAX_FILE_BYTES,
+    SEARCH_MAX_RESULTS,
+    SEARCH_CONTEXT_LINES,
+)
+from functions.registry import tool
+from functions.schemas import schema_search_files
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _literal_runs(parsed):
+    """
+    Returns the runs of literal text every match of a parsed regex contains,
+    in order; adjacent entries are not contiguous in the match. Anything
+    that is not a plain literal (classes, alternatives, lookarounds, optional
+    repeats, backreferences) ends the current run and requires nothing.
+    """
+    runs = [""]
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            runs[-1] += chr(av).lower()
+        elif op is sre_parse.SUBPATTERN:
+            # Plain, named and flag groups: their contents are required
+            inner = _literal_runs(av[-1])
+            runs[-1] += inner[0]
+            runs.extend(inner[1:])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            runs.extend(_literal_runs(av[2]))
+            runs.append("")
+        else:
+            runs.append("")
+    return runs
+
+def _required_trigrams(query, is_regex):
+    """
+    Trigrams every matching file must contain, taken from the literal runs
+    of the query. Returns an empty set when nothing can be required, in
+    which case every indexed file is a candidate.
+    """
+    if not is_regex:
+        return _trigrams(query.lower())
+    try:
+        parsed = sre_parse.parse(query)
+    except (re.error, RecursionError):
+        return set()
+    required = set()
+    for run in _literal_runs(parsed):
+        required |= _trigrams(run)
+    return required
+
+def prune_search_indexes(index_directory=SEARCH_INDEX_DIRECTORY):
+    """
+    Deletes the saved indexes of working directories that no longer exist,
+    e.g. temporary session copies. Returns the number deleted.
+    """
+    try:
+        names = os.listdir(index_directory)
+    except OSError:
+        return 0
+    pruned = 0
+    for name in names:
+        path = os.path.join(index_directory, name)
+        if name.endswith(".json"):
+            try:
+                with open(path, "r") as f:
+                    # save() writes the working directory first
+                    match = re.match(r'\{"working_directory": ("(?:[^"\\]|\\.)*")', f.read(4096))
+                working_directory = json.loads(match.group(1)) if match else None
+            except (OSError, ValueError):
+                continue
+            if working_directory is not None and os.path.isdir(working_directory):
+                continue
+        elif not name.endswith(".tmp"):
+            continue
+        try:
+            os.remove(path)
+            pruned += 1
+        except OSError:
+            pass
+    return pruned
+
+
+class TrigramIndex:
+    """
+    Maps every trigram of (lowercased) file contents to the files containing
+    it, for one working directory. Files are re-read only when their mtime or
+    size changes, and the index is saved to disk so it survives restarts.
+    """
+    def __init__(self, working_directory, index_directory=SEARCH_INDEX_DIRECTORY):
+        self.working_directory = os.path.abspath(working_directory)
+        digest = hashlib.sha256(self.working_directory.encode()).hexdigest()[:16]
+        self.path = os.path.join(index_directory, f"{digest}.json")
+        self.files = {}
+        self.postings = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("working_directory") != self.working_directory:
+            return
+        for path, (mtime, size, trigrams) in data["files"].items():
+            self._add(path, mtime, size, None if trigrams is None else set(trigrams))
+
+    def save(self):
+        data = {
+            "working_directory": self.working_directory,
+            "files": {
+                path: [mtime, size, None if trigrams is None else sorted(trigrams)]
+                for path, (mtime, size, trigrams) in self.files.items()
+            },
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def _add(self, path, mtime, size, trigrams):
+        self.files[path] = (mtime, size, trigrams)
+        for trigram in trigrams or ():
+            self.postings.setdefault(trigram, set()).add(path)
+
+    def _remove(self, path):
+        _, _, trigrams = self.files.pop(path)
+        for trigram in trigrams or ():
+            paths = self.postings.get(trigram)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.postings[trigram]
+
+    def refresh(self):
+        """
+        Brings the index up to date with the working directory, re-reading
+        only files that are new or whose mtime or size changed. Returns the
+        number of files (re)indexed or dropped.
+        """
+        with self.lock:
+            seen = set()
+            changed = 0
+            for path, entry in walk(self.working_directory, self.working_directory, None, None, True):
+                if entry.is_dir:
+                    continue
+                seen.add(path)
+                try:
+                    stat = os.stat(os.path.join(self.working_directory, path))
+                except OSError:
+                    continue
+                cached = self.files.get(path)
+                if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                    continue
+                if cached is not None:
+                    self._remove(path)
+                self._add(path, stat.st_mtime_ns, stat.st_size, self._read_trigrams(path, stat.st_size))
+                changed += 1
+
+            for path in [path for path in self.files if path not in seen]:
+                self._remove(path)
+                changed += 1
+
+            if changed:
+                self.save()
+            return changed
+
+    def _read_trigrams(self, path, size):
+        # None marks a file too big to index; it is scanned on every search
+        if size > SEARCH_MAX_FILE_BYTES:
+            return None
+        try:
+            with open(os.path.join(self.working_directory, path), "r") as f:
+                return _trigrams(f.read().lower())
+        except (OSError, UnicodeDecodeError):
+            return set()
+
+    def candidates(self, required):
+        """
+        The files that may contain a match: with no required trigrams every
+        file (including ones too short to have trigrams), otherwise the
+        files holding all of them plus the files too big to index.
+        """
+        with self.lock:
+            if not required:
+                return sorted(self.files)
+            postings = sorted((self.postings.get(trigram, set()) for trigram in required), key=len)
+            unindexed = {path for path, (_, _, trigrams) in self.files.items() if trigrams is None}
+            return sorted(set.intersection(*postings) | unindexed)
+
+
+def _match_groups(lines, matcher, context_lines):
+    """
+    Yields (separated, before, number, line, after) for every matching line:
+    the numbered context lines shown before and after it, and whether they
+    do not follow on from the previous match's. Reads lines one at a time.
+    """
+    before = deque(maxlen=context_lines)
+    group = None
+    shown_until = -1
+    for number, line in enumerate(lines):
+        line = line.rstrip("\n")
+        if matcher.search(line):
+            if group is not None:
+                yield group
+            first = before[0][0] if before else number
+            group = (first > shown_until + 1, list(before), number, line, [])
+            before.clear()
+            shown_until = number
+        elif group is not None and len(group[4]) < context_lines:
+            group[4].append((number, line))
+            shown_until = number
+        else:
+            if group is not None:
+                yield group
+                group = None
+            before.append((number, line))
+    if group is not None:
+        yield group
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_pruned = False
+
+
+def get_search_index(working_directory):
+    global _pruned
+    key = os.path.abspath(working_directory)
+    with _indexes_lock:
+        if not _pruned:
+            # Once per process, so indexes of deleted directories do not pile up
+            prune_search_indexes()
+            _pruned = True
+        if key not in _indexes:
+            _indexes[key] = TrigramIndex(key)
+        return _indexes[key]
+
+@tool(schema_search_files)
+def search_files(working_directory, query, is_regex=False, case_sensitive=False, context_lines=None, max_results=None):
+    if not query:
+        return 'Error: The search query is empty.'
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        matcher = re.compile(query if is_regex else re.escape(query), flags)
+    except re.error as e:
+        return f'Error: Invalid regular expression "{query}": {e}'
+
+    context_lines = SEARCH_CONTEXT_LINES if context_lines is None else max(0, int(context_lines))
+    max_results = int(max_results) if max_results else SEARCH_MAX_RESULTS
+
+    try:
+        index = get_search_index(working_directory)
+        index.refresh()
+        output_lines = []
+        matches = 0
+        for path in index.candidates(_required_trigrams(query, is_regex)):
+            shown, matched = len(output_lines), matches
+            try:
+                # Line by line, so files too big to index need not fit in memory
+                with open(os.path.join(index.working_directory, path), "r") as f:
+                    for separated, before, number, line, after in _match_groups(f, matcher, context_lines):
+                        if matches == max_results:
+                            output_lines.append(f"[Stopped after {max_results} matches; narrow the query to see more]")
+                            return "\n".join(output_lines)
+                        matches += 1
+                        if separated and output_lines:
+                            output_lines.append("--")
+                        for context, context_line in before:
+                            output_lines.append(f"{path}-{context + 1}-{context_line}")
+                        output_lines.append(f"{path}:{number + 1}:{line}")
+                        for context, context_line in after:
+                            output_lines.append(f"{path}-{context + 1}-{context_line}")
+            except (OSError, UnicodeDecodeError):
+                # Not text after all: drop what was shown of it
+                del output_lines[shown:]
+                matches = matched
+                continue
+
+        if not matches:
+            return f'No matches found for "{query}".'
+        return "\n".join(output_lines)
+
+    except PermissionError:
+        return f'Error: Permission denied while searching for "{query}".'
+    except Exception as e:
+        return f'Error: An unexpected error occurred: {e}'
@@ -0,0 +1,183 @@
+import json
+import os
+import stat as stat_module
+import threading
+from collections import OrderedDict
+from config import TOOL_CACHE_MAX_BYTES
+
+
+class ToolCache:
+    """
+    LRU cache of read-only tool results, bounded by the total size of the
+    cached results. Entries are keyed on the tool, its normalized arguments
+    and the stat of the file it reads, so a changed file is not served stale
+    even if the change did not go through write_file. Only results read from
+    a single file are cached: a directory's stat does not change when a file
+    in it grows or something below it changes, so a listing could be stale.
+    """
+    def __init__(self, max_bytes=TOOL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Entries stored by prefetch(), how many were later used, and the
+        # size of the ones not used yet
+        self.prefetched = 0
+        self.prefetch_hits = 0
+        self.prefetched_bytes = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _key(self, function_name, function_args, target_arg):
+        """
+        Returns (key, absolute target path), or (None, target) if the target
+        is not a file that can be stat'ed and so cannot be cached.
+        """
+        working_directory = os.path.abspath(function_args["working_directory"])
+        relative_path = os.path.normpath(function_args.get(target_arg) or ".")
+        target = os.path.abspath(os.path.join(working_directory, relative_path))
+        try:
+            stat = os.stat(target)
+        except OSError:
+            return None, target
+        if not stat_module.S_ISREG(stat.st_mode):
+            return None, target
+
+        normalized_args = {
+            key: os.path.normpath(value) if key == target_arg else value
+            for key, value in function_args.items()
+            if key != "working_directory"
+        }
+        key = (
+            function_name,
+            working_directory,
+            json.dumps(normalized_args, sort_keys=True, default=str),
+            (stat.st_mtime_ns, stat.st_size, stat.st_ino),
+        )
+        return key, target
+
+    def get_or_call(self, function_name, function_args, function_to_call, target_arg):
+        """
+        Returns the cached result of function_to_call(**function_args) or
+        calls it and caches the result. target_arg names the argument holding
+        the path the tool reads, relative to the working directory.
+        """
+        key, target = self._key(function_name, function_args, target_arg)
+        if key is None:
+            with self.lock:
+                self.misses += 1
+            self.local.last_hit = False
+            return function_to_call(**function_args)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.local.last_hit = True
+                _, result, size, prefetched = self.entries[key]
+                if prefetched:
+                    self.entries[key] = (target, result, size, False)
+                    self.prefetch_hits += 1
+                    self.prefetched_bytes -= size
+                return result
+            self.misses += 1
+        self.local.last_hit = False
+
+        result = function_to_call(**function_args)
+        self._store(key, target, result, prefetched=False)
+        return result
+
+    def prefetch(self, function_name, function_args, function_to_call, target_arg):
+        """
+        Calls and caches a tool ahead of a request for it, marking the entry
+        as prefetched until it is first used. Returns the bytes added (0 if
+        it was already cached or could not be).
+        """
+        key, target = self._key(function_name, function_args, target_arg)
+        if key is None:
+            return 0
+        with self.lock:
+            if key in self.entries:
+                return 0
+        return self._store(key, target, function_to_call(**function_args), prefetched=True)
+
+    def _store(self, key, target, result, prefetched):
+        if not isinstance(result, str) or result.startswith("Error:"):
+            return 0
+
+        size = len(result.encode("utf-8", errors="replace"))
+        if size > self.max_bytes:
+            return 0
+
+        with self.lock:
+            if key in self.entries:
+                return 0
+            self.entries[key] = (target, result, size, prefetched)
+            self.current_bytes += size
+            if prefetched:
+                self.prefetched += 1
+                self.prefetched_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size, evicted_prefetched) = self.entries.popitem(last=False)
+                self._drop(evicted_size, evicted_prefetched)
+                self.evictions += 1
+        return size
+
+    def _drop(self, size, prefetched):
+        self.current_bytes -= size
+        if prefetched:
+            self.prefetched_bytes -= size
+
+    def pop_last_hit(self):
+        """
+        Returns whether the last lookup made on this thread was a hit, or None
+        if there was no lookup since the previous call. Lets callers that time
+        a tool call tell whether the result came from the cache.
+        """
+        last_hit = getattr(self.local, "last_hit", None)
+        self.local.last_hit = None
+        return last_hit
+
+    def invalidate(self, working_directory, file_path="."):
+        """
+        Drops every entry for the given path and for the directories that
+        contain it, e.g. after write_file touches it. Passing only the
+        working directory drops everything cached under it.
+        """
+        path = os.path.abspath(os.path.join(working_directory, file_path))
+        with self.lock:
+            stale = [
+                key for key, (target, _, _, _) in self.entries.items()
+                if target == path
+                or path.startswith(target + os.sep)
+                or target.startswith(path + os.sep)
+            ]
+            for key in stale:
+                _, _, size, prefetched = self.entries.pop(key)
+                self._drop(size, prefetched)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+            self.prefetched_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "prefetched": self.prefetched,
+                "prefetch_hits": self.prefetch_hits,
+            }
+
+
+tool_cache = ToolCache()
@@ -0,0 +1,170 @@
+import fnmatch
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from config import MAX_INDEXED_DIRECTORIES
+
+IndexedEntry = namedtuple("IndexedEntry", ["name", "is_dir", "size", "is_symlink"], defaults=(False,))
+
+
+class TreeIndex:
+    """
+    In-memory index of directory listings. A directory is re-read only when
+    its mtime changes (an entry was added, removed or renamed) or when it is
+    invalidated explicitly, e.g. after write_file changed a file's size.
+    """
+    def __init__(self, max_directories=MAX_INDEXED_DIRECTORIES):
+        self.max_directories = max_directories
+        self.directories = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def list_dir(self, abs_path):
+        """
+        Returns the entries of a directory sorted by name, reusing the
+        indexed listing if the directory has not changed.
+        """
+        mtime = os.stat(abs_path).st_mtime_ns
+        with self.lock:
+            cached = self.directories.get(abs_path)
+            if cached is not None and cached[0] == mtime:
+                self.directories.move_to_end(abs_path)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        entries = []
+        with os.scandir(abs_path) as iterator:
+            for entry in iterator:
+                # The dirent already knows the type; only the size needs a stat.
+                # Symlinks are described, not followed: a link to a directory
+                # is not a directory here, so walk() never descends into one
+                try:
+                    is_symlink = entry.is_symlink()
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    is_symlink, is_dir, size = False, False, -1
+                entries.append(IndexedEntry(entry.name, is_dir, size, is_symlink))
+        entries.sort()
+
+        with self.lock:
+            self.directories[abs_path] = (mtime, entries)
+            self.directories.move_to_end(abs_path)
+            while len(self.directories) > self.max_directories:
+                self.directories.popitem(last=False)
+        return entries
+
+    def invalidate(self, path):
+        """
+        Forgets the listing containing path and, if path is a directory,
+        every listing under it.
+        """
+        path = os.path.abspath(path)
+        parent = os.path.dirname(path)
+        with self.lock:
+            for cached_path in list(self.directories):
+                if cached_path in (path, parent) or cached_path.startswith(path + os.sep):
+                    del self.directories[cached_path]
+
+
+class GitIgnore:
+    """
+    Subset of .gitignore matching: comments, negation, directory-only
+    patterns, anchored patterns and basename globs. Rules from nested
+    .gitignore files apply relative to the directory they live in.
+    """
+    def __init__(self):
+        self.rules = []
+
+    def load(self, abs_directory, relative_directory):
+        path = os.path.join(abs_directory, ".gitignore")
+        try:
+            with open(path, "r") as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            return
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if line:
+                self.rules.append((relative_directory, line, negate, dir_only, anchored))
+
+    def is_ignored(self, relative_path, is_dir):
+        if os.path.basename(relative_path) == ".git":
+            return True
+        ignored = False
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base != ".":
+                if not relative_path.startswith(base + "/"):
+                    continue
+                candidate = relative_path[len(base) + 1:]
+            else:
+                candidate = relative_path
+            target = candidate if anchored else os.path.basename(candidate)
+            if fnmatch.fnmatchcase(target, pattern):
+                ignored = not negate
+        return ignored
+
+
+tree_index = TreeIndex()
+
+
+def _inside(abs_working_directory, path):
+    root = os.path.realpath(abs_working_directory)
+    target = os.path.realpath(path)
+    return target == root or target.startswith(root + os.sep)
+
+
+def walk(abs_working_directory, abs_full_path, max_depth, pattern, respect_gitignore):
+    """
+    Yields (path relative to abs_full_path, entry) for everything under
+    abs_full_path, depth first in name order. max_depth None means no limit;
+    pattern is a glob that files must match (directories are then omitted).
+    Symlinks are not descended into, and ones pointing outside
+    abs_working_directory are left out.
+    """
+    ignore = GitIgnore()
+    relative_root = os.path.relpath(abs_full_path, abs_working_directory)
+    if respect_gitignore:
+        # .gitignore files above the listed directory still apply to it
+        ancestor = "."
+        for component in [] if relative_root == "." else relative_root.split(os.sep):
+            ignore.load(os.path.join(abs_working_directory, ancestor), ancestor)
+            ancestor = component if ancestor == "." else f"{ancestor}/{component}"
+        ignore.load(abs_full_path, relative_root.replace(os.sep, "/"))
+
+    stack = [(abs_full_path, "", 1)]
+    while stack:
+        directory, prefix, depth = stack.pop()
+        subdirectories = []
+        for entry in tree_index.list_dir(directory):
+            relative_path = prefix + entry.name
+            if entry.is_symlink and not _inside(abs_working_directory, os.path.join(directory, entry.name)):
+                continue
+            if respect_gitignore:
+                from_root = os.path.normpath(os.path.join(relative_root, relative_path)).replace(os.sep, "/")
+                if ignore.is_ignored(from_root, entry.is_dir):
+                    continue
+            target = relative_path if pattern and "/" in pattern else entry.name
+            if not pattern or (not entry.is_dir and fnmatch.fnmatch(target, pattern)):
+                yield relative_path, entry
+            if entry.is_dir and (max_depth is None or depth < max_depth):
+                subdirectories.append((os.path.join(directory, entry.name), relative_path + "/", depth + 1))
+
+        for subdirectory in reversed(subdirectories):
+            if respect_gitignore:
+                relative_subdirectory = os.path.relpath(subdirectory[0], abs_working_directory)
+                ignore.load(subdirectory[0], relative_subdirectory.replace(os.sep, "/"))
+            stack.append(subdirectory)
@@ -1,7 +1,49 @@
 import os
-from google.genai import types
+import tempfile
+from config import WRITE_FSYNC
+from functions.registry import tool
+from functions.schemas import schema_write_file
 
-def write_file(working_directory, file_path, content):
+def atomic_write(abs_full_path, content, fsync=WRITE_FSYNC):
+    """
+    Writes content to a temporary file next to abs_full_path and renames it
+    into place, so readers (and a crash) never see a half-written file. An
+    existing file keeps its permissions. With fsync the data and the rename
+    are flushed to disk before returning.
+    """
+    parent_dir = os.path.dirname(abs_full_path)
+    try:
+        mode = os.stat(abs_full_path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, temp_path = tempfile.mkstemp(dir=parent_dir, prefix=f".{os.path.basename(abs_full_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, abs_full_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    if fsync:
+        dir_fd = os.open(parent_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+@tool(schema_write_file, serialized=True, invalidates="path")
+def write_file(working_directory, file_path, content, fsync=WRITE_FSYNC):
     full_path = os.path.join(working_directory, file_path)
     abs_working_directory = os.path.abspath(working_directory)
     abs_full_path = os.path.abspath(full_path)
@@ -14,29 +56,9 @@ def write_file(working_directory, file_path, content):
         if not os.path.exists(parent_dir):
             os.makedirs(parent_dir)
 
-        with open(abs_full_path, "w") as f:
-            f.write(content)
+        atomic_write(abs_full_path, content, fsync=fsync)
         
         return f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
 
     except Exception as e:
         return f'Error: An unexpected error occurred: {e}'
-    
-schema_write_file = types.FunctionDeclaration(
-    name="write_file",
-    description="Writes content to a specified file. The file is created if it does not exist. Any existing content will be overwritten.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The path of the file to write to. This path is relative to the working directory.",
-            ),
-            "content": types.Schema(
-                type=types.Type.STRING,
-                description="The content to write to the file.",
-            ),
-        },
-        required=["file_path", "content"],
-    ),
-)
\ No newline at end of file
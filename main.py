@@ -1,75 +1,27 @@
 import os
 import argparse
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from functions.get_files_info import get_files_info, schema_get_files_info
-from functions.get_file_content import get_file_content, schema_get_file_content
-from functions.run_python_file import run_python_file, schema_run_python_file
-from functions.write_file import write_file, schema_write_file
-
-def call_function(function_call_part, verbose=False):
-    """
-    Calls a function based on the model's function call part.
-    """
-    function_name = function_call_part.name
-    function_args = function_call_part.args
-
-    if verbose:
-        print(f"Calling function: {function_name}({function_args})")
-    else:
-        print(f" - Calling function: {function_name}")
-
-    available_functions = {
-        "get_files_info": get_files_info,
-        "get_file_content": get_file_content,
-        "run_python_file": run_python_file,
-        "write_file": write_file,
-    }
-
-    if function_name not in available_functions:
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_name,
-                    response={"error": f"Unknown function: {function_name}"},
-                )
-            ],
-        )
+from config import (
+    RESPONSE_CACHE_DIRECTORY,
+    RESPONSE_CACHE_MODES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    MODEL_MAX_RETRIES,
+    MAX_ITERATIONS,
+    SESSION_DIRECTORY,
+    WORKING_DIRECTORY,
+)
 
-    # Inject the working directory for security
-    function_args["working_directory"] = "./calculator"
-
-    try:
-        function_to_call = available_functions[function_name]
-        function_result = function_to_call(**function_args)
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_name,
-                    response={"result": function_result},
-                )
-            ],
-        )
-    except Exception as e:
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_name,
-                    response={"error": f"Error calling function: {e}"},
-                )
-            ],
-        )
+def print_trace_summary(tracer):
+    if tracer is None:
+        return
+    tracer.close()
+    print()
+    print(tracer.summary())
+    print(f"Trace written to {tracer.path}")
 
 def main():
     """
     Main function to run the command-line tool.
     """
-    load_dotenv()
-
     parser = argparse.ArgumentParser(
         description='A command-line tool for asking a prompt.',
         formatter_class=argparse.RawTextHelpFormatter
@@ -78,6 +30,7 @@ def main():
     parser.add_argument(
         'prompt',
         type=str,
+        nargs='?',
         help='The prompt you want to ask. Enclose in quotes if it contains spaces.'
     )
 
@@ -87,82 +40,277 @@ def main():
         help='Enable verbose output.'
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        '--batch',
+        metavar='PROMPTS_JSONL',
+        help='Run every prompt in a JSONL file concurrently instead of a single prompt.'
+    )
 
-    api_key = os.environ.get("GEMINI_API_KEY")
-    client = genai.Client(api_key=api_key)
-    user_prompt = args.prompt
+    parser.add_argument(
+        '--output',
+        help='Where to write batch results as JSONL (default: <batch file>.results.jsonl).'
+    )
 
-    system_prompt = """
-        You are a helpful AI coding agent.
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='Maximum number of batch sessions running at once (default: 4).'
+    )
 
-        When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
+    parser.add_argument(
+        '--requests-per-minute',
+        type=float,
+        help='Cap on model calls per minute shared by all batch sessions.'
+    )
 
-        - List files and directories
-        - Read file contents
-        - Execute Python files with optional arguments
-        - Write or overwrite files
+    parser.add_argument(
+        '--tokens-per-minute',
+        type=float,
+        help='Cap on prompt and response tokens per minute shared by all batch sessions.'
+    )
 
-        All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
-    """
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=MODEL_MAX_RETRIES,
+        help=f'Retries of a model call that failed with throttling or a server error\n(default: {MODEL_MAX_RETRIES}).'
+    )
 
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_files_info,
-            schema_get_file_content,
-            schema_run_python_file,
-            schema_write_file,
-        ]
+    parser.add_argument(
+        '--workdir-root',
+        help='Directory to create per-session copies of the working directory in\n(default: a new temporary directory).'
     )
 
-    # Initialize the messages list with the user's prompt
-    messages = [
-        types.Content(role="user", parts=[types.Part(text=user_prompt)]),
-    ]
+    parser.add_argument(
+        '--response-cache',
+        nargs='?',
+        const=RESPONSE_CACHE_DIRECTORY,
+        metavar='DIRECTORY',
+        help=f'Cache model responses on disk (default directory: {RESPONSE_CACHE_DIRECTORY}).'
+    )
 
-    print("Response:")
+    parser.add_argument(
+        '--cache-mode',
+        choices=RESPONSE_CACHE_MODES,
+        default='cache',
+        help='cache: reuse fresh responses; record: always call the model and store;\nreplay: only use stored responses, without network access (default: cache).'
+    )
+
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=RESPONSE_CACHE_TTL_SECONDS,
+        help='Seconds a cached response stays fresh in cache mode.'
+    )
+
+    parser.add_argument(
+        '--backend',
+        choices=['gemini', 'scripted'],
+        default='gemini',
+        help='Model backend to use (default: gemini). The scripted backend plays\ncanned turns from --script without network access.'
+    )
+
+    parser.add_argument(
+        '--script',
+        help='JSON file of canned turns for the scripted backend.'
+    )
+
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.0,
+        help='Seconds the scripted backend waits before its first chunk.'
+    )
+
+    parser.add_argument(
+        '--stream-tool-output',
+        action='store_true',
+        help='Print the output of scripts run by the agent while they are running.'
+    )
+
+    parser.add_argument(
+        '--prefetch',
+        action='store_true',
+        help='Read files the agent is likely to ask for next in the background.'
+    )
+
+    parser.add_argument(
+        '--prompt-cache',
+        action='store_true',
+        help='Send the system prompt and tool schemas once as cached content and\nreference the cache from every model call (falls back to sending\nthem in full when caching is unavailable).'
+    )
+
+    parser.add_argument(
+        '--pin-snapshot',
+        action='store_true',
+        help='Add a snapshot of the working directory to the cached prefix\n(implies --prompt-cache).'
+    )
+
+    parser.add_argument(
+        '--resume',
+        metavar='SESSION_ID',
+        help='Continue a checkpointed session instead of starting a new one.'
+    )
+
+    parser.add_argument(
+        '--max-iterations',
+        type=int,
+        default=MAX_ITERATIONS,
+        help=f'Model calls the session may make in this run (default: {MAX_ITERATIONS}).'
+    )
+
+    parser.add_argument(
+        '--session-dir',
+        default=SESSION_DIRECTORY,
+        help=f'Where sessions are checkpointed after every iteration (default: {SESSION_DIRECTORY}).'
+    )
+
+    parser.add_argument(
+        '--no-checkpoint',
+        action='store_true',
+        help='Do not checkpoint the session.'
+    )
 
-    # Loop for a maximum of 20 iterations to allow for a feedback loop
-    for _ in range(20):
+    parser.add_argument(
+        '--trace',
+        metavar='TRACE_JSONL',
+        help='Append a span per model call and tool call to this file and print\na timing summary when the run ends.'
+    )
+
+    args = parser.parse_args()
+
+    if args.prompt is None and args.batch is None and args.resume is None:
+        parser.error('either a prompt, --batch or --resume is required')
+    if args.resume and (args.prompt is not None or args.batch):
+        parser.error('--resume continues the stored prompt and cannot be combined with a prompt or --batch')
+    if args.backend == 'scripted' and not args.script:
+        parser.error('--backend scripted requires --script')
+
+    # Everything below needs the SDK, the engine and the tools; they are
+    # imported only once the arguments are known to be valid so that --help
+    # and usage errors stay fast.
+    import asyncio
+    from dotenv import load_dotenv
+    from engine import run_session
+    from batch import run_batch
+    from functions.tool_cache import tool_cache
+    from response_cache import ResponseCache, CachedBackend
+    from backends import GeminiBackend, ScriptedBackend, MODEL_NAME
+    from tracing import Tracer
+    from scheduler import RequestScheduler
+    from checkpoint import SessionLog
+    from prompt_cache import PromptCachingBackend, snapshot_working_directory
+
+    load_dotenv()
+
+    response_cache = None
+    if args.response_cache or args.cache_mode != 'cache':
+        response_cache = ResponseCache(
+            args.response_cache or RESPONSE_CACHE_DIRECTORY,
+            mode=args.cache_mode,
+            ttl_seconds=args.cache_ttl,
+        )
+        # Run timings differ every time and would change the cache key of
+        # every request after a script ran, so recordings could not replay
+        from functions.run_python_file import set_usage_report
+        set_usage_report(False)
+
+    if args.prefetch:
+        from functions.call_function import enable_prefetch
+        prefetcher = enable_prefetch()
+
+    if args.stream_tool_output:
+        from functions.run_python_file import set_output_listener
+        set_output_listener(lambda stream, line: print(f"   {stream}> {line}", flush=True))
+
+    prompt = args.prompt
+    working_directory = WORKING_DIRECTORY
+    session_log = None
+    if args.resume:
         try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-001",
-                contents=messages,
-                config=types.GenerateContentConfig(tools=[available_functions], system_instruction=system_prompt)
-            )
+            session_log = SessionLog.open(args.session_dir, args.resume)
+        except FileNotFoundError:
+            parser.error(f'no session "{args.resume}" in {args.session_dir}')
+        prompt = session_log.prompt
+        working_directory = session_log.working_directory
 
-            if (args.verbose):
-                print(f"User prompt: {user_prompt}")
-                print(f"Prompt tokens: {response.usage_metadata.prompt_token_count}")
-                print(f"Response tokens: {response.usage_metadata.candidates_token_count }")
-
-            # Check if the model is done and has a final text response
-            if response.text:
-                print(response.text)
-                break # Exit the loop, the agent is done
-
-            # Extract the candidate response and add to messages
-            candidate = response.candidates[0].content
-            messages.append(candidate)
-
-            # Check for a function call in the candidate response
-            if not candidate.parts or not candidate.parts[0].function_call:
-                print("Model returned a text response, but it was not the final one. Something is wrong.")
-                break
-
-            function_call_part = candidate.parts[0].function_call
-            function_call_result = call_function(function_call_part, verbose=args.verbose)
-            
-            # Append the tool's response to the messages list
-            if function_call_result:
-                messages.append(function_call_result)
-
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            break
-            
+    if args.backend == 'scripted':
+        backend = ScriptedBackend.from_file(args.script, latency=args.latency)
+    elif response_cache is not None and response_cache.mode == 'replay':
+        backend = None
     else:
-        print("Maximum iterations reached. The agent might be stuck or the task is complex.")
+        backend = GeminiBackend(api_key=os.environ.get("GEMINI_API_KEY"))
+    prompt_caching = None
+    if backend is not None and (args.prompt_cache or args.pin_snapshot):
+        snapshot = snapshot_working_directory(working_directory) if args.pin_snapshot else None
+        backend = prompt_caching = PromptCachingBackend(backend, snapshot=snapshot)
+    if response_cache is not None:
+        backend = CachedBackend(backend, response_cache, model=MODEL_NAME if backend is None else None)
+
+    tracer = Tracer(args.trace) if args.trace else None
+    scheduler = RequestScheduler(
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_retries=args.max_retries,
+    )
+
+    async def run_and_close(coroutine):
+        # Drop the prompt caches now rather than paying for them until their TTL ends
+        try:
+            return await coroutine
+        finally:
+            if prompt_caching is not None:
+                await prompt_caching.close()
+
+    if args.batch:
+        output_path = args.output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        succeeded = asyncio.run(run_and_close(run_batch(
+            backend,
+            args.batch,
+            output_path,
+            concurrency=args.concurrency,
+            scheduler=scheduler,
+            workdir_root=args.workdir_root,
+            verbose=args.verbose,
+            tracer=tracer,
+        )))
+        print(f"Wrote results to {output_path} ({succeeded} sessions completed)")
+        print_trace_summary(tracer)
+        return
+
+    if session_log is not None:
+        print(f"Resuming session {session_log.session_id} after {len(session_log.turns)} iterations")
+    elif not args.no_checkpoint:
+        session_log = SessionLog.create(args.session_dir, prompt, working_directory)
+
+    print("Response:")
+    response = asyncio.run(run_and_close(run_session(
+        backend,
+        prompt,
+        verbose=args.verbose,
+        working_directory=working_directory,
+        scheduler=scheduler,
+        tracer=tracer,
+        session_log=session_log,
+        max_iterations=args.max_iterations,
+    )))
+    print_trace_summary(tracer)
+    if session_log is not None and response is None:
+        print(f"Session checkpointed; continue it with --resume {session_log.session_id}")
+
+    if args.verbose:
+        print(f"Tool cache: {tool_cache.stats()}")
+        if args.prefetch:
+            print(f"Prefetch: {prefetcher.stats()}")
+        if response_cache is not None:
+            print(f"Response cache: hits={response_cache.hits}, misses={response_cache.misses}")
+        print(f"Model call retries: {scheduler.retries}, throttled for {scheduler.throttled_seconds:.1f}s")
+        if prompt_caching is not None:
+            print(
+                f"Prompt cache: created={prompt_caching.created}, refreshed={prompt_caching.refreshed}, "
+                f"cached calls={prompt_caching.hits}, uncached calls={prompt_caching.fallbacks}"
+            )
 
 if __name__ == "__main__":
     main()
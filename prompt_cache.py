@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from google.genai import types
+from backends import estimate_tokens, estimate_config_tokens
+from functions.tree_index import walk
+from config import (
+    PROMPT_CACHE_TTL_SECONDS,
+    PROMPT_CACHE_REFRESH_SECONDS,
+    PROMPT_CACHE_RETRY_SECONDS,
+    PROMPT_CACHE_MIN_TOKENS,
+    PROMPT_CACHE_SNAPSHOT_MAX_BYTES,
+)
+
+SNAPSHOT_HEADER = (
+    "Snapshot of the working directory taken when the session started. Files may "
+    "have changed since; read a file again before editing it."
+)
+
+
+def snapshot_working_directory(working_directory, max_bytes=PROMPT_CACHE_SNAPSHOT_MAX_BYTES):
+    """
+    Returns a user Content listing every file in the working directory and
+    inlining the text of the smallest ones until max_bytes is used up.
+    """
+    abs_working_directory = os.path.abspath(working_directory)
+    files = []
+    for relative_path, entry in walk(abs_working_directory, abs_working_directory, None, None, True):
+        if not entry.is_dir:
+            files.append((relative_path, entry.size))
+
+    lines = [SNAPSHOT_HEADER, "", "Files:"]
+    lines.extend(f"- {relative_path} ({size} bytes)" for relative_path, size in files)
+    budget = max_bytes
+    for relative_path, size in sorted(files, key=lambda item: item[1]):
+        if size > budget:
+            break
+        try:
+            with open(os.path.join(abs_working_directory, relative_path), "r", encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            continue
+        lines.extend(["", f'--- "{relative_path}" ---', text])
+        budget -= size
+    return types.Content(role="user", parts=[types.Part(text="\n".join(lines))])
+
+def _is_cache_miss(error):
+    """
+    Whether a model call failed because the cached content it referenced is
+    gone (expired, deleted or never visible to this key).
+    """
+    code = getattr(error, "code", None)
+    if code in (403, 404):
+        return True
+    return code == 400 and "cached" in str(error).lower()
+
+async def _prepend(first, stream):
+    if first is None:
+        return
+    yield first
+    async for chunk in stream:
+        yield chunk
+
+
+class PromptCachingBackend:
+    """
+    Wraps a backend so the static prefix of every request (system
+    instruction, tool schemas and an optional pinned snapshot) is sent once
+    as explicitly cached content and later requests only reference it.
+
+    Caches are keyed on the prefix, so concurrent sessions with the same
+    prefix share one. A cache is created on first use, its TTL is extended
+    when it is close to expiring, and requests fall back to sending the full
+    prefix when the backend cannot cache, the prefix is below the minimum
+    cacheable size, creation fails (retried after a cooldown) or a cache
+    disappears.
+    """
+    def __init__(
+        self,
+        backend,
+        snapshot=None,
+        ttl_seconds=PROMPT_CACHE_TTL_SECONDS,
+        refresh_seconds=PROMPT_CACHE_REFRESH_SECONDS,
+        retry_seconds=PROMPT_CACHE_RETRY_SECONDS,
+        min_tokens=PROMPT_CACHE_MIN_TOKENS,
+        clock=time.monotonic,
+    ):
+        self.backend = backend
+        self.model = backend.model
+        self.prefix_contents = [snapshot] if snapshot is not None else []
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self.lock = asyncio.Lock()
+        # prefix key -> (cache name, expiry on self.clock)
+        self.entries = {}
+        # prefix key -> time before which creating a cache is not retried
+        self.unavailable = {}
+        self.created = 0
+        self.refreshed = 0
+        self.hits = 0
+        self.fallbacks = 0
+
+    @property
+    def supported(self):
+        return hasattr(self.backend, "create_cache")
+
+    def _key(self, config):
+        payload = {
+            "model": self.model,
+            "system_instruction": config.system_instruction,
+            "tools": config.tools,
+            "tool_config": config.tool_config,
+            "contents": self.prefix_contents,
+        }
+        dumped = json.dumps(payload, sort_keys=True, default=lambda value: value.model_dump(mode="json", exclude_none=True))
+        return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+    def _prefix_tokens(self, config):
+        snapshot_tokens = estimate_tokens(self.prefix_contents) if self.prefix_contents else 0
+        return estimate_config_tokens(config) + snapshot_tokens
+
+    async def _cache_name(self, config):
+        """
+        Returns the name of a live cache for config's prefix, creating or
+        refreshing it as needed, or None to send the prefix uncached.
+        """
+        key = self._key(config)
+        async with self.lock:
+            now = self.clock()
+            entry = self.entries.get(key)
+            if entry is not None:
+                name, expires = entry
+                if expires - now > self.refresh_seconds:
+                    return name
+                try:
+                    await self.backend.refresh_cache(name, self.ttl_seconds)
+                    self.entries[key] = (name, now + self.ttl_seconds)
+                    self.refreshed += 1
+                    return name
+                except Exception:
+                    del self.entries[key]
+
+            if self.unavailable.get(key, 0) > now:
+                return None
+            if self._prefix_tokens(config) < self.min_tokens:
+                # Too small for the API to accept; do not ask again
+                self.unavailable[key] = float("inf")
+                return None
+            try:
+                name = await self.backend.create_cache(self.prefix_contents, config, self.ttl_seconds)
+            except Exception:
+                self.unavailable[key] = now + self.retry_seconds
+                return None
+            self.entries[key] = (name, now + self.ttl_seconds)
+            self.created += 1
+            return name
+
+    def _forget(self, name):
+        for key, (cached_name, _) in list(self.entries.items()):
+            if cached_name == name:
+                del self.entries[key]
+
+    async def stream(self, contents, config=None):
+        if config is not None and self.supported:
+            name = await self._cache_name(config)
+            if name is not None:
+                cached_config = config.model_copy(update={
+                    "cached_content": name,
+                    "system_instruction": None,
+                    "tools": None,
+                    "tool_config": None,
+                })
+                try:
+                    stream = await self.backend.stream(contents, cached_config)
+                    # The SDK only sends the request once the stream is
+                    # iterated, so a missing cache shows up on the first chunk
+                    first = await anext(stream, None)
+                    self.hits += 1
+                    return _prepend(first, stream)
+                except Exception as e:
+                    if not _is_cache_miss(e):
+                        raise
+                    self._forget(name)
+        self.fallbacks += 1
+        return await self.backend.stream(self.prefix_contents + list(contents), config)
+
+    async def generate(self, contents, config=None):
+        return await self.backend.generate(self.prefix_contents + list(contents), config)
+
+    async def count_tokens(self, contents):
+        return await self.backend.count_tokens(self.prefix_contents + list(contents))
+
+    async def close(self):
+        """
+        Deletes the caches this wrapper created instead of waiting for their
+        TTL to run out.
+        """
+        for name, _ in list(self.entries.values()):
+            try:
+                await self.backend.delete_cache(name)
+            except Exception:
+                pass
+        self.entries.clear()
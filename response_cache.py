@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from google.genai import types
+from config import RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MODES
+
+
+def _dump(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    return value
+
+
+class ResponseCache:
+    """
+    On-disk cache of streamed model responses keyed on everything that
+    determines them: model name, system instruction, tool schemas and the
+    conversation so far.
+
+    Modes:
+    - cache: serve fresh entries, call the model and store on a miss
+    - record: always call the model and overwrite the stored entry
+    - replay: only serve stored entries (ignoring the TTL) and fail on a
+      miss, so a recorded session can be rerun offline
+    """
+    def __init__(
+        self,
+        directory,
+        mode="cache",
+        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+        max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    ):
+        if mode not in RESPONSE_CACHE_MODES:
+            raise ValueError(f"unknown response cache mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, model, contents, config=None):
+        payload = {
+            "model": model,
+            "system_instruction": _dump(config.system_instruction) if config else None,
+            "tools": _dump(config.tools) if config else None,
+            "contents": _dump(contents),
+        }
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns the recorded response chunks for key, or None on a miss.
+        """
+        if self.mode == "record":
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            if self.mode != "replay" and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                self.misses += 1
+                return None
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [types.GenerateContentResponse.model_validate(chunk) for chunk in entry["chunks"]]
+
+    def put(self, key, model, chunks):
+        entry = {
+            "model": model,
+            "created": time.time(),
+            "chunks": [_dump(chunk) for chunk in chunks],
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes the oldest entries until the cache fits in max_bytes.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class CachedBackend:
+    """
+    Wraps a model backend so streamed calls go through a ResponseCache. The
+    wrapped backend may be None in replay mode.
+    """
+    def __init__(self, backend, cache, model=None):
+        self.backend = backend
+        self.cache = cache
+        self.model = model or backend.model
+
+    async def generate(self, contents, config=None):
+        return await self.backend.generate(contents, config)
+
+    async def count_tokens(self, contents):
+        return await self.backend.count_tokens(contents)
+
+    async def stream(self, contents, config=None):
+        key = self.cache.key(self.model, contents, config)
+        chunks = self.cache.get(key)
+        if chunks is not None:
+            return self._replay(chunks)
+        if self.cache.mode == "replay" or self.backend is None:
+            raise LookupError(f"No recorded model response for this conversation (key {key[:12]})")
+        stream = await self.backend.stream(contents, config)
+        return self._record(key, stream)
+
+    async def _replay(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def _record(self, key, stream):
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self.cache.put(key, self.model, chunks)
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from config import MODEL_MAX_RETRIES, MODEL_RETRY_BASE_DELAY, MODEL_RETRY_MAX_DELAY
+
+# HTTP statuses worth retrying: timeouts, throttling and server-side errors
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, httpx.TransportError)
+
+
+def is_retryable(error):
+    """
+    Whether a failed model call is worth retrying: throttling, server errors
+    and dropped connections are, bad requests and bugs are not.
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+def _parse_duration(value):
+    """
+    Parses "17", "17s" or "1.5s" into seconds, or returns None.
+    """
+    try:
+        return max(0.0, float(str(value).strip().removesuffix("s")))
+    except ValueError:
+        return None
+
+def retry_after(error):
+    """
+    Returns the delay in seconds the server asked for, from a Retry-After
+    header (seconds or HTTP date) or a google.rpc.RetryInfo error detail,
+    or None if it gave no hint.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        seconds = _parse_duration(value)
+        if seconds is not None:
+            return seconds
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in (details.get("error") or {}).get("details") or []:
+            if isinstance(detail, dict) and "retryDelay" in detail:
+                return _parse_duration(detail["retryDelay"])
+    return None
+
+
+class TokenBucket:
+    """
+    Allows up to per_minute units a minute, refilled continuously, with a
+    burst of up to one minute's worth. Callers reserve units up front and
+    sleep for the returned time, so waiters are served in order without a
+    lock; the level may go negative while units are owed.
+    """
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Takes amount units (at most the capacity, so oversized requests still
+        go through) and returns the seconds to wait before using them.
+        """
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount):
+        """
+        Takes (or, if negative, returns) units after the fact, e.g. once the
+        real token count of a call is known.
+        """
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RequestScheduler:
+    """
+    Gates model calls through shared requests-per-minute and tokens-per-minute
+    buckets and retries transient failures with exponential backoff and full
+    jitter, waiting at least as long as the server's retry-after hint. One
+    scheduler is meant to be shared by every session talking to the same
+    API key.
+    """
+    def __init__(
+        self,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=MODEL_MAX_RETRIES,
+        base_delay=MODEL_RETRY_BASE_DELAY,
+        max_delay=MODEL_RETRY_MAX_DELAY,
+        sleep=asyncio.sleep,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    async def acquire(self, estimated_tokens=0):
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            self.throttled_seconds += wait
+            await self.sleep(wait)
+
+    def record_tokens(self, estimated_tokens, actual_tokens):
+        """
+        Corrects the token bucket once a call reports what it really used.
+        """
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - min(estimated_tokens, self.tokens.capacity))
+
+    def backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(error)
+        if hint is not None:
+            # Spread out the sessions that were all told to come back at once
+            delay = hint + random.uniform(0, self.base_delay)
+        return delay
+
+    async def call(self, make_call, estimated_tokens=0, on_retry=None):
+        """
+        Awaits make_call() once the buckets allow it, retrying transient
+        failures up to max_retries times. on_retry(error, delay) is called
+        before each retry. The last error is raised once retries run out.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(estimated_tokens)
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt, e)
+                self.retries += 1
+                if on_retry is not None:
+                    on_retry(e, delay)
+                await self.sleep(delay)
@@ -1,10 +1,43 @@
 import unittest
+import unittest.mock
+import asyncio
+import io
+import json
 import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import threading
+from collections import OrderedDict
 from functions.get_files_info import get_files_info
 from functions.get_file_content import get_file_content
 from functions.write_file import write_file
-from functions.run_python_file import run_python_file
+from functions.apply_patch import apply_patch
+from functions.registry import get_tool, get_tool_config, TOOL_MODULES
+from functions.run_python_file import run_python_file, set_output_listener, set_usage_report, _run_subprocess
+from functions.output_capture import BoundedBuffer, OutputLimitExceeded
 from config import MAX_CHARS
+from google.genai import types
+from engine import run_session, run_sessions
+import batch
+from batch import run_batch
+from conversation import Conversation
+from functions.tool_cache import ToolCache
+from functions.tree_index import TreeIndex
+from functions.search_files import search_files, TrigramIndex, _required_trigrams, prune_search_indexes
+from response_cache import ResponseCache, CachedBackend
+from backends import ScriptedBackend
+from functions.python_worker_pool import PythonWorkerPool, WorkerCrashed
+from tracing import Tracer
+import benchmark
+from google.genai import errors
+from scheduler import RequestScheduler, TokenBucket, is_retryable, retry_after
+from checkpoint import SessionLog
+from prompt_cache import PromptCachingBackend, snapshot_working_directory
+from functions.prefetch import Prefetcher, imported_files
 
 class TestFunctions(unittest.TestCase):
     def setUp(self):
@@ -145,5 +178,1224 @@ class TestFunctions(unittest.TestCase):
         expected_error = 'Error: File "nonexistent.py" not found.'
         self.assertEqual(result, expected_error)
 
+class RecordingBackend(ScriptedBackend):
+    """
+    Scripted backend that also keeps the conversation sent on every call.
+    """
+    def __init__(self, script, **kwargs):
+        super().__init__(script, **kwargs)
+        self.requests = []
+
+    async def stream(self, contents, config=None):
+        self.requests.append(list(contents))
+        return await super().stream(contents, config)
+
+class TestEngine(unittest.TestCase):
+    def test_run_session_streams_text_and_dispatches_calls(self):
+        backend = RecordingBackend([
+            {"text": "Let me look. ", "function_calls": [{"name": "get_files_info", "args": {"directory": "pkg"}}]},
+            {"text": "It has a calculator."},
+        ], chunk_size=4)
+        out = io.StringIO()
+        result = asyncio.run(run_session(backend, "what is in pkg?", out=out))
+        self.assertEqual(result, "It has a calculator.")
+        self.assertIn("Let me look.  - Calling function: get_files_info\nIt has a calculator.", out.getvalue())
+        second_request = backend.requests[1]
+        self.assertEqual(second_request[-2].parts[0].text, "Let me look. ")
+        self.assertEqual(second_request[-1].role, "tool")
+        self.assertIn(
+            "- calculator.py: file_size=",
+            second_request[-1].parts[0].function_response.response["result"],
+        )
+
+    def test_run_sessions_shares_one_backend(self):
+        backend = ScriptedBackend([{"text": "done"}], latency=0.05)
+        results = asyncio.run(run_sessions(backend, ["a", "b", "c"]))
+        self.assertEqual(results, ["done", "done", "done"])
+        self.assertEqual(backend.calls, 3)
+
+    def test_silent_sessions_do_not_announce_calls_on_stdout(self):
+        backend = ScriptedBackend([{"function_calls": [{"name": "get_files_info"}]}, {"text": "done"}])
+        stdout = io.StringIO()
+        with unittest.mock.patch("sys.stdout", stdout):
+            results = asyncio.run(run_sessions(backend, ["a", "b"], verbose=True))
+        self.assertEqual(results, ["done", "done"])
+        self.assertEqual(stdout.getvalue(), "")
+        out = io.StringIO()
+        asyncio.run(run_session(backend, "c", verbose=True, out=out))
+        self.assertIn("Prompt tokens: ", out.getvalue())
+
+    def test_session_fails_when_script_runs_out(self):
+        backend = ScriptedBackend([{"function_calls": [{"name": "get_files_info"}]}])
+        out = io.StringIO()
+        self.assertIsNone(asyncio.run(run_session(backend, "list", out=out)))
+        self.assertIn("Scripted backend has no turn 2", out.getvalue())
+
+class TestBatch(unittest.TestCase):
+    def test_run_batch_isolates_sessions_and_writes_results(self):
+        backend = ScriptedBackend([
+            {"function_calls": [{"name": "write_file", "args": {"file_path": "notes.txt", "content": "hello"}}]},
+            {"text": "done"},
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            batch_path = os.path.join(tmp, "prompts.jsonl")
+            output_path = os.path.join(tmp, "results.jsonl")
+            with open(batch_path, "w") as f:
+                f.write(json.dumps({"id": "write", "prompt": "write notes"}) + "\n")
+
+            succeeded = asyncio.run(run_batch(
+                backend, batch_path, output_path, workdir_root=os.path.join(tmp, "sessions"),
+            ))
+
+            self.assertEqual(succeeded, 1)
+            with open(output_path) as f:
+                results = [json.loads(line) for line in f]
+            self.assertEqual(results[0]["id"], "write")
+            self.assertEqual(results[0]["response"], "done")
+            session_directory = results[0]["working_directory"]
+            with open(os.path.join(session_directory, "notes.txt")) as f:
+                self.assertEqual(f.read(), "hello")
+            self.assertTrue(os.path.exists(os.path.join(session_directory, "pkg", "calculator.py")))
+            self.assertFalse(os.path.exists(os.path.join("calculator", "notes.txt")))
+
+    def test_run_batch_survives_duplicate_and_unsafe_ids(self):
+        backend = ScriptedBackend([{"text": "done"}])
+        with tempfile.TemporaryDirectory() as tmp:
+            batch_path = os.path.join(tmp, "prompts.jsonl")
+            output_path = os.path.join(tmp, "results.jsonl")
+            workdir_root = os.path.join(tmp, "sessions")
+            with open(batch_path, "w") as f:
+                for session_id in ("same", "same", "../../escape"):
+                    f.write(json.dumps({"id": session_id, "prompt": "hi"}) + "\n")
+
+            for _ in range(2):
+                succeeded = asyncio.run(run_batch(backend, batch_path, output_path, workdir_root=workdir_root))
+                self.assertEqual(succeeded, 3)
+            with open(output_path) as f:
+                results = [json.loads(line) for line in f]
+            directories = {result["working_directory"] for result in results}
+            self.assertEqual(len(directories), 3)
+            for directory in directories:
+                self.assertEqual(os.path.dirname(directory), workdir_root)
+            self.assertEqual(len(os.listdir(workdir_root)), 6)
+
+    def test_run_batch_reports_setup_failures_per_session(self):
+        backend = ScriptedBackend([{"text": "done"}])
+        with tempfile.TemporaryDirectory() as tmp:
+            batch_path = os.path.join(tmp, "prompts.jsonl")
+            output_path = os.path.join(tmp, "results.jsonl")
+            with open(batch_path, "w") as f:
+                f.write(json.dumps({"id": "a", "prompt": "hi"}) + "\n")
+            with unittest.mock.patch("batch.prepare_working_directory", side_effect=OSError("disk full")):
+                succeeded = asyncio.run(run_batch(backend, batch_path, output_path, workdir_root=tmp))
+            self.assertEqual(succeeded, 0)
+            with open(output_path) as f:
+                result = json.loads(f.readline())
+            self.assertEqual(result["error"], "OSError: disk full")
+            self.assertIsNone(result["response"])
+
+    def test_run_batch_prepares_directories_off_the_event_loop(self):
+        backend = ScriptedBackend([{"text": "done"}])
+        threads = []
+        prepare = batch.prepare_working_directory
+
+        def recording_prepare(*args):
+            threads.append(threading.current_thread())
+            return prepare(*args)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            batch_path = os.path.join(tmp, "prompts.jsonl")
+            with open(batch_path, "w") as f:
+                f.write(json.dumps({"id": "a", "prompt": "hi"}) + "\n")
+            with unittest.mock.patch("batch.prepare_working_directory", recording_prepare):
+                asyncio.run(run_batch(backend, batch_path, os.path.join(tmp, "out.jsonl"), workdir_root=tmp))
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+def _tool_turn(conversation, name, args, result):
+    call = types.FunctionCall(name=name, args=args)
+    conversation.add_model_turn(types.Content(role="model", parts=[types.Part(function_call=call)]))
+    conversation.add_tool_results([call], types.Content(role="tool", parts=[
+        types.Part.from_function_response(name=name, response={"result": result}),
+    ]))
+
+def _tool_result(content):
+    return content.parts[0].function_response.response["result"]
+
+class TestConversation(unittest.TestCase):
+    def test_repeated_tool_result_is_elided(self):
+        conversation = Conversation("prompt")
+        _tool_turn(conversation, "get_file_content", {"file_path": "main.py"}, "x" * 500)
+        _tool_turn(conversation, "get_file_content", {"file_path": "main.py"}, "x" * 500)
+        self.assertIn("Identical to a later get_file_content", _tool_result(conversation.messages[2]))
+        self.assertEqual(_tool_result(conversation.messages[4]), "x" * 500)
+
+    def test_write_elides_stale_reads_and_writes(self):
+        conversation = Conversation("prompt")
+        _tool_turn(conversation, "get_file_content", {"file_path": "pkg/a.py"}, "old body")
+        _tool_turn(conversation, "write_file", {"file_path": "pkg/a.py", "content": "v1"}, "Error: disk full")
+        self.assertEqual(_tool_result(conversation.messages[2]), "old body")
+        _tool_turn(conversation, "write_file", {"file_path": "pkg/a.py", "content": "v1"}, "Successfully wrote")
+        self.assertIn('Content of "pkg/a.py" elided', _tool_result(conversation.messages[2]))
+        _tool_turn(conversation, "write_file", {"file_path": "pkg/a.py", "content": "v2"}, "Successfully wrote")
+        first_write = conversation.messages[5].parts[0].function_call
+        self.assertIn("elided 2 characters", first_write.args["content"])
+        self.assertEqual(conversation.messages[7].parts[0].function_call.args["content"], "v2")
+
+    def test_compact_summarizes_old_turns_once_over_budget(self):
+        conversation = Conversation("prompt", token_budget=100, keep_recent=2)
+        for index in range(4):
+            _tool_turn(conversation, "get_files_info", {"directory": f"dir{index}"}, f"listing {index}")
+        conversation.record_usage(types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=500, candidates_token_count=10,
+        ))
+        self.assertTrue(conversation.over_budget())
+        self.assertTrue(conversation.compact())
+        self.assertEqual(len(conversation.messages), 3)
+        self.assertEqual(conversation.messages[0].parts[0].text, "prompt")
+        self.assertIn('get_files_info({"directory": "dir0"})', conversation.messages[0].parts[1].text)
+        self.assertEqual(conversation.messages[1].role, "model")
+        self.assertFalse(conversation.over_budget())
+
+class TestToolCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.working_directory = self.tmp.name
+        with open(os.path.join(self.working_directory, "notes.txt"), "w") as f:
+            f.write("first")
+        self.cache = ToolCache(max_bytes=1024)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, file_path="notes.txt"):
+        return self.cache.get_or_call(
+            "get_file_content",
+            {"working_directory": self.working_directory, "file_path": file_path},
+            get_file_content,
+            "file_path",
+        )
+
+    def test_repeated_read_is_a_hit(self):
+        self.assertEqual(self.read(), "first")
+        self.assertEqual(self.read("./notes.txt"), "first")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_write_invalidates_cached_read(self):
+        self.read()
+        write_file(self.working_directory, "notes.txt", "second")
+        self.cache.invalidate(self.working_directory, "notes.txt")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertEqual(self.read(), "second")
+
+    def test_directory_listings_are_not_cached(self):
+        calls = []
+
+        def listing(working_directory, directory):
+            calls.append(directory)
+            return "- notes.txt"
+
+        args = {"working_directory": self.working_directory, "directory": "."}
+        self.cache.get_or_call("get_files_info", args, listing, "directory")
+        self.cache.get_or_call("get_files_info", args, listing, "directory")
+        self.assertEqual(calls, [".", "."])
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_evicts_least_recently_used_over_byte_budget(self):
+        for index in range(3):
+            with open(os.path.join(self.working_directory, f"{index}.txt"), "w") as f:
+                f.write(str(index) * 400)
+            self.read(f"{index}.txt")
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["bytes"], 1024)
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def scripted_backend(self):
+        return ScriptedBackend([
+            {"function_calls": [{"name": "get_files_info", "args": {"directory": "pkg"}}]},
+            {"text": "replayed"},
+        ])
+
+    def test_recorded_session_replays_offline(self):
+        recorder = CachedBackend(self.scripted_backend(), ResponseCache(self.tmp.name, mode="record"))
+        self.assertEqual(asyncio.run(run_session(recorder, "list pkg", out=None)), "replayed")
+
+        replay_cache = ResponseCache(self.tmp.name, mode="replay")
+        replayer = CachedBackend(None, replay_cache, model="scripted")
+        self.assertEqual(asyncio.run(run_session(replayer, "list pkg", out=None)), "replayed")
+        self.assertEqual(replay_cache.hits, 2)
+        self.assertIsNone(asyncio.run(run_session(replayer, "a different prompt", out=None)))
+
+    def test_session_running_python_replays_without_usage_report(self):
+        script = [
+            {"function_calls": [{"name": "run_python_file", "args": {"file_path": "main.py", "args": ["3 + 5"]}}]},
+            {"text": "eight"},
+        ]
+        set_usage_report(False)
+        self.addCleanup(set_usage_report, True)
+        recorder = CachedBackend(ScriptedBackend(script), ResponseCache(self.tmp.name, mode="record"))
+        self.assertEqual(asyncio.run(run_session(recorder, "run it", out=None)), "eight")
+        replay_cache = ResponseCache(self.tmp.name, mode="replay")
+        replayer = CachedBackend(None, replay_cache, model="scripted")
+        self.assertEqual(asyncio.run(run_session(replayer, "run it", out=None)), "eight")
+        self.assertEqual(replay_cache.hits, 2)
+        self.assertNotIn("Resources:", run_python_file("calculator", "main.py", ["3 + 5"]))
+
+    def test_expired_entries_are_misses(self):
+        cache = ResponseCache(self.tmp.name, ttl_seconds=60)
+        backend = CachedBackend(self.scripted_backend(), cache)
+        asyncio.run(run_session(backend, "list pkg", out=None))
+        keys = [name.removesuffix(".json") for name in os.listdir(self.tmp.name)]
+        self.assertEqual(len(keys), 2)
+        for key in keys:
+            self.assertIsNotNone(cache.get(key))
+            os.utime(os.path.join(self.tmp.name, f"{key}.json"), (0, 0))
+            self.assertIsNone(cache.get(key))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+@unittest.skipUnless(hasattr(os, "fork"), "worker pool needs os.fork")
+class TestPythonWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = PythonWorkerPool(size=1, max_runs=3)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    def script(self, name, source):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(source)
+        return path
+
+    def test_runs_in_fresh_namespace_with_argv_and_cwd(self):
+        path = self.script("counter.py", (
+            "import os, sys\n"
+            "counter = globals().get('counter', 0) + 1\n"
+            "print(counter, sys.argv[1:], os.getcwd())\n"
+            "sys.exit(3)\n"
+        ))
+        for _ in range(2):
+            result = self.pool.run([path, "a", "b"], self.tmp.name, 10)
+            self.assertEqual(result.stdout.strip(), f"1 ['a', 'b'] {os.path.realpath(self.tmp.name)}")
+            self.assertEqual(result.returncode, 3)
+
+    def test_timeout_kills_the_run(self):
+        path = self.script("sleepy.py", "import time\ntime.sleep(30)\n")
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run([path], self.tmp.name, 0.2)
+        result = self.pool.run([self.script("ok.py", "print('ok')")], self.tmp.name, 10)
+        self.assertEqual(result.stdout, "ok\n")
+
+    def test_timeout_holds_after_the_script_closes_its_output(self):
+        path = self.script("quiet_sleeper.py", "import os, time\nos.close(1)\nos.close(2)\ntime.sleep(8)\n")
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run([path], self.tmp.name, 1)
+        self.assertLess(time.monotonic() - started, 4)
+
+    def test_crashing_script_reports_signal_and_worker_survives(self):
+        path = self.script("crash.py", "import os\nos.abort()\n")
+        result = self.pool.run([path], self.tmp.name, 10)
+        self.assertLess(result.returncode, 0)
+        result = self.pool.run([self.script("ok.py", "print('ok')")], self.tmp.name, 10)
+        self.assertEqual(result.returncode, 0)
+
+    def test_worker_is_recycled_after_max_runs(self):
+        path = self.script("pid.py", "import os\nprint(os.getppid())\n")
+        parents = [self.pool.run([path], self.tmp.name, 10).stdout for _ in range(4)]
+        self.assertEqual(len(set(parents[:3])), 1)
+        self.assertNotEqual(parents[3], parents[0])
+        self.assertEqual(self.pool.recycled, 1)
+
+    def test_waiter_gets_a_worker_after_one_is_retired(self):
+        pool = PythonWorkerPool(size=1, max_runs=1)
+        self.addCleanup(pool.close)
+        path = self.script("ok.py", "print('ok')")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.run([path], self.tmp.name, 10))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(20)
+        self.assertEqual([result.stdout for result in results], ["ok\n"] * 3)
+        self.assertEqual(pool.recycled, 3)
+
+    def test_crash_after_delivery_is_not_rerun(self):
+        marker = os.path.join(self.tmp.name, "runs.txt")
+        path = self.script("kill_worker.py", (
+            "import os, signal\n"
+            f"open({marker!r}, 'a').write('run\\n')\n"
+            "os.kill(os.getppid(), signal.SIGKILL)\n"
+            "import time\ntime.sleep(1)\n"
+        ))
+        with self.assertRaises(WorkerCrashed) as context:
+            self.pool.run([path], self.tmp.name, 10)
+        self.assertTrue(context.exception.delivered)
+        with open(marker) as f:
+            self.assertEqual(f.read(), "run\n")
+
+    def test_cpu_limit_and_usage(self):
+        path = self.script("spin.py", "while True:\n    pass\n")
+        result = self.pool.run([path], self.tmp.name, 10, limits={"cpu_seconds": 1})
+        self.assertEqual(result.returncode, -signal.SIGXCPU)
+        self.assertGreaterEqual(result.usage["user_seconds"] + result.usage["system_seconds"], 0.9)
+        self.assertGreater(result.usage["max_rss_bytes"], 0)
+        result = self.pool.run([self.script("ok.py", "print('ok')")], self.tmp.name, 10)
+        self.assertEqual(result.stdout, "ok\n")
+
+class TestOutputCapture(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        set_output_listener(None)
+        self.tmp.cleanup()
+
+    def script(self, name, source):
+        with open(os.path.join(self.tmp.name, name), "w") as f:
+            f.write(source)
+        return name
+
+    def test_bounded_buffer_keeps_head_and_tail(self):
+        buffer = BoundedBuffer(10)
+        for chunk in (b"abc", b"defgh", b"ijklmnopq", b"rstuvwxyz"):
+            buffer.write(chunk)
+        self.assertEqual(buffer.getvalue(), "abcde\n[... 16 bytes truncated ...]\nvwxyz")
+
+    def test_runaway_output_is_killed_and_truncated(self):
+        self.script("spam.py", "while True:\n    print('spam' * 100)\n")
+        result = run_python_file(self.tmp.name, "spam.py")
+        self.assertIn("bytes truncated ...]", result)
+        self.assertIn("Process killed after producing more than", result)
+        self.assertLess(len(result), 40000)
+
+    def test_subprocess_path_enforces_output_limit(self):
+        self.script("spam.py", "while True:\n    print('spam' * 100)\n")
+        with self.assertRaises(OutputLimitExceeded) as context:
+            _run_subprocess(["python", "spam.py"], self.tmp.name, 30, None)
+        self.assertIn("bytes truncated ...]", context.exception.stdout)
+
+    def test_subprocess_timeout_holds_after_the_script_closes_its_output(self):
+        self.script("quiet_sleeper.py", "import os, time\nos.close(1)\nos.close(2)\ntime.sleep(8)\n")
+        started = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            _run_subprocess(["python", "quiet_sleeper.py"], self.tmp.name, 1, None)
+        self.assertLess(time.monotonic() - started, 4)
+
+    def test_subprocess_path_applies_limits(self):
+        self.script("hog.py", "data = bytearray(1024 * 1024 * 1024)\nfiles = [open(__file__) for _ in range(100)]\n")
+        limits = {"address_space": 512 * 1024 * 1024, "open_files": 50}
+        result = _run_subprocess(["python", "hog.py"], self.tmp.name, 30, None, limits)
+        self.assertIn("MemoryError", result.stderr)
+        self.assertGreater(result.usage["wall_seconds"], 0)
+        self.script("hog.py", "files = [open(__file__) for _ in range(100)]\n")
+        result = _run_subprocess(["python", "hog.py"], self.tmp.name, 30, None, limits)
+        self.assertIn("Too many open files", result.stderr)
+
+    def test_run_reports_resource_usage(self):
+        self.script("quiet.py", "")
+        result = run_python_file(self.tmp.name, "quiet.py")
+        self.assertTrue(result.startswith("No output produced.\n\nResources: "))
+        self.assertIn("peak memory", result)
+
+    def test_output_is_streamed_while_the_script_runs(self):
+        self.script("slow.py", "import time\nprint('first')\ntime.sleep(1)\nprint('second')\n")
+        environment = {key: value for key, value in os.environ.items() if key != "PYTHONUNBUFFERED"}
+        for run in (
+            lambda on_line: run_python_file(self.tmp.name, "slow.py"),
+            lambda on_line: _run_subprocess(["python", "slow.py"], self.tmp.name, 30, on_line),
+        ):
+            started = time.monotonic()
+            arrivals = {}
+            listener = lambda stream, line: arrivals.setdefault(line, time.monotonic() - started)
+            set_output_listener(listener)
+            try:
+                with unittest.mock.patch.dict(os.environ, environment, clear=True):
+                    run(listener)
+            finally:
+                set_output_listener(None)
+            self.assertLess(arrivals["first"], 0.8)
+            self.assertGreaterEqual(arrivals["second"], 1.0)
+
+    def test_output_lines_are_streamed_to_listener(self):
+        self.script("lines.py", "import sys\nprint('one')\nprint('two', file=sys.stderr)\nprint('three', end='')\n")
+        lines = []
+        set_output_listener(lambda stream, line: lines.append((stream, line)))
+        run_python_file(self.tmp.name, "lines.py")
+        self.assertEqual(sorted(lines), [("stderr", "two"), ("stdout", "one"), ("stdout", "three")])
+        lines.clear()
+        _run_subprocess(["python", "lines.py"], self.tmp.name, 30, lambda stream, line: lines.append((stream, line)))
+        self.assertEqual(sorted(lines), [("stderr", "two"), ("stdout", "one"), ("stdout", "three")])
+
+class TestRangedFileContent(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, "big.log"), "w") as f:
+            for number in range(1, 5001):
+                f.write(f"line {number}\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_truncated_read_includes_summary(self):
+        result = get_file_content(self.tmp.name, "big.log")
+        self.assertIn(f'[...File "big.log" truncated at {MAX_CHARS} characters]', result)
+        self.assertIn('[File "big.log": 48893 bytes, 5000 lines, encoding utf-8.', result)
+
+    def test_line_range(self):
+        result = get_file_content(self.tmp.name, "big.log", start_line=4000, end_line=4002)
+        self.assertEqual(result, '[Lines 4000-4002 of 5000 in "big.log"]\nline 4000\nline 4001\nline 4002\n')
+        result = get_file_content(self.tmp.name, "big.log", start_line=5000)
+        self.assertEqual(result, '[Lines 5000-5000 of 5000 in "big.log"]\nline 5000\n')
+        result = get_file_content(self.tmp.name, "big.log", start_line=6000)
+        self.assertEqual(result, 'Error: "big.log" has only 5000 lines.')
+
+    def test_byte_range_skips_split_characters(self):
+        with open(os.path.join(self.tmp.name, "accents.txt"), "w") as f:
+            f.write("café olé")
+        result = get_file_content(self.tmp.name, "accents.txt", offset=4, length=5)
+        self.assertEqual(result, '[Bytes 5-10 of 10 in "accents.txt"]\n olé')
+
+    def test_open_ended_range_reads_only_what_it_returns(self):
+        with open(os.path.join(self.tmp.name, "huge.log"), "wb") as f:
+            f.write(b"x" * 99 + b"\n")
+            f.write(b"y" * (8 * 1024 * 1024))
+        tracemalloc.start()
+        try:
+            for kwargs in ({"start_line": 2}, {"offset": 100, "length": 10 ** 9}):
+                result = get_file_content(self.tmp.name, "huge.log", **kwargs)
+                self.assertTrue(result.endswith(f"[...Range truncated at {MAX_CHARS} characters]"))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_ranged_read_sees_edits(self):
+        get_file_content(self.tmp.name, "big.log", start_line=1, end_line=1)
+        with open(os.path.join(self.tmp.name, "big.log"), "w") as f:
+            f.write("replaced\n")
+        result = get_file_content(self.tmp.name, "big.log", start_line=1, end_line=1)
+        self.assertEqual(result, '[Lines 1-1 of 1 in "big.log"]\nreplaced\n')
+
+class TestRecursiveListing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for path in ("a.py", "notes.txt", "src/b.py", "src/deep/c.py", "build/out.py", "src/skip.log"):
+            full_path = os.path.join(self.tmp.name, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write("x")
+        with open(os.path.join(self.tmp.name, ".gitignore"), "w") as f:
+            f.write("# generated\nbuild/\n*.log\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def names(self, result):
+        return [line.split(":")[0][2:] for line in result.splitlines() if line.startswith("- ")]
+
+    def test_recursive_listing_honors_gitignore(self):
+        result = get_files_info(self.tmp.name, ".", recursive=True)
+        self.assertEqual(
+            self.names(result),
+            [".gitignore", "a.py", "notes.txt", "src", "src/b.py", "src/deep", "src/deep/c.py"],
+        )
+        self.assertIn("- src/deep: file_size=", result)
+        unfiltered = get_files_info(self.tmp.name, ".", recursive=True, respect_gitignore=False)
+        self.assertIn("build/out.py", self.names(unfiltered))
+
+    def test_gitignore_applies_when_listing_a_subdirectory(self):
+        result = get_files_info(self.tmp.name, "src", recursive=True)
+        self.assertEqual(self.names(result), ["b.py", "deep", "deep/c.py"])
+
+    def test_depth_and_pattern(self):
+        result = get_files_info(self.tmp.name, ".", recursive=True, max_depth=2, pattern="*.py")
+        self.assertEqual(self.names(result), ["a.py", "src/b.py"])
+
+    def test_pagination(self):
+        result = get_files_info(self.tmp.name, ".", recursive=True, offset=2, limit=3)
+        self.assertEqual(self.names(result), ["notes.txt", "src", "src/b.py"])
+        self.assertIn("[Showing entries 3-5 of 7; use offset=5 to see more]", result)
+
+    def test_symlinks_are_not_followed(self):
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        with open(os.path.join(outside.name, "secret.txt"), "w") as f:
+            f.write("secret")
+        os.symlink(".", os.path.join(self.tmp.name, "src", "loop"))
+        os.symlink(outside.name, os.path.join(self.tmp.name, "escape"))
+        os.symlink("a.py", os.path.join(self.tmp.name, "alias.py"))
+        result = get_files_info(self.tmp.name, ".", recursive=True)
+        self.assertEqual(
+            self.names(result),
+            [".gitignore", "a.py", "alias.py", "notes.txt", "src", "src/b.py", "src/deep", "src/loop", "src/deep/c.py"],
+        )
+        self.assertIn("- src/loop: file_size=1 bytes, is_dir=False", result)
+
+    def test_tree_index_reuses_unchanged_directories(self):
+        index = TreeIndex()
+        index.list_dir(self.tmp.name)
+        index.list_dir(self.tmp.name)
+        self.assertEqual((index.hits, index.misses), (1, 1))
+        with open(os.path.join(self.tmp.name, "new.txt"), "w") as f:
+            f.write("new")
+        os.utime(self.tmp.name, ns=(0, 0))
+        names = [entry.name for entry in index.list_dir(self.tmp.name)]
+        self.assertIn("new.txt", names)
+        index.invalidate(os.path.join(self.tmp.name, "new.txt"))
+        self.assertEqual(index.directories, OrderedDict())
+
+class TestSearchFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.write("pkg/calculator.py", "class Calculator:\n    def evaluate(self, expression):\n        return None\n")
+        self.write("main.py", "from pkg.calculator import Calculator\n\ncalculator = Calculator()\n")
+        self.write("notes.txt", "nothing to see\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        full_path = os.path.join(self.tmp.name, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+
+    def test_literal_search_with_context(self):
+        result = search_files(self.tmp.name, "def evaluate")
+        self.assertEqual(result, (
+            "pkg/calculator.py-1-class Calculator:\n"
+            "pkg/calculator.py:2:    def evaluate(self, expression):\n"
+            "pkg/calculator.py-3-        return None"
+        ))
+
+    def test_regex_search_across_files(self):
+        result = search_files(self.tmp.name, r"^class \w+", is_regex=True, context_lines=0)
+        self.assertEqual(result, "pkg/calculator.py:1:class Calculator:")
+        result = search_files(self.tmp.name, "CALCULATOR()", case_sensitive=True)
+        self.assertEqual(result, 'No matches found for "CALCULATOR()".')
+
+    def test_files_not_indexed_are_still_searched(self):
+        self.write("big.log", "filler line\n" * 100000 + "NEEDLE\n")
+        self.write("ab.txt", "ab")
+        self.assertEqual(search_files(self.tmp.name, "needle", context_lines=0), "big.log:100001:NEEDLE")
+        self.assertEqual(search_files(self.tmp.name, "ab", context_lines=0), "ab.txt:1:ab")
+
+    def test_results_stop_after_max_results_with_context(self):
+        self.write("notes.txt", "a\nhit 1\nb\nc\nd\nhit 2\nhit 3\ne\n")
+        result = search_files(self.tmp.name, "hit", max_results=2)
+        self.assertEqual(result, (
+            "notes.txt-1-a\nnotes.txt:2:hit 1\nnotes.txt-3-b\n--\n"
+            "notes.txt-5-d\nnotes.txt:6:hit 2\n"
+            "[Stopped after 2 matches; narrow the query to see more]"
+        ))
+
+    def test_index_picks_up_changed_files(self):
+        search_files(self.tmp.name, "Calculator")
+        self.write("notes.txt", "call the Calculator\n")
+        result = search_files(self.tmp.name, "call the", context_lines=0)
+        self.assertEqual(result, "notes.txt:1:call the Calculator")
+
+    def test_index_is_persisted_and_reused(self):
+        index_directory = os.path.join(self.tmp.name, ".index")
+        with open(os.path.join(self.tmp.name, ".gitignore"), "w") as f:
+            f.write(".index/\n")
+        index = TrigramIndex(self.tmp.name, index_directory)
+        self.assertEqual(index.refresh(), 4)
+        reloaded = TrigramIndex(self.tmp.name, index_directory)
+        self.assertEqual(reloaded.refresh(), 0)
+        self.assertEqual(reloaded.candidates(_required_trigrams("evaluate", False)), ["pkg/calculator.py"])
+
+    def test_required_trigrams_skip_optional_parts(self):
+        self.assertEqual(_required_trigrams("abcd?", True), {"abc"})
+        self.assertEqual(_required_trigrams("(abc)?def", True), {"def"})
+        self.assertEqual(_required_trigrams(r"foo\d+bar", True), {"foo", "bar"})
+        self.assertEqual(_required_trigrams("a(bc|de)f", True), set())
+
+    def test_regex_syntax_is_not_required_text(self):
+        self.write("values.txt", "value = 42\nbazbar\n")
+        self.assertEqual(search_files(self.tmp.name, r"value = (?P<n>\d+)", is_regex=True, context_lines=0), "values.txt:1:value = 42")
+        self.assertEqual(search_files(self.tmp.name, r"(?<!foo)bar", is_regex=True, context_lines=0), "values.txt:2:bazbar")
+
+    def test_indexes_of_deleted_directories_are_pruned(self):
+        index_directory = os.path.join(self.tmp.name, ".index")
+        with tempfile.TemporaryDirectory() as gone:
+            TrigramIndex(gone, index_directory).save()
+        TrigramIndex(self.tmp.name, index_directory).save()
+        self.assertEqual(prune_search_indexes(index_directory), 1)
+        self.assertEqual(len(os.listdir(index_directory)), 1)
+
+class TestApplyPatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "calc.py")
+        with open(self.path, "w") as f:
+            f.write("import sys\n\n\ndef add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n")
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, path=None):
+        with open(path or self.path) as f:
+            return f.read()
+
+    def test_unified_diff_with_shifted_line_numbers(self):
+        patch = (
+            "--- a/calc.py\n"
+            "+++ b/calc.py\n"
+            "@@ -5,4 +5,4 @@\n"
+            "\n"
+            " def sub(a, b):\n"
+            "-    return a - b\n"
+            "+    return a - b  # subtract\n"
+        )
+        result = apply_patch(self.tmp.name, "calc.py", patch=patch)
+        self.assertTrue(result.startswith('Successfully patched "calc.py" (1 hunks applied'), result)
+        self.assertTrue(self.read().endswith("def sub(a, b):\n    return a - b  # subtract\n"))
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+    def test_search_replace_edits(self):
+        result = apply_patch(self.tmp.name, "calc.py", edits=[
+            {"search": "return a + b", "replace": "return b + a"},
+            {"search": "import sys\n", "replace": ""},
+        ])
+        self.assertIn("2 edits applied", result)
+        self.assertTrue(self.read().startswith("\n\ndef add(a, b):\n    return b + a\n"))
+
+    def test_failed_edit_leaves_file_unchanged(self):
+        before = self.read()
+        result = apply_patch(self.tmp.name, "calc.py", edits=[
+            {"search": "return a + b", "replace": "return 0"},
+            {"search": "(a, b)", "replace": "(x, y)"},
+        ])
+        self.assertEqual(
+            result,
+            'Error: Could not patch "calc.py": edit 2: search text found 2 times; '
+            'include more context to make it unique. The file was not changed.',
+        )
+        self.assertEqual(self.read(), before)
+        self.assertEqual(os.listdir(self.tmp.name), ["calc.py"])
+
+    def test_diff_creates_new_file(self):
+        patch = "--- /dev/null\n+++ b/pkg/new.py\n@@ -0,0 +1,2 @@\n+x = 1\n+y = 2\n"
+        result = apply_patch(self.tmp.name, "pkg/new.py", patch=patch)
+        self.assertIn("Successfully patched", result)
+        self.assertEqual(self.read(os.path.join(self.tmp.name, "pkg", "new.py")), "x = 1\ny = 2\n")
+
+    def test_line_endings_are_kept(self):
+        with open(self.path, "w", newline="") as f:
+            f.write("a = 1\r\npage\x0cbreak = 2\r\nb = 3")
+        result = apply_patch(self.tmp.name, "calc.py", patch="@@ -2,2 +2,2 @@\n page\x0cbreak = 2\n-b = 3\n+b = 4\n")
+        self.assertIn("Successfully patched", result)
+        result = apply_patch(self.tmp.name, "calc.py", edits=[{"search": "a = 1\npage", "replace": "a = 0\npage"}])
+        self.assertIn("Successfully patched", result)
+        with open(self.path, newline="") as f:
+            self.assertEqual(f.read(), "a = 0\r\npage\x0cbreak = 2\r\nb = 4")
+
+    def test_no_newline_markers_decide_the_last_line_ending(self):
+        with open(self.path, "w") as f:
+            f.write("a\nb")
+        patch = "@@ -1,2 +1,2 @@\n a\n-b\n\\ No newline at end of file\n+B\n"
+        self.assertIn("Successfully patched", apply_patch(self.tmp.name, "calc.py", patch=patch))
+        self.assertEqual(self.read(), "a\nB\n")
+        patch = "@@ -1,2 +1,2 @@\n a\n-B\n+b\n\\ No newline at end of file\n"
+        self.assertIn("Successfully patched", apply_patch(self.tmp.name, "calc.py", patch=patch))
+        self.assertEqual(self.read(), "a\nb")
+
+    def test_zero_length_hunk_inserts_after_its_line(self):
+        result = apply_patch(self.tmp.name, "calc.py", patch="@@ -5,0 +6,2 @@\n+    # add\n+    # more\n")
+        self.assertIn("Successfully patched", result)
+        self.assertTrue(self.read().startswith("import sys\n\n\ndef add(a, b):\n    return a + b\n    # add\n    # more\n\n"))
+
+    def test_patch_outside_boundary(self):
+        result = apply_patch(self.tmp.name, "../x.py", edits=[{"search": "a", "replace": "b"}])
+        self.assertEqual(result, 'Error: Cannot patch "../x.py" as it is outside the permitted working directory')
+
+class TestRegistry(unittest.TestCase):
+    def test_every_tool_is_registered_and_declared_once(self):
+        config = get_tool_config()
+        self.assertIs(config, get_tool_config())
+        self.assertEqual([declaration.name for declaration in config.function_declarations], list(TOOL_MODULES))
+        self.assertEqual(
+            config.function_declarations[2].parameters.properties["args"].items.type,
+            types.Type.STRING,
+        )
+        self.assertIs(get_tool("write_file").function, write_file)
+        self.assertTrue(get_tool("apply_patch").serialized)
+        self.assertIsNone(get_tool("delete_everything"))
+
+    def test_cli_startup_does_not_import_sdk_or_tools(self):
+        code = (
+            "import sys, main\n"
+            "print(sorted(name for name in sys.modules if name.startswith(('google', 'functions', 'engine'))))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_declaring_tools_does_not_import_them(self):
+        code = (
+            "import sys, engine\n"
+            "from functions.registry import get_tool_config, TOOL_MODULES\n"
+            "get_tool_config()\n"
+            "print(sorted((set(TOOL_MODULES.values()) | {'functions.prefetch', 'functions.python_worker_pool'}) & set(sys.modules)))"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), "[]", result.stderr)
+
+class TestTracing(unittest.TestCase):
+    def test_session_records_model_and_tool_spans(self):
+        backend = ScriptedBackend([
+            {"function_calls": [{"name": "get_file_content", "args": {"file_path": "notes.txt"}}]},
+            {"function_calls": [{"name": "get_file_content", "args": {"file_path": "notes.txt"}}]},
+            {"text": "done"},
+        ])
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "notes.txt"), "w") as f:
+                f.write("hello")
+            trace_path = os.path.join(tmp, "trace.jsonl")
+            tracer = Tracer(trace_path)
+            result = asyncio.run(run_session(backend, "read", out=None, working_directory=tmp, tracer=tracer))
+            tracer.close()
+            with open(trace_path) as f:
+                spans = [json.loads(line) for line in f]
+
+        self.assertEqual(result, "done")
+        by_name = {}
+        for span in spans:
+            by_name.setdefault(span["name"], []).append(span)
+        self.assertEqual(len(by_name["model_call"]), 3)
+        self.assertEqual(len(by_name["iteration"]), 3)
+        session = by_name["session"][0]
+        self.assertEqual(session["attributes"]["outcome"], "completed")
+        self.assertEqual({span["trace_id"] for span in spans}, {session["trace_id"]})
+        self.assertIsNone(session["parent_span_id"])
+
+        tool_spans = by_name["tool:get_file_content"]
+        self.assertEqual([span["attributes"]["cache_hit"] for span in tool_spans], [False, True])
+        self.assertEqual(tool_spans[0]["attributes"]["output_bytes"], 5)
+        iteration_ids = {span["span_id"] for span in by_name["iteration"]}
+        self.assertTrue(all(span["parent_span_id"] in iteration_ids for span in tool_spans))
+        model_call = by_name["model_call"][0]["attributes"]
+        self.assertGreater(model_call["prompt_tokens"], 0)
+        self.assertIsNotNone(model_call["time_to_first_token_ms"])
+
+        summary = tracer.summary()
+        self.assertIn("tool:get_file_content", summary)
+        self.assertIn("cache hits 1/2 lookups", summary)
+
+class TestBenchmark(unittest.TestCase):
+    def test_make_tree_spreads_files_over_directories(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmark.make_tree(tmp, 250)
+            counts = [len(files) for _, _, files in os.walk(tmp) if files]
+            self.assertEqual(sum(counts), 250)
+            self.assertLessEqual(max(counts), benchmark.FILES_PER_DIRECTORY)
+            self.assertIn("NEEDLE_MARKER", search_files(tmp, "NEEDLE_MARKER"))
+
+    def test_run_benchmarks_measures_selected_cases(self):
+        results = benchmark.run_benchmarks(only="apply_patch", repeat=3, time_budget=1, report=None)
+        self.assertEqual(list(results), ["apply_patch/edits"])
+        self.assertEqual(results["apply_patch/edits"]["runs"], 3)
+        self.assertLessEqual(results["apply_patch/edits"]["p50_ms"], results["apply_patch/edits"]["p95_ms"])
+
+    def test_cold_search_starts_from_an_empty_index_under_the_temp_root(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = benchmark.make_tree(os.path.join(tmp, "tree"), 10)
+            cases = {case.name: case for case in benchmark.tree_cases(root, 10)}
+            cases["search_files/10_files/warm"].fn()
+            index_directory = os.path.join(tmp, "tree.search_index")
+            self.assertEqual(len(os.listdir(index_directory)), 1)
+            cases["search_files/10_files/cold"].setup()
+            self.assertFalse(os.path.exists(index_directory))
+            self.assertEqual(benchmark._indexes[root].files, {})
+
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"a": {"p50_ms": 10.0}, "b": {"p50_ms": 10.0}}}
+        results = {"a": {"p50_ms": 11.0}, "b": {"p50_ms": 20.0}, "c": {"p50_ms": 1.0}}
+        ratios, regressions = benchmark.compare(results, baseline, threshold=1.25)
+        self.assertEqual(ratios, {"a": 1.1, "b": 2.0})
+        self.assertEqual(regressions, ["b"])
+
+def _api_error(code, retry_delay=None):
+    details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry_delay}] if retry_delay else []
+    error_class = errors.ClientError if code < 500 else errors.ServerError
+    return error_class(code, {"error": {"code": code, "message": "try later", "status": "UNAVAILABLE", "details": details}})
+
+class FlakyBackend(ScriptedBackend):
+    """
+    Scripted backend that raises the errors listed for a turn (by index)
+    before playing it.
+    """
+    def __init__(self, script, failures, **kwargs):
+        super().__init__(script, **kwargs)
+        self.failures = failures
+        self.requests = []
+
+    async def stream(self, contents, config=None):
+        self.requests.append(list(contents))
+        pending = self.failures.get(sum(1 for content in contents if content.role == "model"))
+        if pending:
+            raise pending.pop(0)
+        return await super().stream(contents, config)
+
+class BrokenStreamBackend(ScriptedBackend):
+    """
+    Scripted backend whose stream breaks after `after` chunks, with the next
+    of the listed errors, until they run out.
+    """
+    def __init__(self, script, failures, after, **kwargs):
+        super().__init__(script, **kwargs)
+        self.failures = failures
+        self.after = after
+
+    async def stream(self, contents, config=None):
+        stream = await super().stream(contents, config)
+        if not self.failures:
+            return stream
+        error = self.failures.pop(0)
+
+        async def broken():
+            index = 0
+            async for chunk in stream:
+                if index == self.after:
+                    break
+                yield chunk
+                index += 1
+            raise error
+
+        return broken()
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+    def test_token_bucket_spaces_out_reservations(self):
+        now = [0.0]
+        bucket = TokenBucket(60, clock=lambda: now[0])
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(2), 2.0)
+        self.assertAlmostEqual(bucket.reserve(1), 3.0)
+        now[0] = 10.0
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertAlmostEqual(bucket.reserve(500), 54.0)
+
+    def test_retryable_errors_and_hints(self):
+        self.assertTrue(is_retryable(_api_error(429)))
+        self.assertTrue(is_retryable(_api_error(503)))
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertFalse(is_retryable(_api_error(400)))
+        self.assertFalse(is_retryable(ValueError("bug")))
+        self.assertEqual(retry_after(_api_error(429, "7s")), 7.0)
+        self.assertIsNone(retry_after(_api_error(503)))
+
+    def test_call_retries_with_backoff_then_gives_up(self):
+        scheduler = RequestScheduler(max_retries=2, base_delay=1.0, sleep=self.sleep)
+        failures = [_api_error(429, "7s"), _api_error(503)]
+
+        async def make_call():
+            if failures:
+                raise failures.pop(0)
+            return "ok"
+
+        self.assertEqual(asyncio.run(scheduler.call(make_call)), "ok")
+        self.assertEqual(scheduler.retries, 2)
+        self.assertTrue(7.0 <= self.sleeps[0] <= 8.0)
+        self.assertTrue(0.0 <= self.sleeps[1] <= 2.0)
+
+        failures.extend([_api_error(503)] * 3)
+        with self.assertRaises(errors.ServerError):
+            asyncio.run(scheduler.call(make_call))
+        failures[:] = [_api_error(400)]
+        with self.assertRaises(errors.ClientError):
+            asyncio.run(scheduler.call(make_call))
+        self.assertEqual(scheduler.retries, 4)
+
+    def test_shared_request_limit_throttles_sessions(self):
+        scheduler = RequestScheduler(requests_per_minute=2, sleep=self.sleep)
+        backend = ScriptedBackend([{"text": "done"}])
+        results = asyncio.run(run_sessions(backend, ["a", "b", "c"], scheduler=scheduler))
+        self.assertEqual(results, ["done", "done", "done"])
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertAlmostEqual(self.sleeps[0], 30.0, places=1)
+
+    def test_session_resumes_after_transient_failures(self):
+        backend = FlakyBackend([
+            {"function_calls": [{"name": "get_files_info", "args": {"directory": "pkg"}}]},
+            {"text": "done"},
+        ], failures={1: [_api_error(503), _api_error(429, "2s")]})
+        scheduler = RequestScheduler(sleep=self.sleep)
+        out = io.StringIO()
+        result = asyncio.run(run_session(backend, "list", out=out, scheduler=scheduler))
+        self.assertEqual(result, "done")
+        self.assertEqual(out.getvalue().count("retrying in"), 2)
+        self.assertEqual(backend.calls, 2)
+        self.assertEqual(len(backend.requests), 4)
+        self.assertEqual(backend.requests[3][-1].role, "tool")
+        self.assertEqual(len(backend.requests[3]), len(backend.requests[1]))
+
+    def test_retried_stream_does_not_repeat_shown_text(self):
+        backend = BrokenStreamBackend([{"text": "Hello there, world."}], [_api_error(503)], after=2, chunk_size=4)
+        out = io.StringIO()
+        result = asyncio.run(run_session(backend, "hi", out=out, scheduler=RequestScheduler(sleep=self.sleep)))
+        self.assertEqual(result, "Hello there, world.")
+        self.assertTrue(out.getvalue().startswith("Hello th\n[Model call failed"), out.getvalue())
+        self.assertTrue(out.getvalue().endswith("]\nere, world.\n"), out.getvalue())
+
+    def test_broken_stream_waits_for_dispatched_tools(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "slow.py"), "w") as f:
+                f.write("import time\ntime.sleep(0.3)\nopen('done.txt', 'w').close()\n")
+            backend = BrokenStreamBackend(
+                [{"function_calls": [{"name": "run_python_file", "args": {"file_path": "slow.py"}}]}],
+                [ValueError("stream broke")],
+                after=1,
+            )
+            out = io.StringIO()
+
+            async def session():
+                result = await run_session(backend, "run it", out=out, working_directory=tmp)
+                # Checked before asyncio.run's shutdown would wait for the thread
+                return result, os.path.exists(os.path.join(tmp, "done.txt"))
+
+            self.assertEqual(asyncio.run(session()), (None, True))
+            self.assertIn("Model stream failed after tool calls were dispatched: stream broke", out.getvalue())
+
+class TestCheckpoint(unittest.TestCase):
+    script = [
+        {"text": "Looking. ", "function_calls": [{"name": "get_file_content", "args": {"file_path": "lorem.txt"}}]},
+        {"function_calls": [{"name": "get_file_content", "args": {"file_path": "lorem.txt"}}]},
+        {"text": "It is not lorem ipsum."},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_resumed_session_continues_with_the_same_messages(self):
+        uninterrupted = RecordingBackend(self.script)
+        self.assertEqual(asyncio.run(run_session(uninterrupted, "read lorem", out=None)), "It is not lorem ipsum.")
+
+        log = SessionLog.create(self.tmp.name, "read lorem", "calculator", session_id="s1")
+        first_run = RecordingBackend(self.script)
+        self.assertIsNone(asyncio.run(run_session(
+            first_run, "read lorem", out=None, session_log=log, max_iterations=2,
+        )))
+        self.assertEqual(log.outcome, "max_iterations")
+
+        resumed = SessionLog.open(self.tmp.name, "s1")
+        self.assertEqual(len(resumed.turns), 2)
+        self.assertEqual(resumed.prompt, "read lorem")
+        second_run = RecordingBackend(self.script)
+        result = asyncio.run(run_session(second_run, resumed.prompt, out=None, session_log=resumed))
+        self.assertEqual(result, "It is not lorem ipsum.")
+        self.assertEqual(second_run.calls, 1)
+        self.assertEqual(
+            [content.model_dump() for content in second_run.requests[0]],
+            [content.model_dump() for content in uninterrupted.requests[-1]],
+        )
+
+        finished = SessionLog.open(self.tmp.name, "s1")
+        self.assertTrue(finished.completed)
+        self.assertEqual(asyncio.run(run_session(second_run, finished.prompt, out=None, session_log=finished)), result)
+        self.assertEqual(second_run.calls, 1)
+
+    def test_identical_tool_results_are_stored_once(self):
+        log = SessionLog.create(self.tmp.name, "read lorem", "calculator", session_id="s2")
+        asyncio.run(run_session(ScriptedBackend(self.script), "read lorem", out=None, session_log=log))
+        self.assertEqual(len(os.listdir(log.results_path)), 1)
+
+    def test_torn_last_line_is_cut_off(self):
+        log = SessionLog.create(self.tmp.name, "read lorem", "calculator", session_id="s3")
+        asyncio.run(run_session(ScriptedBackend(self.script), "read lorem", out=None, session_log=log, max_iterations=1))
+        with open(log.log_path, "a") as f:
+            f.write('{"type": "turn", "compac')
+        resumed = SessionLog.open(self.tmp.name, "s3")
+        self.assertEqual(len(resumed.turns), 1)
+        self.assertEqual(len(resumed.restore().messages), 3)
+        asyncio.run(run_session(ScriptedBackend(self.script), "read lorem", out=None, session_log=resumed))
+        self.assertTrue(SessionLog.open(self.tmp.name, "s3").completed)
+
+class ConfigRecordingBackend(ScriptedBackend):
+    """
+    Scripted backend that keeps the contents and config of every call.
+    """
+    def __init__(self, script, **kwargs):
+        super().__init__(script, **kwargs)
+        self.requests = []
+
+    async def stream(self, contents, config=None):
+        self.requests.append((list(contents), config))
+        return await super().stream(contents, config)
+
+class TestPromptCache(unittest.TestCase):
+    script = [
+        {"function_calls": [{"name": "get_files_info", "args": {}}]},
+        {"text": "done"},
+    ]
+
+    def test_prefix_is_cached_once_and_shared(self):
+        backend = ConfigRecordingBackend(self.script)
+        caching = PromptCachingBackend(backend, min_tokens=0)
+        tracer = Tracer()
+        results = asyncio.run(run_sessions(caching, ["a", "b"], tracer=tracer))
+        self.assertEqual(results, ["done", "done"])
+        self.assertEqual((caching.created, caching.hits, caching.fallbacks), (1, 4, 0))
+        self.assertEqual(len(backend.caches), 1)
+        for _, config in backend.requests:
+            self.assertEqual(config.cached_content, "cachedContents/scripted-1")
+            self.assertIsNone(config.system_instruction)
+            self.assertIsNone(config.tools)
+        cached_tokens = [span.attributes["cached_tokens"] for span in tracer.spans if span.name == "model_call"]
+        self.assertTrue(all(tokens > 0 for tokens in cached_tokens))
+
+        asyncio.run(caching.close())
+        self.assertEqual(backend.caches, {})
+
+    def test_cache_is_refreshed_before_expiry_and_recreated_when_gone(self):
+        now = [0.0]
+        backend = ConfigRecordingBackend(self.script)
+        caching = PromptCachingBackend(backend, ttl_seconds=100, refresh_seconds=10, min_tokens=0, clock=lambda: now[0])
+        asyncio.run(run_session(caching, "a", out=None))
+        now[0] = 95.0
+        asyncio.run(run_session(caching, "b", out=None))
+        self.assertEqual((caching.created, caching.refreshed), (1, 1))
+
+        backend.caches.clear()
+        self.assertEqual(asyncio.run(run_session(caching, "c", out=None)), "done")
+        contents, config = backend.requests[-2]
+        self.assertIsNone(config.cached_content)
+        self.assertIsNotNone(config.system_instruction)
+        self.assertEqual(caching.fallbacks, 1)
+        self.assertEqual(caching.created, 2)
+        self.assertIsNotNone(backend.requests[-1][1].cached_content)
+
+    def test_falls_back_when_prefix_is_too_small_or_caching_unsupported(self):
+        backend = ConfigRecordingBackend(self.script)
+        caching = PromptCachingBackend(backend, min_tokens=10 ** 6)
+        self.assertEqual(asyncio.run(run_session(caching, "a", out=None)), "done")
+        self.assertEqual((caching.created, caching.fallbacks), (0, 2))
+        self.assertIsNotNone(backend.requests[0][1].tools)
+
+        class NoCaching:
+            model = "plain"
+
+            def __init__(self, inner):
+                self.inner = inner
+
+            async def stream(self, contents, config=None):
+                return await self.inner.stream(contents, config)
+
+        caching = PromptCachingBackend(NoCaching(ScriptedBackend(self.script)), min_tokens=0)
+        self.assertEqual(asyncio.run(run_session(caching, "a", out=None)), "done")
+        self.assertEqual((caching.created, caching.fallbacks), (0, 2))
+
+    def test_pinned_snapshot_goes_in_the_cache_or_before_the_messages(self):
+        snapshot = snapshot_working_directory("calculator")
+        text = snapshot.parts[0].text
+        self.assertIn("- pkg/calculator.py (", text)
+        self.assertIn('--- "lorem.txt" ---', text)
+
+        backend = ConfigRecordingBackend(self.script)
+        caching = PromptCachingBackend(backend, snapshot=snapshot, min_tokens=0)
+        asyncio.run(run_session(caching, "a", out=None))
+        self.assertEqual(backend.caches["cachedContents/scripted-1"]["contents"], [snapshot])
+        self.assertEqual(backend.requests[0][0][0].parts[0].text, "a")
+
+        backend = ConfigRecordingBackend(self.script)
+        caching = PromptCachingBackend(backend, snapshot=snapshot, min_tokens=10 ** 6)
+        asyncio.run(run_session(caching, "a", out=None))
+        self.assertEqual(backend.requests[0][0][0], snapshot)
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, "pkg"))
+        files = {
+            "main.py": "import sys\nfrom pkg.calculator import Calculator\n",
+            "pkg/__init__.py": "",
+            "pkg/calculator.py": "from .render import render\nfrom . import util\n",
+            "pkg/render.py": "def render(): pass\n",
+            "pkg/util.py": "X = 1\n",
+            "pkg/data.bin": "binary",
+            "pkg/big.py": "x = 1\n" * 2000,
+        }
+        for path, content in files.items():
+            with open(os.path.join(self.root, path), "w") as f:
+                f.write(content)
+        self.cache = ToolCache()
+        self.prefetcher = Prefetcher(cache=self.cache, max_file_bytes=1024)
+        self.prefetcher.enabled = True
+        self.addCleanup(self.prefetcher.close)
+
+    def read(self, file_path):
+        return self.cache.get_or_call(
+            "get_file_content",
+            {"working_directory": self.root, "file_path": file_path},
+            get_file_content,
+            "file_path",
+        )
+
+    def test_imported_files_resolves_absolute_and_relative_imports(self):
+        root = os.path.abspath(self.root)
+        found = imported_files(root, os.path.join(root, "pkg", "calculator.py"), "from .render import render\nfrom . import util\n")
+        self.assertEqual(found, [os.path.join(root, "pkg", "render.py"), os.path.join(root, "pkg", "util.py")])
+        found = imported_files(root, os.path.join(root, "main.py"), "import sys\nfrom pkg.calculator import Calculator\n")
+        self.assertEqual(found, [os.path.join(root, "pkg", "calculator.py")])
+
+    def test_listing_prefetches_small_source_files(self):
+        self.prefetcher.after_call("get_files_info", {"working_directory": self.root, "directory": "pkg"}, "listing")
+        self.prefetcher.wait(5)
+        self.assertEqual(self.cache.prefetched, 4)
+        self.assertEqual(self.read("pkg/render.py"), "def render(): pass\n")
+        self.assertEqual(self.read("./pkg/util.py"), "X = 1\n")
+        self.read("pkg/big.py")
+        stats = self.prefetcher.stats()
+        self.assertEqual((stats["prefetched"], stats["hits"], stats["hit_rate"]), (4, 2, 0.5))
+
+    def test_reading_a_module_prefetches_its_imports(self):
+        self.prefetcher.after_call("get_file_content", {"working_directory": self.root, "file_path": "pkg/calculator.py"}, "source")
+        self.prefetcher.wait(5)
+        self.read("pkg/render.py")
+        self.assertEqual(self.cache.prefetch_hits, 1)
+
+    def test_byte_cap_cancel_and_invalidation(self):
+        self.prefetcher.max_bytes = 1
+        self.prefetcher.after_call("get_files_info", {"working_directory": self.root, "directory": "pkg"}, "listing")
+        self.prefetcher.wait(5)
+        # The empty __init__.py adds nothing, so the cap is hit after calculator.py
+        self.assertEqual(self.cache.prefetched, 2)
+        self.assertEqual(self.prefetcher.cancelled, 2)
+
+        generation = self.prefetcher.generation
+        self.prefetcher.cancel()
+        self.prefetcher.max_bytes = 10 ** 6
+        self.prefetcher._warm(generation, self.root, ["pkg/render.py"])
+        self.assertEqual(self.cache.prefetched, 2)
+
+        self.assertGreater(self.cache.prefetched_bytes, 0)
+        self.cache.invalidate(self.root)
+        self.assertEqual(self.cache.prefetched_bytes, 0)
+
+    def test_disabled_prefetcher_does_nothing(self):
+        self.prefetcher.enabled = False
+        self.prefetcher.after_call("get_files_info", {"working_directory": self.root, "directory": "pkg"}, "listing")
+        self.assertEqual(self.prefetcher.scheduled, 0)
+
 if __name__ == "__main__":
     unittest.main()
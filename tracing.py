@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Span:
+    """
+    One timed operation. Use as a context manager, or call end() yourself.
+    Attributes can be added at any point before the span ends.
+    """
+    def __init__(self, tracer, name, trace_id, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self._started = time.perf_counter_ns()
+
+    @property
+    def duration_ms(self):
+        end = self.end_time if self.end_time is not None else self.start_time + (time.perf_counter_ns() - self._started)
+        return (end - self.start_time) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def child(self, name, **attributes):
+        return Span(self.tracer, name, self.trace_id, self.span_id, attributes)
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = self.start_time + (time.perf_counter_ns() - self._started)
+            self.tracer.record(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.set(error=f"{exc_type.__name__}: {exc}")
+        self.end()
+        return False
+
+    def to_dict(self):
+        """
+        The span in the field layout of an OpenTelemetry span, so the file
+        can be loaded by tools that read OTLP/JSON spans.
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_time,
+            "end_time_unix_nano": self.end_time,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Collects the spans of one or more agent sessions and, if a path is
+    given, appends each finished span to it as a JSON line.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.spans = []
+        self.lock = threading.Lock()
+        self._file = open(path, "a") if path else None
+
+    def start_session(self, name="session", **attributes):
+        return Span(self, name, _new_id(16), None, attributes)
+
+    def record(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        """
+        Returns a plain-text table of span timings plus token, cache and
+        time-to-first-token totals for everything recorded so far.
+        """
+        with self.lock:
+            spans = list(self.spans)
+
+        durations = {}
+        for span in spans:
+            durations.setdefault(span.name, []).append(span.duration_ms)
+
+        lines = [f"{'Span':<24}{'Count':>7}{'Total s':>10}{'Mean ms':>10}{'P50 ms':>10}{'P95 ms':>10}{'Max ms':>10}"]
+        for name in sorted(durations, key=lambda name: -sum(durations[name])):
+            values = durations[name]
+            lines.append(
+                f"{name:<24}{len(values):>7}{sum(values) / 1000:>10.2f}{sum(values) / len(values):>10.1f}"
+                f"{_percentile(values, 0.5):>10.1f}{_percentile(values, 0.95):>10.1f}{max(values):>10.1f}"
+            )
+
+        model_calls = [span for span in spans if span.name == "model_call"]
+        prompt_tokens = sum(span.attributes.get("prompt_tokens") or 0 for span in model_calls)
+        cached_tokens = sum(span.attributes.get("cached_tokens") or 0 for span in model_calls)
+        response_tokens = sum(span.attributes.get("response_tokens") or 0 for span in model_calls)
+        first_token = [
+            span.attributes["time_to_first_token_ms"]
+            for span in model_calls if span.attributes.get("time_to_first_token_ms") is not None
+        ]
+        lookups = [span.attributes["cache_hit"] for span in spans if span.attributes.get("cache_hit") is not None]
+        output_bytes = sum(span.attributes.get("output_bytes") or 0 for span in spans if span.name.startswith("tool:"))
+
+        lines.append("")
+        lines.append(f"Tokens: {prompt_tokens} prompt ({cached_tokens} cached), {response_tokens} response")
+        if first_token:
+            lines.append(
+                f"Time to first token: p50 {_percentile(first_token, 0.5):.1f} ms, "
+                f"p95 {_percentile(first_token, 0.95):.1f} ms"
+            )
+        lines.append(f"Tool output: {output_bytes} bytes; cache hits {sum(lookups)}/{len(lookups)} lookups")
+        return "\n".join(lines)